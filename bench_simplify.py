@@ -0,0 +1,109 @@
+"""多边形简化策略基准：对比各策略的标签体积、转换耗时、解析耗时和回填 IoU
+
+用法：
+    python bench_simplify.py --npy-dir dataset/cellpose_npy1219 --limit 50 --json bench_simplify.json
+
+IoU 的计算方式：把每个实例的多边形用 cv2.fillPoly 填回实例图，与原始 masks 逐实例比较；
+被面积/点数过滤掉的实例 IoU 记为 0，计入平均值。
+"""
+import os
+import time
+import json
+import argparse
+import numpy as np
+
+from seg_io import load_masks
+from seg_instances import rasterize_polygons, instance_iou
+from label_io import format_yolo_seg
+from label_parse import parse_yolo_labels
+import cellpose標簽轉換 as converter
+
+# (名称, 对默认转换参数的覆盖)
+STRATEGIES = [
+    ("fixed eps=0.5", {"simplify": "fixed", "epsilon": 0.5}),
+    ("fixed eps=1.5", {"simplify": "fixed", "epsilon": 1.5}),
+    ("fixed eps=3.0", {"simplify": "fixed", "epsilon": 3.0}),
+    ("relative 0.5%", {"simplify": "relative", "rel_epsilon": 0.005}),
+    ("relative 1%", {"simplify": "relative", "rel_epsilon": 0.01}),
+    ("fixed 1.5 max 32", {"simplify": "fixed", "epsilon": 1.5, "max_vertices": 32}),
+    ("fixed 1.5 max 16", {"simplify": "fixed", "epsilon": 1.5, "max_vertices": 16}),
+]
+
+
+def bench_strategy(masks_list, params):
+    """对一组 masks 跑一种策略，返回汇总指标"""
+    convert_time = 0.0
+    parse_time = 0.0
+    total_bytes = 0
+    total_vertices = 0
+    total_polygons = 0
+    ious = []
+
+    for masks in masks_list:
+        h, w = masks.shape
+
+        t0 = time.perf_counter()
+        items = list(converter.instance_polygons(masks, params))
+        text = format_yolo_seg([poly for _, poly in items], w, h)
+        convert_time += time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        parse_yolo_labels(text)
+        parse_time += time.perf_counter() - t0
+
+        total_bytes += len(text.encode("utf-8"))
+        total_polygons += len(items)
+        total_vertices += sum(len(poly) for _, poly in items)
+
+        pred = rasterize_polygons([poly for _, poly in items], [inst_id for inst_id, _ in items], masks.shape)
+        _, iou = instance_iou(masks, pred)
+        ious.append(iou)
+
+    n = len(masks_list)
+    ious = np.concatenate(ious) if ious else np.zeros(0)
+    return {
+        "bytes_per_label": total_bytes / n,
+        "convert_ms_per_image": convert_time / n * 1000,
+        "parse_ms_per_label": parse_time / n * 1000,
+        "vertices_per_polygon": total_vertices / max(total_polygons, 1),
+        "mean_iou": float(ious.mean()) if ious.size else 0.0,
+        "p05_iou": float(np.percentile(ious, 5)) if ious.size else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="多边形简化策略基准")
+    parser.add_argument("--npy-dir", default=converter.NPY_DIR)
+    parser.add_argument("--limit", type=int, default=20, help="最多读取多少个 _seg.npy")
+    parser.add_argument("--json", default=None, help="结果另存为 JSON")
+    args = parser.parse_args()
+
+    names = sorted(f for f in os.listdir(args.npy_dir) if f.endswith(".npy"))[:args.limit]
+    masks_list = []
+    for name in names:
+        try:
+            masks_list.append(np.asarray(load_masks(os.path.join(args.npy_dir, name))))
+        except Exception as e:
+            print(f"❌ 加载失败：{name} | {e}")
+    if not masks_list:
+        print("没有可用的 _seg.npy")
+        return
+
+    print(f"{len(masks_list)} 张图片")
+    print(f"{'策略':<18}{'字节/标签':>12}{'转换ms/张':>12}{'解析ms/张':>12}{'点/多边形':>11}{'平均IoU':>9}{'P5 IoU':>9}")
+    results = {}
+    for name, overrides in STRATEGIES:
+        r = bench_strategy(masks_list, converter.convert_params(**overrides))
+        results[name] = dict(r, params=overrides)
+        print(f"{name:<18}{r['bytes_per_label']:>12.0f}{r['convert_ms_per_image']:>12.2f}"
+              f"{r['parse_ms_per_label']:>12.2f}{r['vertices_per_polygon']:>11.1f}"
+              f"{r['mean_iou']:>9.4f}{r['p05_iou']:>9.4f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"images": len(masks_list), "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
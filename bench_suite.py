@@ -0,0 +1,338 @@
+"""离线基准：合成 Cellpose 风格的 _seg.npy、对应的大图和 YOLO 标签，计时转换/解析/检验/裁剪，结果存 JSON 便于跨提交对比
+
+合成数据（同一 seed 每次完全相同，不需要真实数据集，也不需要界面）：
+    masks    size × size 的实例图，cells 个随机椭圆（后画的覆盖先画的，类似贴在一起的细胞），
+             编号重排为连续的 1..N，按 Cellpose 的字典格式写成 _seg.npy（带 outlines 等字段）
+    图片     暗背景 + 亮细胞 + 噪声的 RGB 图；像素数超过 LARGE_PIXELS 时写成 .npy（走 large_image 的内存映射后端）
+    标签     转换脚本对 masks 的输出；另有直接随机生成的 YOLO seg 标签集（poly / bbox 两种格式）
+
+计时项目：
+    converter  cellpose標簽轉換.convert_file（load/contour/simplify/write 分阶段）
+    parser     label_parse.parse_yolo_labels
+    validator  seg标签检验1222.check_label_text
+    crop       crop_engine.crop_one_image，每张图 CROPS_PER_IMAGE 个 640 × 640 随机裁剪
+    tiling     crop_tiling.propose_tiles（灰度 + 实例密度过滤）
+
+用法：
+    python bench_suite.py --json bench_results.json                 默认的小规模矩阵
+    python bench_suite.py --preset full --json full.json           512²–8k²、10–10k 个实例、uint16/uint32
+    python bench_suite.py --sizes 2048 --cells 1000 --only converter parser
+    python bench_suite.py --json new.json --compare old.json       与上一次的结果逐项对比 p50
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+import numpy as np
+import cv2
+
+import cellpose標簽轉換 as converter
+import seg标签检验1222 as checker
+from crop_engine import CROP_W, crop_one_image
+from crop_tiling import propose_tiles
+from label_io import format_yolo_seg
+from label_parse import parse_yolo_labels
+from large_image import LARGE_PIXELS, open_image
+from run_stats import RunStats, ItemStats
+
+PRESETS = {
+    "quick": {"sizes": [512, 2048], "cells": [10, 1000], "dtypes": ["uint16"], "label_lines": [100, 3000]},
+    "full": {"sizes": [512, 2048, 4096, 8192], "cells": [10, 1000, 10000], "dtypes": ["uint16", "uint32"],
+             "label_lines": [100, 3000, 30000]},
+}
+BENCHES = ("converter", "parser", "validator", "crop", "tiling")
+DTYPES = {"uint16": np.uint16, "uint32": np.uint32}
+FILL_FRACTION = 0.45  # 椭圆总面积占图片面积的比例（重叠后前景约 30%）
+MIN_AXIS = 2  # 椭圆半轴下限（像素）
+LABEL_POINTS = (8, 40)  # 随机标签集中每个多边形的点数范围
+CROPS_PER_IMAGE = 20
+CROP_EXT = ".png"  # 裁剪输出格式（PNG 编码通常占裁剪耗时的大头，换 .bmp 可只看读图和切块）
+REPEAT = 3
+WARMUP = 1
+
+
+# ================= 合成数据 =================
+
+def case_rng(seed, *key):
+    """每个用例独立的随机数发生器：与用例的运行顺序和 --only 的选择无关"""
+    return np.random.default_rng([seed] + [int(k) for k in key])
+
+
+def synth_masks(size, cells, dtype="uint16", seed=0):
+    """size × size 的实例图，cells 个随机椭圆，编号连续（被完全覆盖的实例不占编号）
+
+    随机数不按 dtype 区分：同一 size / cells 下各 dtype 的实例图内容相同，只差存储类型，用例之间可以直接比较。
+    """
+    if cells > np.iinfo(DTYPES[dtype]).max:
+        raise ValueError(f"{dtype} 放不下 {cells} 个实例")
+    rng = case_rng(seed, size, cells)
+    radius = np.sqrt(size * size * FILL_FRACTION / cells / np.pi)
+    cx, cy = rng.uniform(0, size, cells), rng.uniform(0, size, cells)
+    ax = np.maximum(radius * rng.uniform(0.7, 1.3, cells), MIN_AXIS)
+    ay = np.maximum(ax * rng.uniform(0.6, 1.0, cells), MIN_AXIS)
+    angle = rng.uniform(0, 180, cells)
+
+    canvas = np.zeros((size, size), dtype=np.int32)  # cv2 不能在 uint32 上绘制，先画在 int32 上
+    for i in range(cells):
+        cv2.ellipse(canvas, (int(cx[i]), int(cy[i])), (int(ax[i]), int(ay[i])), float(angle[i]),
+                    0, 360, i + 1, -1)
+
+    present = np.bincount(canvas.ravel(), minlength=cells + 1) > 0
+    present[0] = False
+    lut = np.zeros(cells + 1, dtype=DTYPES[dtype])
+    lut[present] = np.arange(1, present.sum() + 1)
+    return lut[canvas]
+
+
+def write_synth_seg(path, masks):
+    """按 Cellpose _seg.npy 的字典格式保存（outlines/flows 等字段一并写入，读取时应被跳过）"""
+    outlines = np.zeros_like(masks)
+    edge = (masks[:, 1:] != masks[:, :-1])
+    outlines[:, 1:][edge] = masks[:, 1:][edge]
+    data = {"masks": masks, "outlines": outlines, "flows": [np.zeros((8, 8, 3), np.uint8)],
+            "ismanual": np.zeros(int(masks.max()), dtype=bool), "filename": os.path.basename(path),
+            "diameter": 30.0}
+    np.save(path, data, allow_pickle=True)
+
+
+def synth_image(masks, seed=0):
+    """暗背景上的亮细胞 + 高斯噪声，RGB uint8"""
+    rng = case_rng(seed, masks.shape[0], 7)
+    gray = np.where(masks > 0, 170, 35).astype(np.int16)
+    gray += rng.integers(-12, 13, size=masks.shape, dtype=np.int16)
+    gray = np.clip(gray, 0, 255).astype(np.uint8)
+    return np.repeat(gray[:, :, None], 3, axis=2)
+
+
+def write_synth_image(folder, name, rgb):
+    """小图写 PNG；超过 LARGE_PIXELS 的写 .npy（large_image 直接内存映射），返回路径"""
+    if rgb.shape[0] * rgb.shape[1] > LARGE_PIXELS:
+        path = os.path.join(folder, name + ".npy")
+        np.save(path, rgb)
+    else:
+        path = os.path.join(folder, name + ".png")
+        cv2.imwrite(path, rgb[:, :, ::-1], [cv2.IMWRITE_PNG_COMPRESSION, 1])
+    return path
+
+
+def synth_label_text(lines, layout="poly", seed=0):
+    """随机 YOLO seg 标签：lines 个星形多边形（归一化坐标），bbox 格式时每行带外接框"""
+    rng = case_rng(seed, lines, layout == "bbox")
+    polygons, boxes = [], []
+    for _ in range(lines):
+        n = int(rng.integers(*LABEL_POINTS))
+        center = rng.uniform(0.05, 0.95, 2)
+        theta = np.sort(rng.uniform(0, 2 * np.pi, n))
+        r = rng.uniform(0.005, 0.03, n)
+        pts = np.clip(center + np.stack([np.cos(theta), np.sin(theta)], axis=1) * r[:, None], 0, 1)
+        polygons.append(pts)
+        lo, hi = pts.min(axis=0), pts.max(axis=0)
+        boxes.append(np.r_[(lo + hi) / 2, hi - lo])
+    if layout == "poly":
+        return format_yolo_seg(polygons, 1, 1)
+
+    rows = []
+    for pts, box in zip(polygons, boxes):
+        rows.append("0 " + " ".join(f"{v:.6f}" for v in np.r_[box, pts.ravel()]))
+    return "\n".join(rows) + "\n"
+
+
+# ================= 计时 =================
+
+def measure(func, repeat=REPEAT, warmup=WARMUP):
+    """运行 warmup + repeat 次 func(ItemStats)，只统计后 repeat 次；返回 {stages, counts}"""
+    stats = RunStats("bench")
+    rec = None
+    for i in range(warmup + repeat):
+        rec = ItemStats(i)
+        with rec.time("total"):
+            func(rec)
+        if i >= warmup:
+            stats.add_item(rec.as_dict())
+    return {"stages": stats.summary()["stages"], "counts": rec.counts}
+
+
+def bench_masks_case(size, cells, dtype, work_dir, only, repeat, warmup, seed, crop_ext=CROP_EXT):
+    """一组 (尺寸, 实例数, 类型) 的合成数据上依次计时，返回结果列表"""
+    case = {"size": size, "cells": cells, "dtype": dtype}
+    folder = os.path.join(work_dir, f"m{size}_{cells}_{dtype}")
+    os.makedirs(folder, exist_ok=True)
+    name = f"synth_{size}_{cells}_{dtype}"
+
+    t0 = time.perf_counter()
+    masks = synth_masks(size, cells, dtype, seed)
+    npy_path = os.path.join(folder, name + "_seg.npy")
+    write_synth_seg(npy_path, masks)
+    label_path = os.path.join(folder, name + ".txt")
+    converter.convert_file(npy_path, label_path)
+    with open(label_path, "r") as f:
+        text = f.read()
+    image_path = None
+    if "crop" in only or "tiling" in only:
+        image_path = write_synth_image(folder, name, synth_image(masks, seed))
+    case["instances"] = int(masks.max())
+    case["setup_s"] = round(time.perf_counter() - t0, 3)
+
+    results = []
+    if "converter" in only:
+        out_path = os.path.join(folder, "out.txt")
+        results.append(dict(case, bench="converter", **measure(
+            lambda rec: converter.convert_file(npy_path, out_path, stats=rec), repeat, warmup)))
+    if "parser" in only:
+        results.append(dict(case, bench="parser", source="converted", **measure(
+            lambda rec: rec.count("polygons", len(parse_yolo_labels(text).cls)), repeat, warmup)))
+    if "validator" in only:
+        results.append(dict(case, bench="validator", source="converted", **measure(
+            lambda rec: rec.count("issues", len(checker.check_label_text(text)[0])), repeat, warmup)))
+    if "crop" in only:
+        rng = case_rng(seed, size, cells, 11)
+        specs = [{"cx": float(x), "cy": float(y), "w": CROP_W, "h": CROP_W, "idx": i + 1, "clamp": True}
+                 for i, (x, y) in enumerate(rng.uniform(0, size, (CROPS_PER_IMAGE, 2)))]
+        crop_dir = os.path.join(folder, "crops")
+
+        def crop(rec):
+            _, saved, error = crop_one_image(image_path, specs, crop_dir, ext=crop_ext)
+            if error:
+                raise RuntimeError(error)
+            rec.count("crops", len(saved))
+        results.append(dict(case, bench="crop", image=os.path.basename(image_path), ext=crop_ext,
+                            **measure(crop, repeat, warmup)))
+    if "tiling" in only:
+        def tiling(rec):
+            with open_image(image_path) as img:
+                kept, boxes, _ = propose_tiles(img, masks)
+            rec.count("tiles", len(boxes))
+            rec.count("kept", len(kept))
+        results.append(dict(case, bench="tiling", **measure(tiling, repeat, warmup)))
+
+    shutil.rmtree(folder, ignore_errors=True)
+    return results
+
+
+def bench_label_set(lines, layout, only, repeat, warmup, seed):
+    text = synth_label_text(lines, layout, seed)
+    case = {"lines": lines, "layout": layout, "bytes": len(text)}
+    results = []
+    if "parser" in only:
+        results.append(dict(case, bench="parser", source="synthetic", **measure(
+            lambda rec: rec.count("polygons", len(parse_yolo_labels(text).cls)), repeat, warmup)))
+    if "validator" in only:
+        results.append(dict(case, bench="validator", source="synthetic", **measure(
+            lambda rec: rec.count("issues", len(checker.check_label_text(text)[0])), repeat, warmup)))
+    return results
+
+
+# ================= 结果 =================
+
+def git_revision():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=10,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def environment():
+    return {"git": git_revision(), "python": platform.python_version(), "numpy": np.__version__,
+            "opencv": cv2.__version__, "platform": platform.platform(), "cpus": os.cpu_count(),
+            "time": time.strftime("%Y-%m-%d %H:%M:%S")}
+
+
+def result_key(r):
+    """用于跨文件对比的用例标识（不含计时结果）"""
+    fields = ("bench", "source", "size", "cells", "dtype", "ext", "lines", "layout")
+    return "|".join(f"{f}={r[f]}" for f in fields if f in r)
+
+
+def describe(r):
+    if "size" in r:
+        return f"{r['bench']:<10}{r['size']}² {r['cells']} cells {r['dtype']}"
+    return f"{r['bench']:<10}{r['lines']} lines {r['layout']}"
+
+
+def print_result(r):
+    s = r["stages"]["total"]
+    detail = "  ".join(f"{k} {v['p50_ms']:.1f}" for k, v in r["stages"].items() if k != "total")
+    print(f"  {describe(r):<42} p50 {s['p50_ms']:>9.2f} ms  p95 {s['p95_ms']:>9.2f}  max {s['max_ms']:>9.2f}"
+          + (f"  | {detail}" if detail else ""))
+
+
+def compare(old_path, results):
+    """与旧结果逐项对比总耗时的 p50，比值 < 1 表示变快"""
+    with open(old_path, "r", encoding="utf-8") as f:
+        old = json.load(f)
+    old_by_key = {result_key(r): r for r in old["results"]}
+    print(f"\n与 {old_path}（{old['env'].get('git')}）对比 p50：")
+    for r in results:
+        prev = old_by_key.get(result_key(r))
+        if prev is None:
+            continue
+        a, b = prev["stages"]["total"]["p50_ms"], r["stages"]["total"]["p50_ms"]
+        ratio = b / a if a else float("inf")
+        mark = "⬆" if ratio > 1.1 else ("⬇" if ratio < 0.9 else " ")
+        print(f"  {mark} {describe(r):<42} {a:>9.2f} → {b:>9.2f} ms  ×{ratio:.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="合成数据上的离线基准")
+    parser.add_argument("--preset", choices=PRESETS, default="quick")
+    parser.add_argument("--sizes", type=int, nargs="+", help="实例图边长（覆盖预设）")
+    parser.add_argument("--cells", type=int, nargs="+", help="实例数（覆盖预设）")
+    parser.add_argument("--dtypes", nargs="+", choices=DTYPES, help="masks 类型（覆盖预设）")
+    parser.add_argument("--label-lines", type=int, nargs="+", help="随机标签集的行数（覆盖预设）")
+    parser.add_argument("--only", nargs="+", choices=BENCHES, default=list(BENCHES))
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    parser.add_argument("--warmup", type=int, default=WARMUP)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--crop-ext", default=CROP_EXT, help="crop 项目的输出格式")
+    parser.add_argument("--work-dir", default=None, help="合成数据目录（默认临时目录，结束后删除）")
+    parser.add_argument("--json", default=None, help="结果保存为 JSON")
+    parser.add_argument("--compare", default=None, help="与之前保存的 JSON 结果对比")
+    args = parser.parse_args()
+
+    preset = PRESETS[args.preset]
+    sizes = args.sizes or preset["sizes"]
+    cells = args.cells or preset["cells"]
+    dtypes = args.dtypes or preset["dtypes"]
+    label_lines = args.label_lines or preset["label_lines"]
+    only = set(args.only)
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="bench_")
+    os.makedirs(work_dir, exist_ok=True)
+    results = []
+    print(f"合成数据目录: {work_dir}")
+    try:
+        for size in sizes:
+            for n in cells:
+                for dtype in dtypes:
+                    for r in bench_masks_case(size, n, dtype, work_dir, only, args.repeat, args.warmup, args.seed,
+                                              args.crop_ext):
+                        print_result(r)
+                        results.append(r)
+        if only & {"parser", "validator"}:
+            for lines in label_lines:
+                for layout in ("poly", "bbox"):
+                    for r in bench_label_set(lines, layout, only, args.repeat, args.warmup, args.seed):
+                        print_result(r)
+                        results.append(r)
+    finally:
+        if args.work_dir is None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.compare:
+        compare(args.compare, results)
+    if args.json:
+        data = {"env": environment(), "args": vars(args), "results": results}
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=1)
+        print(f"结果已保存: {args.json}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,63 +1,222 @@
 import os
-import numpy as np
-import cv2
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from seg_instances import instance_contours
+from polygon_simplify import simplify_contour, SIMPLIFY_MODES
+from seg_io import load_masks
+from manifest import Manifest, file_stamp
+from label_store import pack_label_dir
+from label_io import write_yolo_seg
+from run_stats import RunStats, ItemStats, NULL_STATS, timed_iter
 
 NPY_DIR = r"dataset/cellpose_npy1219"
 LABEL_DIR = r"dataset/labels122203"
 SUFFIX_TO_REMOVE = '_seg'
 
-os.makedirs(LABEL_DIR, exist_ok=True)
-
-for npy_name in os.listdir(NPY_DIR):
-    if not npy_name.endswith(".npy"):
-        continue
-
-    base = os.path.splitext(npy_name)[0]
-    base = base.removesuffix(SUFFIX_TO_REMOVE)
-
-    npy_path = os.path.join(NPY_DIR, npy_name)
-    label_path = os.path.join(LABEL_DIR, base + ".txt")
-
-    try:
-        data = np.load(npy_path, allow_pickle=True).item()
-        masks = data["masks"]
-    except Exception as e:
-        print(f"❌ 加载失败：{npy_name} | {e}")
-        continue
-
-    h, w = masks.shape
-
-    with open(label_path, "w") as f:
-        for inst_id in np.unique(masks):
-            if inst_id == 0:
+MIN_AREA = 10  # 实例像素数小于该值直接丢弃
+SIMPLIFY = "fixed"  # 简化策略：fixed 固定 epsilon / relative 按周长比例
+EPSILON = 1.5  # fixed 策略下 approxPolyDP 的简化精度（像素）
+REL_EPSILON = 0.005  # relative 策略下 epsilon 占轮廓周长的比例
+MAX_VERTICES = None  # 每个多边形的顶点上限，None 表示不限制
+MIN_POINTS = 6  # 简化后点数小于该值的轮廓丢弃
+NUM_WORKERS = os.cpu_count() or 1  # 并行转换的进程数，1 表示单进程逐个转换
+CACHE_MASKS = False  # 是否把 masks 缓存为可内存映射的 .npy，之后的运行跳过 pickle
+
+
+def convert_params(**overrides):
+    """影响标签内容的转换参数，写入增量清单，变化后所有标签重新生成
+
+    顶点上限小于 min_points 时所有多边形简化后都会被丢弃（生成的标签全为空），直接报错。
+    """
+    params = {
+        "min_area": MIN_AREA,
+        "simplify": SIMPLIFY,
+        "epsilon": EPSILON,
+        "rel_epsilon": REL_EPSILON,
+        "max_vertices": MAX_VERTICES,
+        "min_points": MIN_POINTS,
+    }
+    params.update(overrides)
+    if params["max_vertices"] is not None and params["max_vertices"] < params["min_points"]:
+        raise ValueError(f"max_vertices ({params['max_vertices']}) 不能小于 min_points ({params['min_points']})："
+                         f"简化后的多边形都会被丢弃")
+    return params
+
+
+def instance_polygons(masks, params=None, stats=NULL_STATS):
+    """逐实例产出 (inst_id, polygon)，polygon 为简化后 (N, 2) 的像素坐标；stats 分别记录找轮廓和简化的耗时"""
+    params = params or convert_params()
+
+    # 每个实例只在自己的外接框内找轮廓，不再对整图逐实例做比较
+    for inst_id, contours in timed_iter(instance_contours(masks, params["min_area"]), stats, "contour"):
+        for cnt in contours:
+            with stats.time("simplify"):
+                cnt = simplify_contour(
+                    cnt,
+                    mode=params["simplify"],
+                    epsilon=params["epsilon"],
+                    rel_epsilon=params["rel_epsilon"],
+                    max_vertices=params["max_vertices"]
+                )
+
+            if len(cnt) < params["min_points"]:
                 continue
 
-            binary = (masks == inst_id).astype(np.uint8)
-
-            if binary.sum() < 10:
-                continue
+            yield inst_id, cnt.reshape(-1, 2)
 
-            contours, _ = cv2.findContours(
-                binary,
-                cv2.RETR_EXTERNAL,
-                cv2.CHAIN_APPROX_SIMPLE
-            )
 
-            for cnt in contours:
-                cnt = cv2.approxPolyDP(cnt, epsilon=1.5, closed=True)
+def masks_to_polygons(masks, params=None):
+    """将实例 mask 转为多边形列表（每个为 (N, 2) 的像素坐标）"""
+    return [poly for _, poly in instance_polygons(masks, params)]
 
-                if len(cnt) < 6:
-                    continue
 
-                # YOLO seg：class + polygon points
-                line = "0"
+def convert_file(npy_path, label_path, use_cache=CACHE_MASKS, params=None, stats=NULL_STATS):
+    """转换单个 _seg.npy 文件，标签整体原子写入；stats 记录 load/contour/simplify/write 耗时和实例数"""
+    # 只反序列化 masks，flows/outlines 等字段不会被加载成数组
+    with stats.time("load"):
+        masks = load_masks(npy_path, use_cache=use_cache)
+    h, w = masks.shape
 
-                for p in cnt:
-                    x, y = p[0]
-                    line += f" {x / w:.6f} {y / h:.6f}"
+    items = list(instance_polygons(masks, params, stats))
+    stats.count("instances", len({inst_id for inst_id, _ in items}))
+    stats.count("polygons", len(items))
 
-                f.write(line + "\n")
+    # YOLO seg：class + polygon points，整文件批量格式化后一次写入
+    with stats.time("write"):
+        write_yolo_seg(label_path, [poly for _, poly in items], w, h)
 
-    print(f"✅ {npy_name} → {os.path.basename(label_path)}")
 
-print("\n🎯 YOLO Seg 标签生成完成")
+def convert_job(npy_path, label_path, use_cache=CACHE_MASKS, params=None):
+    """子进程入口：返回 (npy_path, label_path, 错误信息或 None, 源文件指纹, 计时记录)，异常不抛回父进程"""
+    stats = ItemStats(os.path.basename(npy_path))
+    try:
+        with stats.time("total"):
+            # 转换前取指纹：转换过程中源文件若被修改，下次运行会重新转换
+            stamp = file_stamp(npy_path)
+            convert_file(npy_path, label_path, use_cache, params, stats)
+    except Exception as e:
+        return npy_path, label_path, f"{type(e).__name__}: {e}", None, stats.as_dict()
+    return npy_path, label_path, None, stamp, stats.as_dict()
+
+
+def collect_jobs(npy_dir, label_dir):
+    """列出目录下所有待转换的 (npy_path, label_path)"""
+    jobs = []
+    for npy_name in sorted(os.listdir(npy_dir)):
+        if not npy_name.endswith(".npy"):
+            continue
+
+        base = os.path.splitext(npy_name)[0]
+        base = base.removesuffix(SUFFIX_TO_REMOVE)
+
+        npy_path = os.path.join(npy_dir, npy_name)
+        label_path = os.path.join(label_dir, base + ".txt")
+        jobs.append((npy_path, label_path))
+    return jobs
+
+
+def run_batch(jobs, workers=NUM_WORKERS, use_cache=CACHE_MASKS, manifest=None, params=None, stats=None):
+    """批量转换：子进程各自写标签，进度和失败在父进程汇总，返回失败列表
+
+    传入 manifest 时，成功的文件记录指纹，失败的文件从清单移除以便下次重试；
+    传入 stats（RunStats）时汇总每个文件的计时记录。
+    """
+    failures = []
+    total = len(jobs)
+
+    def report(done, npy_path, label_path, error, stamp, item_stats):
+        npy_name = os.path.basename(npy_path)
+        if stats is not None:
+            stats.add_item(item_stats)
+        if error:
+            failures.append((npy_path, error))
+            if manifest is not None:
+                manifest.forget(npy_name)
+            print(f"❌ [{done}/{total}] 加载失败：{npy_name} | {error}")
+        else:
+            if manifest is not None:
+                manifest.record(npy_name, label_path, stamp)
+            print(f"✅ [{done}/{total}] {npy_name} → {os.path.basename(label_path)}")
+
+    if workers <= 1 or total <= 1:
+        for done, job in enumerate(jobs, 1):
+            report(done, *convert_job(*job, use_cache, params))
+        return failures
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(convert_job, *job, use_cache, params) for job in jobs]
+        for done, future in enumerate(as_completed(futures), 1):
+            report(done, *future.result())
+
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cellpose _seg.npy → YOLO seg 标签")
+    parser.add_argument("--npy-dir", default=NPY_DIR)
+    parser.add_argument("--label-dir", default=LABEL_DIR)
+    parser.add_argument("--workers", type=int, default=NUM_WORKERS, help="并行进程数")
+    parser.add_argument("--cache-masks", action="store_true", default=CACHE_MASKS,
+                        help="把 masks 缓存到 _masks_cache，之后的运行直接内存映射读取")
+    parser.add_argument("--simplify", choices=SIMPLIFY_MODES, default=SIMPLIFY, help="多边形简化策略")
+    parser.add_argument("--epsilon", type=float, default=EPSILON, help="fixed 策略的 epsilon（像素）")
+    parser.add_argument("--rel-epsilon", type=float, default=REL_EPSILON, help="relative 策略的 epsilon/周长")
+    parser.add_argument("--max-vertices", type=int, default=MAX_VERTICES, help="每个多边形的顶点上限")
+    parser.add_argument("--full", action="store_true", help="忽略增量清单，全部重新生成")
+    parser.add_argument("--report", default=None, help="把计时报告写到该路径（.json 或 .csv）")
+    parser.add_argument("--store", default=None,
+                        help="转换完成后把标签目录打包为一个 .ysp 文件（可内存映射，供训练直接读取）")
+    args = parser.parse_args()
+
+    os.makedirs(args.label_dir, exist_ok=True)
+
+    jobs = collect_jobs(args.npy_dir, args.label_dir)
+
+    # 增量转换：只处理新增/变化的源文件，删除源文件已消失的标签
+    try:
+        params = convert_params(
+            simplify=args.simplify,
+            epsilon=args.epsilon,
+            rel_epsilon=args.rel_epsilon,
+            max_vertices=args.max_vertices
+        )
+    except ValueError as e:
+        parser.error(str(e))
+    manifest = Manifest(args.label_dir, params)
+    if args.full:
+        manifest.invalidate()
+    todo, skipped, removed = manifest.plan(jobs, os.path.basename)
+
+    for key in removed:
+        entry = manifest.forget(key)
+        stale_label = os.path.join(args.label_dir, entry["label"])
+        if os.path.exists(stale_label):
+            os.remove(stale_label)
+        print(f"🗑 {key} 已不存在，删除 {entry['label']}")
+
+    stats = RunStats("convert")
+    try:
+        failures = run_batch(todo, args.workers, args.cache_masks, manifest, params, stats)
+    finally:
+        manifest.save()
+
+    print(f"完成：共 {len(jobs)} 个，转换 {len(todo)}，跳过 {skipped}，"
+          f"失败 {len(failures)}，删除 {len(removed)}")
+    if todo:
+        print(stats.format_summary())
+    if args.report:
+        stats.write_report(args.report)
+        print(f"⏱ 计时报告 → {args.report}")
+
+    if args.store:
+        # 从标签目录打包，增量运行时跳过的文件也会包含在内
+        n, lossy = pack_label_dir(args.label_dir, args.store)
+        for file_name, reason in lossy:
+            print(f"  ⚠️ {file_name}: {reason}")
+        print(f"📦 已打包 {n} 个标签 → {args.store}")
+    for npy_path, error in failures:
+        print(f"  ❌ {os.path.basename(npy_path)} | {error}")
+
+
+if __name__ == "__main__":
+    main()
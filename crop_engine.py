@@ -0,0 +1,250 @@
+"""与界面无关的裁剪逻辑：固定尺寸框、越界平移回正、_cut_{idx} 命名，以及按裁剪清单批量重放
+
+裁剪清单（JSON 或 CSV）中每条记录为一次裁剪，字段：
+    image   图片路径（相对路径以清单文件所在目录为基准）
+    cx, cy  裁剪框中心（原图像素坐标）
+    size    正方形边长；也可以用 w, h 分别指定，省略时为 CROP_W × CROP_H
+    idx     可选，输出文件名中的序号；省略时按该图片在清单中出现的顺序从 1 开始编号
+    clamp   可选，默认 1：框超出图片时像界面一样平移回图片内
+    out_size 可选（仅 JSON / 日志），[w, h]：该条裁剪保存前缩放到的尺寸，命令行 --out-size 优先
+
+JSON 为上述字段组成的对象列表；CSV 第一行为表头。
+--with-masks / --with-labels 时同时输出分块的 _seg.npy / YOLO 标签（见 crop_labels.py）。
+也可以直接传入界面生成的裁剪日志 cutoff/crop_journal.jsonl（见 crop_journal.py），--ref 时重放参考窗口的联动裁剪
+（与界面一样缩放回 REF_CROP_W × REF_CROP_H）。
+
+用法：
+    python crop_engine.py crops.csv 输出目录 --workers 8
+    python crop_engine.py crops.json 输出目录 --size 512 --out-size 256 --format .jpg
+    python crop_engine.py 图片文件夹/cutoff/crop_journal.jsonl 输出目录
+    python crop_engine.py crops.csv 输出目录 --with-labels --npy-dir dataset/cellpose_npy1219
+"""
+import os
+import csv
+import json
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from PIL import Image
+
+from crop_writer import save_image_atomic
+from crop_journal import journal_specs, skipped_message
+from crop_labels import load_sources, write_tile_annotations
+from large_image import open_image
+
+CROP_W = 640  # 主窗口固定裁剪尺寸（原图像素）
+CROP_H = 640
+REF_CROP_W = 700  # 参考窗口联动裁剪尺寸
+REF_CROP_H = 700
+NUM_WORKERS = os.cpu_count() or 1
+
+
+def box_from_center(cx, cy, w=CROP_W, h=CROP_H):
+    """以 (cx, cy) 为中心的 w × h 裁剪框 (x1, y1, x2, y2)，与界面一样向零取整"""
+    return (
+        int(cx - w / 2),
+        int(cy - h / 2),
+        int(cx + w / 2),
+        int(cy + h / 2)
+    )
+
+
+def clamp_box(box, img_w, img_h):
+    """框超出图片时整体平移回图片内（不改变大小）"""
+    x1, y1, x2, y2 = box
+
+    shift_x = 0
+    if x1 < 0:
+        shift_x = -x1
+    elif x2 > img_w:
+        shift_x = img_w - x2
+
+    shift_y = 0
+    if y1 < 0:
+        shift_y = -y1
+    elif y2 > img_h:
+        shift_y = img_h - y2
+
+    return x1 + shift_x, y1 + shift_y, x2 + shift_x, y2 + shift_y
+
+
+def crop_filename(image_path, idx, ext=None):
+    """原图 a.png 的第 idx 次裁剪保存为 a_cut_{idx}.png；ext 可换成别的格式"""
+    base, orig_ext = os.path.splitext(os.path.basename(image_path))
+    return f"{base}_cut_{idx}{ext or orig_ext}"
+
+
+def crop_image(image, box, out_size=None):
+    """裁剪（可选缩放到 out_size=(w, h)）"""
+    cropped = image.crop(box)
+    if out_size and tuple(out_size) != cropped.size:
+        cropped = cropped.resize(tuple(out_size), Image.LANCZOS)
+    return cropped
+
+
+def _to_bool(value):
+    if isinstance(value, str):
+        return value.strip().lower() not in ("0", "false", "no", "")
+    return bool(value)
+
+
+def normalize_spec(raw, base_dir=""):
+    """把清单中的一条记录整理为 {image, cx, cy, w, h, idx, clamp, out_size}"""
+    image = raw["image"]
+    if base_dir and not os.path.isabs(image):
+        image = os.path.join(base_dir, image)
+
+    size = raw.get("size")
+    w = raw.get("w") or size or CROP_W
+    h = raw.get("h") or size or CROP_H
+    idx = raw.get("idx")
+    clamp = raw.get("clamp")
+    out_size = raw.get("out_size")
+    return {
+        "image": image,
+        "cx": float(raw["cx"]),
+        "cy": float(raw["cy"]),
+        "w": int(float(w)),
+        "h": int(float(h)),
+        "idx": int(idx) if idx not in (None, "") else None,
+        "clamp": _to_bool(clamp) if clamp not in (None, "") else True,
+        "out_size": tuple(int(v) for v in out_size) if out_size else None,
+    }
+
+
+def load_specs(path, ref=False):
+    """读取 JSON / CSV 裁剪清单或 JSONL 裁剪日志，返回整理后的记录列表（未写 idx 的按图片内顺序编号）"""
+    if path.lower().endswith(".jsonl"):
+        rows, skipped = journal_specs(path, ref=ref)
+        if skipped:
+            print(f"⚠️ {skipped_message(path, skipped)}")
+        for row in rows:
+            if ref and not row.get("out_size"):  # 旧日志没有记录：界面总是缩放回参考裁剪尺寸
+                row["out_size"] = (REF_CROP_W, REF_CROP_H)
+    else:
+        with open(path, "r", encoding="utf-8-sig", newline="") as f:
+            if path.lower().endswith(".json"):
+                rows = json.load(f)
+            else:
+                rows = list(csv.DictReader(f))
+
+    base_dir = os.path.dirname(os.path.abspath(path))
+    specs = [normalize_spec(r, base_dir) for r in rows]
+
+    counters = {}
+    for spec in specs:
+        n = counters.get(spec["image"], 0) + 1
+        counters[spec["image"]] = n
+        if spec["idx"] is None:
+            spec["idx"] = n
+    return specs
+
+
+def crop_one_image(image_path, specs, out_dir, ext=None, size=None, out_size=None, annotate=None):
+    """子进程入口：一张图片只解码一次（超大图内存映射，只读裁剪框），执行它的全部裁剪，返回 (图片, 已保存路径列表, 错误)
+
+    annotate 为 {"npy_dir", "label_dir", "write_masks", "write_labels"} 时同时裁剪标注。
+    out_size 为 None 时使用每条记录自己的 out_size。
+    """
+    saved = []
+    try:
+        with open_image(image_path) as img:
+            img.load()
+            sources = None
+            if annotate:
+                sources = load_sources(image_path, img.width, img.height,
+                                       annotate.get("npy_dir"), annotate.get("label_dir"))
+            fmt = Image.registered_extensions().get((ext or os.path.splitext(image_path)[1]).lower())
+            to_rgb = fmt == "JPEG" and img.mode not in ("RGB", "L")
+
+            for spec in specs:
+                w, h = (size, size) if size else (spec["w"], spec["h"])
+                box = box_from_center(spec["cx"], spec["cy"], w, h)
+                if spec["clamp"]:
+                    box = clamp_box(box, img.width, img.height)
+
+                spec_out_size = out_size or spec.get("out_size")
+                save_path = os.path.join(out_dir, crop_filename(image_path, spec["idx"], ext))
+                cropped = crop_image(img, box, spec_out_size)
+                if to_rgb:  # 逐块转换，不转换整张原图
+                    cropped = cropped.convert("RGB")
+                save_image_atomic(cropped, save_path)
+                saved.append(save_path)
+
+                if sources:
+                    tile_name = os.path.splitext(os.path.basename(save_path))[0]
+                    write_tile_annotations(out_dir, tile_name, box, **sources,
+                                           write_masks=annotate.get("write_masks", False),
+                                           write_labels=annotate.get("write_labels", False),
+                                           out_size=spec_out_size)
+    except Exception as e:
+        return image_path, saved, f"{type(e).__name__}: {e}"
+    return image_path, saved, None
+
+
+def run_specs(specs, out_dir, workers=NUM_WORKERS, ext=None, size=None, out_size=None, annotate=None):
+    """按图片分组，多进程执行裁剪清单，返回 (保存数量, 失败列表)"""
+    os.makedirs(out_dir, exist_ok=True)
+
+    groups = {}
+    for spec in specs:
+        groups.setdefault(spec["image"], []).append(spec)
+
+    saved = 0
+    failed = []
+    total = len(groups)
+
+    def report(done, path, paths, error):
+        nonlocal saved
+        saved += len(paths)
+        if error:
+            failed.append((path, error))
+            print(f"❌ [{done}/{total}] 裁剪失败：{os.path.basename(path)} | {error}")
+        else:
+            print(f"✅ [{done}/{total}] {os.path.basename(path)}: {len(paths)} 张")
+
+    if workers <= 1 or total <= 1:
+        for done, (path, group) in enumerate(groups.items(), 1):
+            report(done, *crop_one_image(path, group, out_dir, ext, size, out_size, annotate))
+        return saved, failed
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(crop_one_image, path, group, out_dir, ext, size, out_size, annotate)
+                   for path, group in groups.items()]
+        for done, future in enumerate(as_completed(futures), 1):
+            report(done, *future.result())
+    return saved, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="按裁剪清单批量重放裁剪（无界面）")
+    parser.add_argument("specs", help="裁剪清单 .json / .csv，或裁剪日志 .jsonl")
+    parser.add_argument("out_dir", help="输出目录")
+    parser.add_argument("--workers", type=int, default=NUM_WORKERS)
+    parser.add_argument("--size", type=int, default=None, help="覆盖清单中的裁剪边长（按原中心重新裁）")
+    parser.add_argument("--out-size", type=int, default=None, help="裁剪后再缩放到该边长")
+    parser.add_argument("--format", default=None, help="输出扩展名，如 .png / .jpg（默认与原图相同）")
+    parser.add_argument("--ref", action="store_true", help="重放裁剪日志中参考窗口的联动裁剪")
+    parser.add_argument("--with-masks", action="store_true", help="同时输出分块的 _seg.npy")
+    parser.add_argument("--with-labels", action="store_true", help="同时输出分块的 YOLO 标签")
+    parser.add_argument("--npy-dir", default=None, help="整图 _seg.npy 目录（默认图片同目录）")
+    parser.add_argument("--label-dir", default=None, help="整图 YOLO 标签目录（没有 masks 时使用）")
+    args = parser.parse_args()
+
+    ext = args.format
+    if ext and not ext.startswith("."):
+        ext = "." + ext
+    out_size = (args.out_size, args.out_size) if args.out_size else None
+
+    annotate = None
+    if args.with_masks or args.with_labels:
+        annotate = {"npy_dir": args.npy_dir, "label_dir": args.label_dir,
+                    "write_masks": args.with_masks, "write_labels": args.with_labels}
+
+    specs = load_specs(args.specs, args.ref)
+    saved, failed = run_specs(specs, args.out_dir, args.workers, ext, args.size, out_size, annotate)
+    print(f"\n🎉 完成：{len(specs)} 条裁剪，保存 {saved} 张，失败图片 {len(failed)} 张")
+    raise SystemExit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
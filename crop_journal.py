@@ -0,0 +1,153 @@
+"""裁剪记录：每个图片文件夹一份只追加的 JSONL 日志（cutoff/crop_journal.jsonl）
+
+每行一条事件：
+    {"op": "crop", "image": "a.png", "idx": 3, "box": [x1, y1, x2, y2],
+     "ref": {"image": 参考图路径, "box": [...], "out_size": [w, h]}, "time": ...}
+    {"op": "clear", "image": "a.png", "time": ...}      清除该图片的标注（序号继续递增，不会覆盖旧文件）
+
+打开时读一遍建立按图片名的索引，切换图片时直接取，不再扫描文件。
+日志同时可以作为 crop_engine 的裁剪清单重放（python crop_engine.py cutoff/crop_journal.jsonl 输出目录）。
+"""
+import os
+import json
+import time
+
+JOURNAL_NAME = "crop_journal.jsonl"
+
+
+def read_events(path):
+    """读取全部事件，返回 (事件列表, 跳过的损坏行 [(行号, 内容前 80 字)])
+
+    写到一半的行（程序崩溃）无法解析，跳过并交给调用方提示。
+    """
+    events, skipped = [], []
+    if not os.path.exists(path):
+        return events, skipped
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                events.append(json.loads(line))
+            except json.JSONDecodeError:
+                skipped.append((line_no, line[:80]))
+    return events, skipped
+
+
+def skipped_message(path, skipped):
+    """跳过损坏行的提示文字"""
+    lines = "、".join(str(n) for n, _ in skipped[:5]) + ("…" if len(skipped) > 5 else "")
+    return f"{os.path.basename(path)} 中有 {len(skipped)} 行损坏，已跳过（第 {lines} 行）"
+
+
+def open_append(path):
+    """以追加方式打开日志；上次写到一半的行先补上换行，新记录不会接在它后面"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    broken_tail = False
+    if os.path.exists(path) and os.path.getsize(path) > 0:
+        with open(path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            broken_tail = f.read(1) != b"\n"
+    file = open(path, "a", encoding="utf-8")
+    if broken_tail:
+        file.write("\n")
+    return file
+
+
+class CropJournal:
+    """按图片名索引的裁剪日志，追加写入"""
+
+    def __init__(self, path):
+        self.path = path
+        self.marks = {}  # 图片名 -> [(x1, y1, x2, y2, idx)]，清除后为空
+        self.last_idx = {}  # 图片名 -> 用过的最大序号
+        events, self.skipped = read_events(path)  # 损坏的行 [(行号, 内容)]，由界面提示
+        for event in events:
+            self._apply(event)
+        self.file = None
+
+    def _apply(self, event):
+        image = event["image"]
+        if event["op"] == "crop":
+            self.marks.setdefault(image, []).append((*event["box"], event["idx"]))
+            self.last_idx[image] = max(self.last_idx.get(image, 0), event["idx"])
+        elif event["op"] == "clear":
+            self.marks[image] = []
+
+    def _append(self, event):
+        if self.file is None:
+            self.file = open_append(self.path)
+        self.file.write(json.dumps(event, ensure_ascii=False) + "\n")
+        self.file.flush()
+        self._apply(event)
+
+    def regions(self, image):
+        """该图片当前的标注 [(x1, y1, x2, y2, idx)]（返回副本）"""
+        return list(self.marks.get(image, []))
+
+    def last_index(self, image):
+        return self.last_idx.get(image, 0)
+
+    def next_index(self, image):
+        """下一次裁剪的序号：始终大于用过的序号，不会覆盖已有的 _cut_ 文件"""
+        return self.last_index(image) + 1
+
+    def record_crop(self, image, idx, box, ref_image=None, ref_box=None, ref_out_size=None):
+        """ref_out_size：参考图裁剪后缩放到的尺寸（配准带缩放时裁剪框与输出尺寸不同）"""
+        event = {"op": "crop", "image": image, "idx": idx, "box": [int(v) for v in box]}
+        if ref_image is not None:
+            event["ref"] = {"image": ref_image, "box": [int(v) for v in ref_box]}
+            if ref_out_size is not None:
+                event["ref"]["out_size"] = [int(v) for v in ref_out_size]
+        event["time"] = round(time.time(), 3)
+        self._append(event)
+
+    def record_clear(self, image):
+        self._append({"op": "clear", "image": image, "time": round(time.time(), 3)})
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def journal_specs(path, image_dir=None, ref=False):
+    """把日志中的裁剪转换为 crop_engine 的裁剪清单记录
+
+    image_dir 默认为日志所在 cutoff 目录的上一级（即图片文件夹）；ref=True 时改为导出参考窗口的联动裁剪，
+    带上记录的输出尺寸 out_size（旧日志没有时为 None，由 crop_engine 补默认值）。
+    被清除的标注同样导出：清除只影响界面显示，文件仍然存在。
+    返回 (记录列表, 跳过的损坏行)。
+    """
+    if image_dir is None:
+        image_dir = os.path.dirname(os.path.dirname(os.path.abspath(path)))
+
+    events, skipped = read_events(path)
+    rows = []
+    for event in events:
+        if event["op"] != "crop":
+            continue
+        out_size = None
+        if ref:
+            if "ref" not in event:
+                continue
+            image, box = event["ref"]["image"], event["ref"]["box"]
+            out_size = event["ref"].get("out_size")
+        else:
+            image, box = os.path.join(image_dir, event["image"]), event["box"]
+
+        x1, y1, x2, y2 = box
+        row = {
+            "image": image,
+            "cx": (x1 + x2) / 2,
+            "cy": (y1 + y2) / 2,
+            "w": x2 - x1,
+            "h": y2 - y1,
+            "idx": event["idx"],
+            "clamp": False,  # 记录的是已经回正过的框
+        }
+        if ref:
+            row["out_size"] = out_size
+        rows.append(row)
+    return rows, skipped
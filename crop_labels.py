@@ -0,0 +1,236 @@
+"""与裁剪图一起裁剪标注：实例 masks 切片为分块 _seg.npy，YOLO 多边形裁剪到分块边界
+
+    masks    直接对数组做切片（视图），只在分块内统计各实例面积，不对整图逐实例遍历
+    多边形   Sutherland–Hodgman 逐边裁剪到分块矩形，坐标换算到分块内再归一化
+
+边缘碎片：分块内面积 < MIN_FRAGMENT_AREA 像素，或不到原实例面积 MIN_FRAGMENT_RATIO 的部分直接丢弃。
+
+输出放在 cutoff 目录下：
+    cutoff/labels/{name}_cut_{idx}.txt
+    cutoff/masks/{name}_cut_{idx}_seg.npy
+"""
+import os
+import numpy as np
+
+from seg_io import load_masks, write_seg_masks
+from label_io import write_yolo_seg
+from label_parse import read_yolo_labels, split_polygons
+from seg_instances import find_instances
+import cellpose標簽轉換 as converter
+
+MIN_FRAGMENT_AREA = 20  # 分块内剩余面积小于该值（像素）的实例/多边形丢弃
+MIN_FRAGMENT_RATIO = 0.1  # 分块内剩余面积不到原来的该比例时丢弃
+LABEL_SUBDIR = "labels"
+MASK_SUBDIR = "masks"
+SEG_SUFFIX = "_seg.npy"
+
+
+def find_masks(image_path, npy_dir=None):
+    """图片对应的 {name}_seg.npy：npy_dir 中或图片同目录；没有时返回 None"""
+    base = os.path.splitext(os.path.basename(image_path))[0]
+    for folder in (npy_dir, os.path.dirname(image_path)):
+        if folder:
+            path = os.path.join(folder, base + SEG_SUFFIX)
+            if os.path.exists(path):
+                return path
+    return None
+
+
+def load_image_masks(image_path, npy_dir=None):
+    npy_path = find_masks(image_path, npy_dir)
+    return np.asarray(load_masks(npy_path)) if npy_path else None
+
+
+def find_label(image_path, label_dir=None):
+    """图片对应的 YOLO 标签 {name}.txt：label_dir 中或图片同目录；没有时返回 None"""
+    base = os.path.splitext(os.path.basename(image_path))[0]
+    for folder in (label_dir, os.path.dirname(image_path)):
+        if folder:
+            path = os.path.join(folder, base + ".txt")
+            if os.path.exists(path):
+                return path
+    return None
+
+
+# ================= masks =================
+
+def slice_region(array, box):
+    """取 array[y1:y2, x1:x2]；框完全在图内时为视图，超出部分补 0（与 PIL crop 一致）"""
+    x1, y1, x2, y2 = [int(v) for v in box]
+    h, w = array.shape[:2]
+    if x1 >= 0 and y1 >= 0 and x2 <= w and y2 <= h:
+        return array[y1:y2, x1:x2]
+
+    out = np.zeros((y2 - y1, x2 - x1) + array.shape[2:], dtype=array.dtype)
+    sx1, sy1 = max(x1, 0), max(y1, 0)
+    sx2, sy2 = min(x2, w), min(y2, h)
+    if sx2 > sx1 and sy2 > sy1:
+        out[sy1 - y1:sy2 - y1, sx1 - x1:sx2 - x1] = array[sy1:sy2, sx1:sx2]
+    return out
+
+
+def resize_masks_nearest(tile, size):
+    """实例图按最近邻缩放到 size=(w, h)（输出分块图被缩放时保持对齐）"""
+    w, h = size
+    th, tw = tile.shape
+    rows = (np.arange(h) * th // h)
+    cols = (np.arange(w) * tw // w)
+    return tile[rows[:, None], cols[None, :]]
+
+
+def instance_areas(masks):
+    """整图各实例的 (id 升序, 像素数)，每张图只算一次，供所有分块共用
+
+    不用 np.bincount：id 稀疏的 uint32 masks 会按最大 id 分配数组。
+    """
+    ids, _, areas = find_instances(np.asarray(masks))
+    return ids, areas
+
+
+def crop_instance_masks(masks, box, full_areas=None, min_area=MIN_FRAGMENT_AREA, min_ratio=MIN_FRAGMENT_RATIO):
+    """切出分块内的实例图并去掉边缘碎片；没有碎片时返回的仍是原数组的视图"""
+    tile = slice_region(masks, box)
+    ids, counts = np.unique(tile, return_counts=True)
+    counts = counts[ids > 0]
+    ids = ids[ids > 0]
+
+    small = counts < min_area
+    if full_areas is not None and min_ratio:
+        full_ids, areas = full_areas
+        small |= counts < min_ratio * areas[np.searchsorted(full_ids, ids)]
+    if small.any():
+        tile = np.where(np.isin(tile, ids[small]), 0, tile)
+    return tile
+
+
+# ================= 多边形 =================
+
+def polygon_area(poly):
+    x, y = poly[:, 0], poly[:, 1]
+    return 0.5 * abs(np.dot(x, np.roll(y, 1)) - np.dot(y, np.roll(x, 1)))
+
+
+def _clip_edge(pts, axis, value, keep_greater):
+    """Sutherland–Hodgman 的一步：保留 pts 在直线 coord[axis] = value 一侧的部分"""
+    if len(pts) == 0:
+        return pts
+    prev = np.roll(pts, 1, axis=0)
+    if keep_greater:
+        inside, prev_inside = pts[:, axis] >= value, prev[:, axis] >= value
+    else:
+        inside, prev_inside = pts[:, axis] <= value, prev[:, axis] <= value
+
+    # 每条边 (prev → cur) 最多输出两个点：[与裁剪线的交点]、[cur]
+    crossing = inside != prev_inside
+    delta = pts[:, axis] - prev[:, axis]
+    t = np.divide(value - prev[:, axis], delta, out=np.zeros(len(pts)), where=delta != 0)
+    cut = prev + t[:, None] * (pts - prev)
+    cut[:, axis] = value
+
+    candidates = np.stack([cut, pts], axis=1).reshape(-1, 2)
+    emit = np.stack([crossing, inside], axis=1).ravel()
+    return candidates[emit]
+
+
+def clip_polygon(poly, box):
+    """把多边形（像素坐标）裁剪到矩形 box = (x1, y1, x2, y2) 内，返回裁剪后的顶点（可能为空）"""
+    x1, y1, x2, y2 = box
+    pts = np.asarray(poly, dtype=np.float64).reshape(-1, 2)
+    for axis, value, keep_greater in ((0, x1, True), (0, x2, False), (1, y1, True), (1, y2, False)):
+        pts = _clip_edge(pts, axis, value, keep_greater)
+    return pts
+
+
+def clip_polygons(polygons, classes, box, min_area=MIN_FRAGMENT_AREA, min_ratio=MIN_FRAGMENT_RATIO):
+    """裁剪一组多边形到分块，返回 (分块内坐标的多边形列表, 类别列表)，丢弃碎片"""
+    x1, y1, x2, y2 = box
+    out_polys, out_cls = [], []
+    for poly, c in zip(polygons, classes):
+        poly = np.asarray(poly, dtype=np.float64).reshape(-1, 2)
+        # 外接框与分块不相交的直接跳过
+        if poly[:, 0].max() <= x1 or poly[:, 0].min() >= x2 or poly[:, 1].max() <= y1 or poly[:, 1].min() >= y2:
+            continue
+
+        clipped = clip_polygon(poly, box)
+        if len(clipped) < 3:
+            continue
+        area = polygon_area(clipped)
+        if area < min_area or (min_ratio and area < min_ratio * polygon_area(poly)):
+            continue
+
+        out_polys.append(clipped - (x1, y1))
+        out_cls.append(int(c))
+    return out_polys, out_cls
+
+
+def read_yolo_polygons(label_path, img_w, img_h):
+    """读取整图的 YOLO 标签（两种格式自动识别），返回 (像素坐标多边形列表, 类别数组)"""
+    labels = read_yolo_labels(label_path)
+    coords = labels.coords.astype(np.float64) * (img_w, img_h)
+    return split_polygons(coords, labels.offsets), labels.cls
+
+
+def load_sources(image_path, img_w, img_h, npy_dir=None, label_dir=None):
+    """整图的标注来源 {masks, full_areas, polygons, classes}，优先使用 masks，没有时读 YOLO 标签"""
+    masks = load_image_masks(image_path, npy_dir)
+    if masks is not None:
+        if masks.shape != (img_h, img_w):
+            raise ValueError(f"masks 尺寸 {masks.shape} 与图片 {(img_w, img_h)} 不一致")
+        return {"masks": masks, "full_areas": instance_areas(masks)}
+
+    label_path = find_label(image_path, label_dir)
+    if label_path is not None:
+        polygons, classes = read_yolo_polygons(label_path, img_w, img_h)
+        return {"polygons": polygons, "classes": classes}
+    return {}
+
+
+# ================= 分块输出 =================
+
+def tile_label_paths(out_dir, tile_name):
+    """分块 tile_name（不含扩展名）对应的 (标签 .txt, masks _seg.npy) 路径"""
+    return (os.path.join(out_dir, LABEL_SUBDIR, tile_name + ".txt"),
+            os.path.join(out_dir, MASK_SUBDIR, tile_name + "_seg.npy"))
+
+
+def tile_annotations(box, masks=None, full_areas=None, polygons=None, classes=None, with_polygons=True, params=None):
+    """计算一个分块的 (实例图, 分块像素坐标的多边形列表, 类别)，没有对应来源的部分为 None
+
+    有 masks 时多边形由分块 masks 重新提取轮廓（与转换脚本参数一致）；
+    只有整图 YOLO 多边形时按分块边界裁剪多边形。
+    """
+    tile_masks = tile_polys = tile_cls = None
+    if masks is not None:
+        tile_masks = crop_instance_masks(masks, box, full_areas)
+
+    if with_polygons:
+        if tile_masks is not None:
+            tile_polys = [poly for _, poly in converter.instance_polygons(np.asarray(tile_masks), params)]
+            tile_cls = 0
+        elif polygons is not None:
+            tile_polys, tile_cls = clip_polygons(polygons, classes, box)
+    return tile_masks, tile_polys, tile_cls
+
+
+def write_tile_annotations(out_dir, tile_name, box, masks=None, full_areas=None, polygons=None, classes=None,
+                           write_masks=True, write_labels=True, out_size=None, params=None):
+    """写出一个分块的 masks 和/或 YOLO 标签，返回写出的路径列表
+
+    out_size 为输出分块图缩放后的尺寸：masks 按最近邻缩放，归一化的标签不受影响。
+    """
+    label_path, mask_path = tile_label_paths(out_dir, tile_name)
+    tile_w, tile_h = int(box[2] - box[0]), int(box[3] - box[1])
+    written = []
+
+    tile_masks, tile_polys, tile_cls = tile_annotations(box, masks, full_areas, polygons, classes,
+                                                        write_labels, params)
+    if write_masks and tile_masks is not None:
+        write_seg_masks(mask_path, resize_masks_nearest(tile_masks, out_size) if out_size else tile_masks)
+        written.append(mask_path)
+
+    if tile_polys is not None:
+        os.makedirs(os.path.dirname(label_path), exist_ok=True)
+        write_yolo_seg(label_path, tile_polys, tile_w, tile_h, tile_cls)
+        written.append(label_path)
+
+    return written
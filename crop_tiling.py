@@ -0,0 +1,274 @@
+"""自动滑窗分块：按步长在整图上铺满重叠的 640 × 640 块，并过滤掉大部分是背景的块
+
+背景判断（两种都可用，都开启时两个条件都要满足）：
+    - 灰度：与整图中位数（视为背景亮度）相差超过 BG_DELTA 的像素比例 ≥ MIN_FOREGROUND
+    - 实例：有对应的 Cellpose _seg.npy 时，块内实例像素比例 ≥ MIN_MASK_FOREGROUND 且实例中心数 ≥ MIN_INSTANCES
+所有块的统计量一次算出，不逐块循环：按块边界把图切成小格，np.add.reduceat 求每格之和，
+再在小格上做积分图（不建整图大小的积分图，额外内存只有一张 bool 前景图）。
+
+输出沿用界面的 cutoff 目录和 {name}_cut_{idx} 命名，序号接在裁剪日志之后，并追加到日志中。
+
+用法：
+    python crop_tiling.py 图片文件夹 --stride 512 --npy-dir dataset/cellpose_npy1219 --workers 8
+    python crop_tiling.py 图片文件夹 --dry-run      只统计会生成多少块
+    python crop_tiling.py 图片文件夹 --with-masks --with-labels   同时输出分块的 _seg.npy 和 YOLO 标签
+"""
+import os
+import glob
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+
+from crop_engine import CROP_W, CROP_H, crop_filename
+from crop_journal import CropJournal, JOURNAL_NAME, skipped_message
+from crop_writer import save_image_atomic
+from crop_labels import load_image_masks, load_sources, write_tile_annotations
+from seg_instances import find_instances
+from large_image import LargeImage, open_image
+
+STRIDE = 512  # 相邻块的步长（< 块大小时有重叠）
+BG_DELTA = 20  # 与背景亮度相差超过该值的像素算前景（0-255 灰度）
+MIN_FOREGROUND = 0.05  # 块内灰度前景比例下限，None 表示不按灰度过滤
+MIN_MASK_FOREGROUND = 0.02  # 块内实例像素比例下限（有 masks 时）
+MIN_INSTANCES = 1  # 块内实例中心数下限（有 masks 时）
+IMAGE_EXTS = ('*.jpg', '*.jpeg', '*.png', '*.gif', '*.bmp', '*.tif', '*.tiff')
+GRAY_MAX_SIDE = 4096  # 超大图的灰度统计在缩小到长边不超过该值的图上进行
+BAND_ROWS = 1024  # 求直方图和实例中心时分带处理，每次的行数
+NUM_WORKERS = os.cpu_count() or 1
+
+
+def grid_starts(length, tile, stride):
+    """一维上的块起点：按步长排列，最后一块贴齐边缘保证全覆盖"""
+    if length <= tile:
+        return np.zeros(1, dtype=np.int64)
+    starts = np.arange(0, length - tile + 1, stride, dtype=np.int64)
+    if starts[-1] != length - tile:
+        starts = np.append(starts, length - tile)
+    return starts
+
+
+def tile_boxes(img_w, img_h, tile_w=CROP_W, tile_h=CROP_H, stride=STRIDE):
+    """整图的所有块 (N, 4) [x1, y1, x2, y2]，行优先排列"""
+    xs = grid_starts(img_w, tile_w, stride)
+    ys = grid_starts(img_h, tile_h, stride)
+    x1, y1 = np.meshgrid(xs, ys)
+    x1, y1 = x1.ravel(), y1.ravel()
+    return np.stack([x1, y1, x1 + tile_w, y1 + tile_h], axis=1)
+
+
+def cell_edges(boxes, img_w, img_h):
+    """所有块的边界把图切成的小格：返回 (行边界, 列边界)，都含 0 和图片边长"""
+    ys = np.unique(np.clip(np.r_[0, boxes[:, 1], boxes[:, 3], img_h], 0, img_h))
+    xs = np.unique(np.clip(np.r_[0, boxes[:, 0], boxes[:, 2], img_w], 0, img_w))
+    return ys, xs
+
+
+def cell_sums(values, ys, xs):
+    """每个小格内 values 之和 (len(ys) - 1, len(xs) - 1)：逐行格按列求和再分段归约（sum 分块转换类型，不复制整图）"""
+    rows = np.stack([values[y1:y2].sum(axis=0, dtype=np.int64) for y1, y2 in zip(ys[:-1], ys[1:])])
+    return np.add.reduceat(rows, xs[:-1], axis=1)
+
+
+def box_sums(cells, ys, xs, boxes):
+    """在小格的积分图上一次求出所有块内的和（超出图片的部分按 0 计）"""
+    ii = np.zeros((cells.shape[0] + 1, cells.shape[1] + 1), dtype=np.int64)
+    np.cumsum(np.cumsum(cells, axis=0), axis=1, out=ii[1:, 1:])
+    x1, x2 = [np.searchsorted(xs, np.clip(boxes[:, i], 0, xs[-1])) for i in (0, 2)]
+    y1, y2 = [np.searchsorted(ys, np.clip(boxes[:, i], 0, ys[-1])) for i in (1, 3)]
+    return ii[y2, x2] - ii[y1, x2] - ii[y2, x1] + ii[y1, x1]
+
+
+def tile_sums(values, boxes):
+    """每个块内 values（bool 或整数图）之和"""
+    ys, xs = cell_edges(boxes, values.shape[1], values.shape[0])
+    return box_sums(cell_sums(values, ys, xs), ys, xs, boxes)
+
+
+def median_gray(gray):
+    """uint8 灰度图的中位数（与 np.median 相同），分带累计直方图求得，不复制整图"""
+    hist = sum(np.bincount(gray[y:y + BAND_ROWS].ravel(), minlength=256)
+               for y in range(0, gray.shape[0], BAND_ROWS))
+    cum = np.cumsum(hist)
+    n = cum[-1]
+    lo = np.searchsorted(cum, (n - 1) // 2, side="right")
+    hi = np.searchsorted(cum, n // 2, side="right")
+    return (lo + hi) / 2
+
+
+def foreground_fraction(gray, boxes, bg_delta=BG_DELTA):
+    """每个块中与背景亮度差异明显的像素比例"""
+    background = int(median_gray(gray))
+    fg = (gray > background + bg_delta) | (gray < background - bg_delta)
+    area = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return tile_sums(fg, boxes) / area
+
+
+def instance_centers(masks, band=BAND_ROWS):
+    """每个实例外接框的中心 (cy, cx)：分带求外接框再按 id 合并，临时内存只与一条带的大小有关"""
+    ids, boxes = [], []
+    for y in range(0, masks.shape[0], band):
+        band_ids, band_boxes, _ = find_instances(masks[y:y + band])
+        band_boxes[:, [0, 2]] += y
+        ids.append(band_ids)
+        boxes.append(band_boxes)
+    ids, boxes = np.concatenate(ids), np.concatenate(boxes)
+    if not len(ids):
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    uniq, inv = np.unique(ids, return_inverse=True)
+    lo = np.full((len(uniq), 2), np.iinfo(np.int64).max)
+    hi = np.zeros((len(uniq), 2), dtype=np.int64)
+    np.minimum.at(lo, inv, boxes[:, :2])
+    np.maximum.at(hi, inv, boxes[:, 2:])
+    return (lo[:, 0] + hi[:, 0] - 1) // 2, (lo[:, 1] + hi[:, 1] - 1) // 2
+
+
+def instance_density(masks, boxes):
+    """每个块的 (实例像素比例, 实例中心数)"""
+    area = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    ys, xs = cell_edges(boxes, masks.shape[1], masks.shape[0])
+    mask_fraction = box_sums(cell_sums(masks > 0, ys, xs), ys, xs, boxes) / area
+
+    # 实例中心直接计入所在的小格，不建整图大小的中心图
+    cy, cx = instance_centers(masks)
+    centers = np.zeros((len(ys) - 1, len(xs) - 1), dtype=np.int64)
+    np.add.at(centers, (np.searchsorted(ys, cy, side="right") - 1, np.searchsorted(xs, cx, side="right") - 1), 1)
+    counts = box_sums(centers, ys, xs, boxes)
+    return mask_fraction, counts
+
+
+def propose_tiles(image, masks=None, tile_w=CROP_W, tile_h=CROP_H, stride=STRIDE,
+                  min_foreground=MIN_FOREGROUND, min_mask_foreground=MIN_MASK_FOREGROUND,
+                  min_instances=MIN_INSTANCES):
+    """返回 (保留的块 (K, 4), 全部块 (N, 4), 保留标记 (N,))"""
+    boxes = tile_boxes(image.width, image.height, tile_w, tile_h, stride)
+    keep = np.ones(len(boxes), dtype=bool)
+
+    if min_foreground is not None:
+        if isinstance(image, LargeImage):
+            # 不把整张大图转灰度：在块平均缩小的图上统计，块坐标同比缩小
+            factor = -(-max(image.size) // GRAY_MAX_SIDE)
+            gray = np.asarray(image.reduce(factor).convert("L"))
+            keep &= foreground_fraction(gray, boxes // factor) >= min_foreground
+        else:
+            gray = np.asarray(image.convert("L"))
+            keep &= foreground_fraction(gray, boxes) >= min_foreground
+
+    if masks is not None:
+        if masks.shape != (image.height, image.width):
+            raise ValueError(f"masks 尺寸 {masks.shape} 与图片 {image.size} 不一致")
+        mask_fraction, counts = instance_density(masks, boxes)
+        keep &= (mask_fraction >= min_mask_foreground) & (counts >= min_instances)
+
+    return boxes[keep], boxes, keep
+
+
+def tile_one_image(image_path, out_dir, start_idx, npy_dir=None, size=CROP_W, stride=STRIDE,
+                   min_foreground=MIN_FOREGROUND, use_masks=True, dry_run=False, annotate=None):
+    """子进程入口：分块、过滤并保存，返回 (图片, [(idx, box)], 总块数, 错误)
+
+    annotate 为 {"label_dir", "write_masks", "write_labels"} 时同时输出分块标注。
+    """
+    try:
+        with open_image(image_path) as img:
+            img.load()
+            sources = {}
+            if annotate:
+                sources = load_sources(image_path, img.width, img.height, npy_dir, annotate.get("label_dir"))
+                masks = sources.get("masks") if use_masks else None
+            else:
+                masks = load_image_masks(image_path, npy_dir) if use_masks else None
+            kept, boxes, _ = propose_tiles(img, masks, size, size, stride, min_foreground)
+
+            saved = []
+            for idx, box in enumerate(kept.tolist(), start_idx):
+                if not dry_run:
+                    tile_name = os.path.splitext(crop_filename(image_path, idx))[0]
+                    save_image_atomic(img.crop(tuple(box)), os.path.join(out_dir, crop_filename(image_path, idx)))
+                    if sources:
+                        write_tile_annotations(out_dir, tile_name, box, **sources,
+                                               write_masks=annotate.get("write_masks", False),
+                                               write_labels=annotate.get("write_labels", False))
+                saved.append((idx, box))
+    except Exception as e:
+        return image_path, [], 0, f"{type(e).__name__}: {e}"
+    return image_path, saved, len(boxes), None
+
+
+def tile_folder(folder, npy_dir=None, size=CROP_W, stride=STRIDE, min_foreground=MIN_FOREGROUND,
+                use_masks=True, workers=NUM_WORKERS, dry_run=False, annotate=None):
+    """对文件夹内全部图片分块，保存到 folder/cutoff 并记入裁剪日志，返回失败列表"""
+    image_files = []
+    for ext in IMAGE_EXTS:
+        image_files.extend(glob.glob(os.path.join(folder, ext)))
+    image_files.sort()
+
+    out_dir = os.path.join(folder, "cutoff")
+    os.makedirs(out_dir, exist_ok=True)
+    journal = CropJournal(os.path.join(out_dir, JOURNAL_NAME))
+    if journal.skipped:
+        print(f"⚠️ {skipped_message(journal.path, journal.skipped)}")
+
+    failures = []
+    total = len(image_files)
+    tiles = 0
+
+    def report(done, image_path, saved, n_boxes, error):
+        nonlocal tiles
+        name = os.path.basename(image_path)
+        if error:
+            failures.append((image_path, error))
+            print(f"❌ [{done}/{total}] 分块失败：{name} | {error}")
+            return
+        # 日志只在父进程写，子进程只负责裁剪和保存
+        if not dry_run:
+            for idx, box in saved:
+                journal.record_crop(name, idx, box)
+        tiles += len(saved)
+        print(f"✅ [{done}/{total}] {name}: 保留 {len(saved)}/{n_boxes} 块")
+
+    args = [(path, out_dir, journal.next_index(os.path.basename(path)), npy_dir, size, stride,
+             min_foreground, use_masks, dry_run, annotate) for path in image_files]
+    try:
+        if workers <= 1 or total <= 1:
+            for done, a in enumerate(args, 1):
+                report(done, *tile_one_image(*a))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [pool.submit(tile_one_image, *a) for a in args]
+                for done, future in enumerate(as_completed(futures), 1):
+                    report(done, *future.result())
+    finally:
+        journal.close()
+
+    print(f"\n🎉 完成：{total} 张图片，{'将生成' if dry_run else '已保存'} {tiles} 块")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="滑窗自动分块（沿用 cutoff 目录和 _cut_ 命名）")
+    parser.add_argument("folder", help="图片文件夹")
+    parser.add_argument("--npy-dir", default=None, help="Cellpose _seg.npy 所在目录（默认在图片同目录中查找）")
+    parser.add_argument("--size", type=int, default=CROP_W, help="块边长")
+    parser.add_argument("--stride", type=int, default=STRIDE)
+    parser.add_argument("--min-foreground", type=float, default=MIN_FOREGROUND,
+                        help="灰度前景比例下限，设为 0 关闭灰度过滤")
+    parser.add_argument("--no-masks", action="store_true", help="不使用 masks 的实例密度过滤")
+    parser.add_argument("--workers", type=int, default=NUM_WORKERS)
+    parser.add_argument("--dry-run", action="store_true", help="只统计，不保存")
+    parser.add_argument("--with-masks", action="store_true", help="同时输出分块的 _seg.npy")
+    parser.add_argument("--with-labels", action="store_true", help="同时输出分块的 YOLO 标签")
+    parser.add_argument("--label-dir", default=None, help="整图 YOLO 标签目录（没有 masks 时使用）")
+    args = parser.parse_args()
+
+    annotate = None
+    if args.with_masks or args.with_labels:
+        annotate = {"label_dir": args.label_dir, "write_masks": args.with_masks, "write_labels": args.with_labels}
+
+    failures = tile_folder(args.folder, args.npy_dir, args.size, args.stride, args.min_foreground or None,
+                           not args.no_masks, args.workers, args.dry_run, annotate)
+    raise SystemExit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+import os
+import queue
+import threading
+from PIL import Image
+
+from run_stats import NULL_STATS
+
+WRITE_QUEUE_SIZE = 32  # 最多排队多少张待写入的裁剪图，满了之后 submit 抛出 queue.Full（界面先用 has_room 检查）
+WRITE_WORKERS = 2  # 后台写盘线程数（PNG 压缩在 PIL 内部会释放 GIL）
+
+
+def save_image_atomic(image, path):
+    """先写到同目录的临时文件再改名，中途退出不会留下半张图片"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    ext = os.path.splitext(path)[1].lower()
+    fmt = Image.registered_extensions().get(ext)
+    tmp_path = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.part")
+    try:
+        image.save(tmp_path, format=fmt)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class CropWriter:
+    """有界写入队列 + 后台线程池：Tk 线程只做 crop（内存拷贝），编码和写盘在后台完成"""
+
+    def __init__(self, workers=WRITE_WORKERS, maxsize=WRITE_QUEUE_SIZE, stats=NULL_STATS):
+        self.stats = stats  # 记录每次编码写盘的耗时（run_stats.RunStats）
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.errors = []  # 尚未提示过的失败 [(路径, 错误信息)]
+        self.last_error = None  # 最近一次失败 (路径, 错误信息)，显示在状态栏
+        self.written = 0
+        self.failed = 0
+        self.closed = False
+        self.threads = [threading.Thread(target=self._run, name=f"crop-writer-{i}", daemon=True)
+                        for i in range(workers)]
+        for t in self.threads:
+            t.start()
+
+    def submit(self, image, path):
+        """把一张已裁好的图片放入队列；队列满时不等待，抛出 queue.Full"""
+        self.submit_call(path, save_image_atomic, image, path)
+
+    def submit_call(self, path, func, *args):
+        """在后台执行任意写盘函数 func(*args)（如分块标注），path 用于状态和错误提示"""
+        if self.closed:
+            raise RuntimeError("CropWriter 已关闭")
+        with self.lock:
+            self.pending += 1
+        try:
+            self.queue.put_nowait((path, func, args))
+        except queue.Full:
+            with self.lock:
+                self.pending -= 1
+            raise
+
+    def has_room(self, n=1):
+        """队列还能再放 n 个任务：Tk 线程是唯一的提交方，检查通过后的 n 次 submit 不会失败"""
+        return self.queue.maxsize <= 0 or self.queue.qsize() + n <= self.queue.maxsize
+
+    def status(self):
+        """返回 (排队/写入中的数量, 累计失败数量)"""
+        with self.lock:
+            return self.pending, self.failed
+
+    def status_text(self):
+        pending, failed = self.status()
+        text = f"待写入: {pending}" if pending else "已全部保存"
+        if failed:
+            path, msg = self.last_error
+            text += f" | 失败: {failed}（最近: {os.path.basename(path)} {msg}）"
+        return text
+
+    def pop_errors(self):
+        """取出并清空新的失败记录，供界面提示"""
+        with self.lock:
+            errors, self.errors = self.errors, []
+        return errors
+
+    def flush(self):
+        """等待已提交的图片全部写完"""
+        self.queue.join()
+
+    def close(self):
+        """写完剩余图片后停止后台线程（退出程序前调用）"""
+        if self.closed:
+            return
+        self.closed = True
+        self.flush()
+        for _ in self.threads:
+            self.queue.put(None)
+        for t in self.threads:
+            t.join()
+
+    def _run(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                self.queue.task_done()
+                return
+
+            path, func, args = job
+            try:
+                with self.stats.time("save"):
+                    func(*args)
+                with self.lock:
+                    self.written += 1
+            except Exception as e:
+                with self.lock:
+                    self.failed += 1
+                    self.last_error = (path, f"{type(e).__name__}: {e}")
+                    self.errors.append(self.last_error)
+            finally:
+                with self.lock:
+                    self.pending -= 1
+                self.queue.task_done()
@@ -0,0 +1,245 @@
+"""缩略图总览窗口：网格显示文件夹内全部图片，单击跳转，可按裁剪状态筛选
+
+只为视口内（及上下 THUMB_MARGIN_ROWS 行）的格子创建画布对象和 PhotoImage，
+上万张图片滚动时画布上的对象数量不变；缩略图由 ThumbnailCache 在后台生成。
+主程序需要提供 image_files、current_index、journal 和 jump_to(index)。
+"""
+import os
+import tkinter as tk
+from PIL import ImageTk
+
+from thumbnail_cache import ThumbnailCache, THUMB_SIZE
+
+CELL_PAD = 8  # 格子之间的间距
+CAPTION_H = 16  # 文件名一行的高度
+THUMB_MARGIN_ROWS = 2  # 视口上下额外绘制/预取的行数
+THUMB_POLL_MS = 100  # 检查后台缩略图是否生成完成的间隔
+FILTERS = ("全部", "未裁剪", "已裁剪")
+
+
+class FilmstripWindow:
+    """缩略图总览窗口"""
+
+    def __init__(self, main_app, root):
+        self.main_app = main_app
+        self.window = tk.Toplevel(root)
+        self.window.title("缩略图总览")
+        self.window.geometry("720x800")
+
+        self.thumbs = ThumbnailCache(main_app.folder_path)
+        self.indices = []  # 按当前筛选条件显示的图片下标
+        self.cells = {}  # 位置 -> (PhotoImage 或 None, [画布对象])
+        self.columns = 1
+        self.highlighted = main_app.current_index  # 当前以蓝框标出的图片
+        self.cell_w = THUMB_SIZE + CELL_PAD
+        self.cell_h = THUMB_SIZE + CAPTION_H + CELL_PAD
+
+        self.create_widgets()
+        self.apply_filter()
+        self.poll_id = self.window.after(THUMB_POLL_MS, self.poll_thumbnails)
+        self.window.protocol("WM_DELETE_WINDOW", self.on_close)
+
+    def create_widgets(self):
+        top = tk.Frame(self.window)
+        top.pack(fill=tk.X, padx=5, pady=5)
+
+        self.filter_var = tk.StringVar(value=FILTERS[0])
+        tk.OptionMenu(top, self.filter_var, *FILTERS, command=lambda _: self.apply_filter()).pack(side=tk.LEFT)
+
+        tk.Label(top, text="跳转（序号或文件名）:").pack(side=tk.LEFT, padx=(10, 2))
+        self.jump_entry = tk.Entry(top, width=20)
+        self.jump_entry.pack(side=tk.LEFT)
+        self.jump_entry.bind("<Return>", lambda event: self.jump())
+        tk.Button(top, text="跳转", command=self.jump).pack(side=tk.LEFT, padx=5)
+
+        self.count_label = tk.Label(top, text="")
+        self.count_label.pack(side=tk.LEFT, padx=10)
+
+        frame = tk.Frame(self.window)
+        frame.pack(fill=tk.BOTH, expand=True)
+        self.vscroll = tk.Scrollbar(frame, orient=tk.VERTICAL)
+        self.canvas = tk.Canvas(frame, bg="#303030", yscrollcommand=self.vscroll.set)
+        self.vscroll.config(command=self.on_yscroll)
+        self.vscroll.pack(side=tk.RIGHT, fill=tk.Y)
+        self.canvas.pack(fill=tk.BOTH, expand=True)
+
+        self.canvas.bind("<Configure>", lambda event: self.layout())
+        self.canvas.bind("<Button-1>", self.on_click)
+        self.canvas.bind("<MouseWheel>", self.on_mouse_wheel)
+        self.canvas.bind("<Button-4>", self.on_mouse_wheel)
+        self.canvas.bind("<Button-5>", self.on_mouse_wheel)
+
+    # === 筛选与布局 ===
+    def is_cropped(self, index):
+        name = os.path.basename(self.main_app.image_files[index])
+        return self.main_app.journal.last_index(name) > 0
+
+    def apply_filter(self):
+        """按筛选条件重建显示列表（只查内存中的裁剪日志索引，不读文件）"""
+        mode = self.filter_var.get()
+        indices = range(len(self.main_app.image_files))
+        if mode == "未裁剪":
+            indices = [i for i in indices if not self.is_cropped(i)]
+        elif mode == "已裁剪":
+            indices = [i for i in indices if self.is_cropped(i)]
+        self.indices = list(indices)
+        self.count_label.config(text=f"{len(self.indices)}/{len(self.main_app.image_files)} 张")
+        self.layout()
+
+    def layout(self):
+        """按窗口宽度重新计算列数，格子全部重画"""
+        width = max(self.canvas.winfo_width(), self.cell_w)
+        self.columns = max(width // self.cell_w, 1)
+        rows = (len(self.indices) + self.columns - 1) // self.columns
+        self.canvas.config(scrollregion=(0, 0, self.columns * self.cell_w, max(rows * self.cell_h, 1)))
+        self.clear_cells()
+        self.render()
+
+    def clear_cells(self):
+        self.canvas.delete("cell")
+        self.cells = {}
+
+    def visible_positions(self, margin_rows=THUMB_MARGIN_ROWS):
+        """视口内（含上下 margin_rows 行）的格子位置范围"""
+        y0 = self.canvas.canvasy(0)
+        y1 = y0 + max(self.canvas.winfo_height(), 1)
+        row0 = max(int(y0 // self.cell_h) - margin_rows, 0)
+        row1 = int(y1 // self.cell_h) + margin_rows
+        return range(row0 * self.columns, min((row1 + 1) * self.columns, len(self.indices)))
+
+    def render(self):
+        """补画视口内缺失的格子，删除已移出视口的格子，并请求视口附近的缩略图"""
+        wanted = self.visible_positions()
+        for pos in list(self.cells):
+            if pos not in wanted:
+                for item in self.cells.pop(pos)[1]:
+                    self.canvas.delete(item)
+        for pos in wanted:
+            if pos not in self.cells:
+                self.draw_cell(pos)
+
+        # 先请求视口内的，再请求上下预取的
+        inner = self.visible_positions(0)
+        order = list(inner) + [p for p in wanted if p not in inner]
+        self.thumbs.request([self.main_app.image_files[self.indices[p]] for p in order])
+
+    def draw_cell(self, pos):
+        index = self.indices[pos]
+        path = self.main_app.image_files[index]
+        x = (pos % self.columns) * self.cell_w + CELL_PAD // 2
+        y = (pos // self.columns) * self.cell_h + CELL_PAD // 2
+
+        if index == self.highlighted:
+            outline = "#3399ff"
+        elif self.is_cropped(index):
+            outline = "#33cc33"
+        else:
+            outline = "#606060"
+        items = [self.canvas.create_rectangle(x - 2, y - 2, x + THUMB_SIZE + 2, y + THUMB_SIZE + 2,
+                                              outline=outline, width=2, tags="cell")]
+
+        photo = None
+        thumb = self.thumbs.get(path)
+        if thumb is not None:
+            photo = ImageTk.PhotoImage(thumb)
+            items.append(self.canvas.create_image(x + THUMB_SIZE // 2, y + THUMB_SIZE // 2,
+                                                  image=photo, tags="cell"))
+        elif self.thumbs.error(path) is not None:
+            items.append(self.canvas.create_text(x + THUMB_SIZE // 2, y + THUMB_SIZE // 2, text="无法读取",
+                                                 fill="red", tags="cell"))
+
+        name = os.path.basename(path)
+        if len(name) > 18:
+            name = name[:8] + "…" + name[-9:]
+        items.append(self.canvas.create_text(x + THUMB_SIZE // 2, y + THUMB_SIZE + CAPTION_H // 2 + 2,
+                                             text=f"{index + 1}. {name}", fill="white",
+                                             font=("Arial", 8), tags="cell"))
+        self.cells[pos] = (photo, items)
+
+    def redraw_cell(self, pos):
+        if pos in self.cells:
+            for item in self.cells.pop(pos)[1]:
+                self.canvas.delete(item)
+            self.draw_cell(pos)
+
+    def poll_thumbnails(self):
+        """把后台生成好的缩略图画到仍在视口内的格子上"""
+        ready = set(self.thumbs.pop_ready())
+        if ready:
+            for pos, (photo, _) in list(self.cells.items()):
+                if photo is None and self.main_app.image_files[self.indices[pos]] in ready:
+                    self.redraw_cell(pos)
+        self.poll_id = self.window.after(THUMB_POLL_MS, self.poll_thumbnails)
+
+    # === 交互 ===
+    def on_yscroll(self, *args):
+        self.canvas.yview(*args)
+        self.render()
+
+    def on_mouse_wheel(self, event):
+        if event.num == 4 or event.delta > 0:
+            self.canvas.yview_scroll(-3, "units")
+        else:
+            self.canvas.yview_scroll(3, "units")
+        self.render()
+
+    def position_at(self, x, y):
+        col = int(self.canvas.canvasx(x) // self.cell_w)
+        row = int(self.canvas.canvasy(y) // self.cell_h)
+        if col >= self.columns:
+            return None
+        pos = row * self.columns + col
+        return pos if 0 <= pos < len(self.indices) else None
+
+    def on_click(self, event):
+        pos = self.position_at(event.x, event.y)
+        if pos is not None:
+            self.main_app.jump_to(self.indices[pos])
+
+    def jump(self):
+        """按序号（从 1 开始）或文件名片段跳转"""
+        text = self.jump_entry.get().strip()
+        if not text:
+            return
+        files = self.main_app.image_files
+        if text.isdigit():
+            index = int(text) - 1
+            if not 0 <= index < len(files):
+                self.count_label.config(text=f"序号超出范围 1-{len(files)}")
+                return
+        else:
+            start = self.main_app.current_index + 1
+            order = list(range(start, len(files))) + list(range(start))
+            index = next((i for i in order if text.lower() in os.path.basename(files[i]).lower()), None)
+            if index is None:
+                self.count_label.config(text=f"没有找到 {text}")
+                return
+        self.main_app.jump_to(index)
+
+    def on_image_changed(self):
+        """主窗口切换图片后调用：更新前后两张的边框，并把当前图片滚动到视口内"""
+        old, self.highlighted = self.highlighted, self.main_app.current_index
+        if self.filter_var.get() != FILTERS[0]:
+            self.apply_filter()  # 上一张的裁剪状态可能变了
+        else:
+            for pos in list(self.cells):
+                if self.indices[pos] in (old, self.highlighted):
+                    self.redraw_cell(pos)
+        self.scroll_to(self.highlighted)
+
+    def scroll_to(self, index):
+        if index not in self.indices:
+            return
+        row = self.indices.index(index) // self.columns
+        y0 = self.canvas.canvasy(0)
+        height = max(self.canvas.winfo_height(), 1)
+        if row * self.cell_h < y0 or (row + 1) * self.cell_h > y0 + height:
+            total = max(((len(self.indices) + self.columns - 1) // self.columns) * self.cell_h, 1)
+            self.canvas.yview_moveto(max(row * self.cell_h - height // 3, 0) / total)
+            self.render()
+
+    def on_close(self):
+        self.window.after_cancel(self.poll_id)
+        self.thumbs.shutdown()
+        self.main_app.filmstrip = None
+        self.window.destroy()
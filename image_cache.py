@@ -0,0 +1,166 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from large_image import open_image, fit_display
+from run_stats import NULL_STATS
+
+PREFETCH_AHEAD = 2  # 预取当前图片前后各 N 张
+PREFETCH_WORKERS = 2  # 后台解码线程数
+CACHE_BYTES = 1024 * 1024 * 1024  # 解码缓存上限（按像素字节估算）
+
+
+def fit_size(img_w, img_h, view_w, view_h, zoom=1.0):
+    """按窗口大小等比缩放后的显示尺寸，返回 (缩放比例, 宽, 高)"""
+    ratio = min(view_w / img_w, view_h / img_h) * zoom
+    return ratio, int(img_w * ratio), int(img_h * ratio)
+
+
+def image_nbytes(img):
+    nbytes = getattr(img, "cache_nbytes", None)  # 内存映射的大图不占解码内存
+    if nbytes is not None:
+        return nbytes
+    return img.width * img.height * len(img.getbands())
+
+
+def decode_image(path, view_size, stats=NULL_STATS):
+    """后台线程执行：完整解码原图（超大图为内存映射），并生成适应窗口的 LANCZOS 显示图（不接触 Tk）"""
+    with stats.time("decode"):
+        img = open_image(path)
+        img.load()
+    _, w, h = fit_size(img.width, img.height, *view_size)
+    with stats.time("resize"):
+        return img, fit_display(img, w, h)
+
+
+class _Entry:
+    def __init__(self, original):
+        self.original = original
+        self.displays = {}  # view_size -> 显示图
+
+    @property
+    def nbytes(self):
+        return image_nbytes(self.original) + sum(image_nbytes(d) for d in self.displays.values())
+
+
+class ImagePrefetcher:
+    """线程池预取 + 按内存淘汰的 LRU 解码缓存
+
+    只在后台线程里做 PIL 解码和缩放，返回 PIL Image；PhotoImage 由调用方在 Tk 主线程创建。
+    主窗口和参考图窗口共用一个实例（共用解码线程和内存上限），用 owner 区分各自当前显示的图片和预取列表。
+    """
+
+    def __init__(self, workers=PREFETCH_WORKERS, max_bytes=CACHE_BYTES, stats=NULL_STATS):
+        self.max_bytes = max_bytes
+        self.stats = stats  # 记录解码/缩放耗时（run_stats.RunStats）
+        self.cache = OrderedDict()  # path -> _Entry，末尾为最近使用
+        self.pending = {}  # path -> Future
+        self.current = {}  # owner -> 当前显示的图片，不参与淘汰
+        self.wanted = {}  # owner -> 最近一次预取的图片，不再需要的排队任务会被取消
+        self.failed = {}  # path -> 后台解码抛出的异常，由 peek 交给调用方
+        self.lock = threading.Lock()
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+
+    def get(self, path, view_size, owner="main"):
+        """取 (原图, 显示图)；未命中时同步等待解码"""
+        view_size = tuple(view_size)
+        with self.lock:
+            self.current[owner] = path
+            entry = self.cache.get(path)
+            future = self.pending.get(path) if entry is None else None
+            if entry is not None:
+                self.cache.move_to_end(path)
+
+        if entry is None:
+            if future is None:
+                future = self._submit(path, view_size)
+            future.result()
+            with self.lock:
+                entry = self.cache.get(path)
+            if entry is None:  # 刚解码就被淘汰（单张超出缓存上限）
+                original, display = decode_image(path, view_size, self.stats)
+                return original, display
+
+        display = entry.displays.get(view_size)
+        if display is None:
+            # 窗口尺寸变了：从已解码的原图重新生成显示图
+            _, w, h = fit_size(entry.original.width, entry.original.height, *view_size)
+            with self.stats.time("resize"):
+                display = fit_display(entry.original, w, h)
+            with self.lock:
+                entry.displays = {view_size: display}
+                self._evict(keep=path)
+        return entry.original, display
+
+    def peek(self, path, view_size, owner="main"):
+        """不等待解码：已缓存时返回 (原图, 显示图)，否则提交后台解码并返回 None（调用方稍后再取）
+
+        后台解码失败时抛出该异常（只抛一次，之后再 peek 会重新解码）。
+        """
+        view_size = tuple(view_size)
+        with self.lock:
+            self.current[owner] = path
+            cached = path in self.cache
+            error = self.failed.pop(path, None) if path not in self.pending else None
+        if error is not None:
+            raise error
+        if cached:
+            return self.get(path, view_size, owner)
+        self._submit(path, view_size)
+        return None
+
+    def prefetch(self, paths, view_size, owner="main"):
+        """后台预取一组图片（已缓存或正在解码的跳过），并取消该 owner 上一次预取中已不再需要、还没开始的任务"""
+        view_size = tuple(view_size)
+        with self.lock:
+            keep = set(paths) | set(self.current.values())
+            for other, wanted in self.wanted.items():
+                if other != owner:
+                    keep |= wanted
+            for path in self.wanted.get(owner, set()) - keep:
+                future = self.pending.get(path)
+                if future is not None and future.cancel():
+                    del self.pending[path]
+            self.wanted[owner] = set(paths)
+        for path in paths:
+            with self.lock:
+                if path in self.cache or path in self.pending:
+                    continue
+            self._submit(path, view_size)
+
+    def _submit(self, path, view_size):
+        with self.lock:
+            future = self.pending.get(path)
+            if future is None:
+                future = self.pool.submit(self._load, path, view_size)
+                self.pending[path] = future
+        return future
+
+    def _load(self, path, view_size):
+        try:
+            original, display = decode_image(path, view_size, self.stats)
+            entry = _Entry(original)
+            entry.displays[view_size] = display
+            with self.lock:
+                self.cache[path] = entry
+                self._evict(keep=path)
+        except Exception as e:
+            with self.lock:
+                self.failed[path] = e
+            raise
+        finally:
+            with self.lock:
+                self.pending.pop(path, None)
+
+    def _evict(self, keep=None):
+        """超出内存上限时从最久未使用的开始淘汰（需持有锁）"""
+        total = sum(e.nbytes for e in self.cache.values())
+        for path in list(self.cache):
+            if total <= self.max_bytes:
+                break
+            if path == keep or path in self.current.values():
+                continue
+            total -= self.cache.pop(path).nbytes
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
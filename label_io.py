@@ -0,0 +1,46 @@
+import os
+import tempfile
+import numpy as np
+
+# mkstemp 创建的文件权限为 0600，替换前改回与 open() 一致的默认权限
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def atomic_write_text(path, text):
+    """先写入同目录下的临时文件再整体替换，避免并行/中断时留下半截标签"""
+    dir_name = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp_", suffix=".txt", dir=dir_name)
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+        os.chmod(tmp_path, 0o666 & ~_UMASK)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def format_yolo_seg(polygons, w, h, cls=0):
+    """将多边形列表整体格式化为 YOLO seg 文本（每行 "cls x1 y1 x2 y2 ..."）
+
+    polygons 为 (N, 2) 或 (N, 1, 2) 的像素坐标数组列表，cls 可以是单个类别或逐多边形的类别。
+    坐标一次性用 NumPy 归一化，整个文件只做一次 % 格式化，
+    输出与逐点 f"{x / w:.6f}" 拼接完全一致。
+    """
+    if not len(polygons):
+        return ""
+
+    polygons = [np.asarray(p).reshape(-1, 2) for p in polygons]
+    coords = np.concatenate(polygons).astype(np.float64)
+    coords /= (w, h)
+
+    classes = np.broadcast_to(np.asarray(cls), (len(polygons),)).tolist()
+    fmt = "".join(f"{c}" + " %.6f %.6f" * len(p) + "\n" for c, p in zip(classes, polygons))
+    return fmt % tuple(coords.ravel().tolist())
+
+
+def write_yolo_seg(path, polygons, w, h, cls=0):
+    """格式化后一次性原子写入标签文件"""
+    atomic_write_text(path, format_yolo_seg(polygons, w, h, cls))
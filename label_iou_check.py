@@ -0,0 +1,192 @@
+"""Cellpose masks 与生成的 YOLO 多边形之间的 IoU 回环校验
+
+把每个标签文件的多边形用 cv2.fillPoly 填回实例图，与原始 _seg.npy 中的 masks 比较：
+    - 每个多边形归属于与它重叠最多的原始实例（一个实例的多个轮廓会合并）
+    - 输出逐实例 IoU、整图前景 IoU，以及没有多边形对应的实例，按原因分为三类：
+        dropped_small_area  面积 < min_area，转换时直接丢弃
+        dropped_few_points  对该实例重跑转换的简化和 min_points 过滤后没有多边形留下
+        unmatched           转换应当产出多边形，但标签里没有多边形归属于它（如紧挨的细胞被邻居的多边形“抢走”，或标签已被修改）
+    过滤参数默认取标签目录下转换清单里记录的参数，与实际转换时一致。
+
+用法：
+    python label_iou_check.py --npy-dir dataset/cellpose_npy1219 --label-dir dataset/labels122203 --report iou.json
+"""
+import os
+import json
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+from seg_io import load_masks
+from manifest import MANIFEST_NAME
+from seg_instances import find_instances, rasterize_polygons, instance_iou
+from label_parse import read_yolo_labels, split_polygons
+import cellpose標簽轉換 as converter
+
+LOW_IOU = 0.5  # 保留下来的实例 IoU 低于该值时标记
+MIN_IMAGE_IOU = 0.9  # 整图前景 IoU 低于该值时判为不通过
+
+
+def match_polygons(masks, polygons):
+    """把多边形填成索引图，并按最大重叠把每个多边形映射到原始实例 id，返回预测实例图"""
+    if not polygons:
+        return np.zeros(masks.shape, dtype=np.int64)
+
+    index_map = rasterize_polygons(polygons, np.arange(1, len(polygons) + 1), masks.shape)
+
+    gt = masks.ravel().astype(np.int64)
+    pred = index_map.ravel().astype(np.int64)
+    both = (gt > 0) & (pred > 0)
+
+    # (多边形, 实例) 成对计数，每个多边形取重叠像素最多的实例
+    pairs, counts = np.unique(np.stack([pred[both], gt[both]]), axis=1, return_counts=True)
+    assign = np.zeros(len(polygons) + 1, dtype=np.int64)
+    order = np.lexsort((counts, pairs[0]))
+    pairs = pairs[:, order]
+    last = np.r_[pairs[0, 1:] != pairs[0, :-1], True] if pairs.size else np.zeros(0, bool)
+    assign[pairs[0, last]] = pairs[1, last]
+
+    return assign[index_map]
+
+
+def converter_params(label_dir, **overrides):
+    """标签目录的转换清单里记录的转换参数（没有清单时用默认参数），overrides 中不为 None 的项覆盖之"""
+    params = converter.convert_params()
+    try:
+        with open(os.path.join(label_dir, MANIFEST_NAME), "r", encoding="utf-8") as f:
+            params.update(json.load(f).get("params") or {})
+    except (OSError, ValueError):
+        pass
+    params.update({k: v for k, v in overrides.items() if v is not None})
+    return params
+
+
+def classify_unmatched(masks, ids, areas, params):
+    """没有多边形对应的实例按原因分类，返回 (面积过小, 点数不足, 未匹配) 三个 id 列表
+
+    面积之外的原因通过对这些实例重跑转换的简化和 min_points 过滤来判断；轮廓只在各实例自己的
+    ROI 内提取，与其他实例无关，所以只保留这些实例的像素即可。
+    """
+    small = [int(i) for i, a in zip(ids, areas) if a < params["min_area"]]
+    rest = np.asarray([i for i, a in zip(ids, areas) if a >= params["min_area"]], dtype=masks.dtype)
+    if not len(rest):
+        return small, [], []
+    subset = np.where(np.isin(masks, rest), masks, 0)
+    produced = {int(i) for i, _ in converter.instance_polygons(subset, params)}
+    few_points = [int(i) for i in rest if int(i) not in produced]
+    unmatched = [int(i) for i in rest if int(i) in produced]
+    return small, few_points, unmatched
+
+
+def validate_pair(npy_path, label_path, params=None, low_iou=LOW_IOU):
+    """校验一对 _seg.npy / .txt，返回结果字典（子进程入口）；params 为转换参数，用于判断实例被丢弃的原因"""
+    params = params or converter.convert_params()
+    result = {"npy": os.path.basename(npy_path), "label": os.path.basename(label_path)}
+    try:
+        masks = np.asarray(load_masks(npy_path))
+        h, w = masks.shape
+
+        if not os.path.exists(label_path):
+            result["error"] = "没有对应的标签"
+            return result
+        labels = read_yolo_labels(label_path)
+        coords = labels.coords.astype(np.float64) * (w, h)
+        polygons = split_polygons(coords, labels.offsets)
+        pred = match_polygons(masks, polygons)
+
+        ids, iou = instance_iou(masks, pred)
+        gt_ids, _, areas = find_instances(masks)
+        area_of = dict(zip(gt_ids.tolist(), areas.tolist()))
+
+        # 没有任何多边形对应的实例：按转换的过滤条件判断原因
+        kept = np.isin(ids, np.unique(pred))
+        lost = ids[~kept]
+        dropped_small, dropped_points, unmatched = classify_unmatched(
+            masks, lost, [area_of[int(i)] for i in lost], params)
+        low = [[int(i), round(float(v), 4)] for i, v in zip(ids[kept], iou[kept]) if v < low_iou]
+
+        fg_gt, fg_pred = masks > 0, pred > 0
+        union = np.count_nonzero(fg_gt | fg_pred)
+        result.update({
+            "instances": int(len(ids)),
+            "polygons": len(polygons),
+            "image_iou": float(np.count_nonzero(fg_gt & fg_pred) / union) if union else 1.0,
+            "mean_instance_iou": float(iou.mean()) if iou.size else 1.0,
+            "mean_kept_iou": float(iou[kept].mean()) if kept.any() else 1.0,
+            "dropped_small_area": dropped_small,
+            "dropped_few_points": dropped_points,
+            "unmatched": unmatched,
+            "low_iou": low,
+        })
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    return result
+
+
+def validate_dir(npy_dir, label_dir, workers=converter.NUM_WORKERS, params=None,
+                 low_iou=LOW_IOU, min_image_iou=MIN_IMAGE_IOU):
+    """并行校验整个目录，返回报告字典；params 默认取标签目录转换清单里的参数"""
+    params = params or converter_params(label_dir)
+    jobs = converter.collect_jobs(npy_dir, label_dir)
+    npy_paths = [j[0] for j in jobs]
+    label_paths = [j[1] for j in jobs]
+
+    if workers <= 1 or len(jobs) <= 1:
+        results = [validate_pair(n, l, params, low_iou) for n, l in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(
+                validate_pair, npy_paths, label_paths,
+                [params] * len(jobs), [low_iou] * len(jobs),
+                chunksize=max(1, len(jobs) // (workers * 8))
+            ))
+
+    ok = [r for r in results if "error" not in r]
+    failed_images = [r["npy"] for r in ok if r["image_iou"] < min_image_iou]
+    summary = {
+        "files": len(results),
+        "errors": len(results) - len(ok),
+        "instances": sum(r["instances"] for r in ok),
+        "dropped_small_area": sum(len(r["dropped_small_area"]) for r in ok),
+        "dropped_few_points": sum(len(r["dropped_few_points"]) for r in ok),
+        "unmatched": sum(len(r["unmatched"]) for r in ok),
+        "low_iou_instances": sum(len(r["low_iou"]) for r in ok),
+        "mean_image_iou": float(np.mean([r["image_iou"] for r in ok])) if ok else 0.0,
+        "mean_instance_iou": float(np.mean([r["mean_instance_iou"] for r in ok])) if ok else 0.0,
+        "images_below_min_iou": failed_images,
+    }
+    return {"summary": summary, "files": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="masks ↔ YOLO 多边形 IoU 回环校验")
+    parser.add_argument("--npy-dir", default=converter.NPY_DIR)
+    parser.add_argument("--label-dir", default=converter.LABEL_DIR)
+    parser.add_argument("--workers", type=int, default=converter.NUM_WORKERS)
+    parser.add_argument("--min-area", type=int, default=None, help="覆盖转换清单中的 min_area")
+    parser.add_argument("--min-points", type=int, default=None, help="覆盖转换清单中的 min_points")
+    parser.add_argument("--low-iou", type=float, default=LOW_IOU)
+    parser.add_argument("--min-image-iou", type=float, default=MIN_IMAGE_IOU)
+    parser.add_argument("--report", default=None, help="报告 JSON 路径")
+    args = parser.parse_args()
+
+    params = converter_params(args.label_dir, min_area=args.min_area, min_points=args.min_points)
+    report = validate_dir(args.npy_dir, args.label_dir, args.workers, params, args.low_iou, args.min_image_iou)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=1)
+
+    s = report["summary"]
+    print(f"文件 {s['files']}（错误 {s['errors']}），实例 {s['instances']}，"
+          f"平均整图 IoU {s['mean_image_iou']:.4f}，平均实例 IoU {s['mean_instance_iou']:.4f}")
+    print(f"过滤丢弃：面积过小 {s['dropped_small_area']}，点数不足 {s['dropped_few_points']}；"
+          f"未匹配 {s['unmatched']}；"
+          f"低 IoU 实例 {s['low_iou_instances']}")
+    for name in s["images_below_min_iou"]:
+        print(f"❌ 整图 IoU 低于 {args.min_image_iou}: {name}")
+
+    raise SystemExit(1 if s["images_below_min_iou"] or s["errors"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""YOLO seg 标签的批量解析：整个文件一次解析为 NumPy 数组，检验脚本和下游工具共用
+
+支持两种格式，按文件自动识别：
+    poly   cls x1 y1 x2 y2 ...               （cellpose標簽轉換.py 的输出）
+    bbox   cls cx cy bw bh x1 y1 x2 y2 ...   （带外接框的格式，前四个数与多边形的外接框一致）
+
+多边形是不等长的，统一用 扁平坐标 + 偏移 表示（与 label_store 的打包格式一致）：
+    coords   (P, 2)    所有多边形的归一化坐标，依次排列
+    offsets  (M + 1,)  第 i 个多边形为 coords[offsets[i]:offsets[i + 1]]
+
+整个文件只做一次 split 和一次 float64 转换，行号由字节数组上的空白/换行位置向量化算出，
+逐行合法性检查和多边形切分也都是数组操作；有非数字字段时退回逐行解析，并把无法解析的行记入 bad。
+"""
+from collections import namedtuple
+import numpy as np
+
+LAYOUT_POLY = "poly"
+LAYOUT_BBOX = "bbox"
+LAYOUTS = ("auto", LAYOUT_POLY, LAYOUT_BBOX)
+BBOX_TOL = 0.01  # 前四个数与多边形外接框相差不超过该值（归一化坐标）时视为 bbox 格式
+DETECT_LINES = 20  # 自动识别格式时检查的行数
+
+YoloLabels = namedtuple("YoloLabels", "coords offsets cls lines boxes layout bad")
+YoloLabels.__doc__ = """解析结果
+    coords  (P, 2) 归一化坐标        offsets (M + 1,) 多边形起止下标
+    cls     (M,) int32 类别          lines   (M,) 每个多边形所在的行号（从 1 开始）
+    boxes   (M, 4) [cx, cy, bw, bh]，只有 bbox 格式时有，否则为 None
+    layout  识别出的格式              bad     无法使用的行 [(行号, 类型, 说明)]，类型为 malformed / degenerate
+"""
+
+
+def _numbers_fast(buf):
+    """整个文件一次转为 float64，并由空白位置算出每个数所在的行，返回 (值, 行号从 0 开始)；有非数字字段时返回 None"""
+    try:
+        values = np.array(buf.split(), dtype=np.float64)
+    except ValueError:
+        return None
+
+    a = np.frombuffer(buf, dtype=np.uint8)
+    is_space = a <= ord(" ")  # 空格、换行、制表符等
+    starts = np.flatnonzero(is_space[:-1] & ~is_space[1:]) + 1
+    if len(a) and not is_space[0]:
+        starts = np.r_[0, starts]
+    if len(starts) != len(values):  # 含有其他控制字符，交给逐行解析
+        return None
+    return values, np.searchsorted(np.flatnonzero(a == ord("\n")), starts)
+
+
+def _numbers_by_line(text):
+    """逐行解析（兜底），返回 (值, 所在行号从 0 开始, 无法解析的行)"""
+    values, line_of, bad = [], [], []
+    for i, line in enumerate(text.splitlines()):
+        parts = line.split()
+        try:
+            row = [float(v) for v in parts]
+        except ValueError:
+            bad.append((i + 1, "malformed", "包含非数字字段"))
+            continue
+        values.extend(row)
+        line_of.extend([i] * len(row))
+    return np.array(values, dtype=np.float64), np.array(line_of, dtype=np.int64), bad
+
+
+def _looks_like_bbox(row):
+    """row 为一行的数（含类别），判断前四个数是否为后面多边形的外接框"""
+    if len(row) < 11 or len(row) % 2 == 0:
+        return False
+    cx, cy, bw, bh = row[1:5]
+    pts = np.asarray(row[5:]).reshape(-1, 2)
+    lo, hi = pts.min(axis=0), pts.max(axis=0)
+    expected = np.r_[(lo + hi) / 2, hi - lo]
+    return bool(np.abs(expected - (cx, cy, bw, bh)).max() <= BBOX_TOL)
+
+
+def detect_layout(values, line_start, counts):
+    """按前 DETECT_LINES 个非空行识别格式：都能解释为 bbox 格式时为 bbox，否则为 poly"""
+    sample = np.flatnonzero(counts)[:DETECT_LINES]
+    if not len(sample):
+        return LAYOUT_POLY
+    for i in sample:
+        if not _looks_like_bbox(values[line_start[i]:line_start[i] + counts[i]]):
+            return LAYOUT_POLY
+    return LAYOUT_BBOX
+
+
+def parse_yolo_labels(text, layout="auto", dtype=np.float32):
+    """解析一个标签文件的内容（str 或 bytes），返回 YoloLabels"""
+    if layout not in LAYOUTS:
+        raise ValueError(f"未知的标签格式 {layout}，可选 {LAYOUTS}")
+    buf = text.encode("utf-8") if isinstance(text, str) else bytes(text)
+
+    bad = []
+    parsed = _numbers_fast(buf)
+    if parsed is None:
+        values, line_of, bad = _numbers_by_line(buf.decode("utf-8", errors="replace"))
+    else:
+        values, line_of = parsed
+
+    n_lines = int(line_of[-1]) + 1 if len(line_of) else 0
+    counts = np.bincount(line_of, minlength=n_lines)
+    line_start = np.zeros(n_lines + 1, dtype=np.int64)
+    np.cumsum(counts, out=line_start[1:])
+
+    if layout == "auto":
+        layout = detect_layout(values, line_start, counts)
+    skip = 5 if layout == LAYOUT_BBOX else 1  # 每行多边形之前的数的个数
+
+    # 逐行合法性（全部向量化）：字段数、类别、点数
+    rows = np.flatnonzero(counts)
+    n_fields = counts[rows]
+    cls = values[line_start[rows]]
+    uneven = (n_fields - skip) % 2 == 1
+    bad_cls = ~uneven & ((cls < 0) | (cls != np.floor(cls)))
+    few = ~uneven & ~bad_cls & (n_fields - skip < 6)
+    valid = ~(uneven | bad_cls | few)
+
+    head = "1 + 2N" if skip == 1 else "5 + 2N"
+    for i in np.flatnonzero(uneven):
+        bad.append((int(rows[i]) + 1, "malformed", f"字段数 {n_fields[i]} 不是 {head}"))
+    for i in np.flatnonzero(bad_cls):
+        bad.append((int(rows[i]) + 1, "malformed", f"类别 {cls[i]} 不是非负整数"))
+    for i in np.flatnonzero(few):
+        bad.append((int(rows[i]) + 1, "degenerate", f"点数少于 3 个（共 {(n_fields[i] - skip) // 2} 个点）"))
+    bad.sort()
+
+    rows = rows[valid]
+    local = np.arange(len(values)) - line_start[line_of]
+    keep_line = np.zeros(n_lines, dtype=bool)
+    keep_line[rows] = True
+    in_poly = keep_line[line_of] & (local >= skip)
+
+    coords = values[in_poly].astype(dtype).reshape(-1, 2)
+    offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+    np.cumsum((counts[rows] - skip) // 2, out=offsets[1:])
+
+    boxes = None
+    if layout == LAYOUT_BBOX:
+        boxes = values[line_start[rows][:, None] + np.arange(1, 5)].astype(dtype)
+
+    return YoloLabels(coords, offsets, cls[valid].astype(np.int32), rows + 1, boxes, layout, bad)
+
+
+def read_yolo_labels(path, layout="auto", dtype=np.float32):
+    """以二进制读取标签文件并解析（不做文本解码）"""
+    with open(path, "rb") as f:
+        return parse_yolo_labels(f.read(), layout, dtype)
+
+
+def split_polygons(coords, offsets):
+    """扁平坐标 + 偏移 → 多边形列表（视图）"""
+    return [coords[a:b] for a, b in zip(offsets[:-1], offsets[1:])]
@@ -0,0 +1,330 @@
+"""标签复查：可前后翻页，后台预读后面几张的图片和标签并画好叠加图，结论写入只追加的复查日志
+
+按键（OpenCV 窗口）：
+    d / → / 空格   下一张            a / ←   上一张
+    y  通过         n  不通过         f  标记待议（打标记后自动跳到下一张）
+    u  撤销当前图片的结论             j  跳到下一张未复查的
+    ESC / q  退出（位置已记入日志，下次从这里继续）
+
+叠加图（读图 + 解析标签 + 画框）在后台线程里生成，按内存上限 LRU 缓存，翻回去看过的图片不再重画；
+状态栏（序号、结论）每次显示时在副本上绘制，打标记不会让缓存失效。
+
+复查日志每行一条事件（与裁剪日志相同的 JSONL 格式，见 crop_journal）：
+    {"op": "mark", "image": "a.png", "status": "accept" | "reject" | "flag", "time": ...}
+    {"op": "unmark", "image": "a.png", "time": ...}
+    {"op": "view", "image": "a.png", "time": ...}      退出时停在该图片（用于下次从停下的位置继续），翻页本身不写日志
+"""
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+
+from crop_journal import read_events, open_append
+from label_parse import read_yolo_labels, split_polygons
+
+REVIEW_NAME = "review_journal.jsonl"  # 默认位于标签目录（打包标签时位于 .ysp 旁边）
+REVIEW_AHEAD = 8  # 预读当前图片之后的张数
+REVIEW_BEHIND = 2  # 预读当前图片之前的张数（回看）
+REVIEW_WORKERS = 2  # 后台读图/画图线程数
+OVERLAY_CACHE_BYTES = 512 * 1024 * 1024  # 叠加图缓存上限
+DISPLAY_MAX_SIDE = 1600  # 长边超过该值的图片先缩小再画标签
+WINDOW_NAME = "YOLO Seg Label Check"
+
+STATUSES = ("accept", "reject", "flag")
+STATUS_KEYS = {"y": "accept", "n": "reject", "f": "flag"}
+STATUS_COLORS = {"accept": (0, 200, 0), "reject": (0, 0, 255), "flag": (0, 165, 255), None: (160, 160, 160)}
+KEY_LEFT = (2424832, 65361)  # waitKeyEx 的方向键：Windows / GTK
+KEY_RIGHT = (2555904, 65363)
+BAR_H = 28  # 状态栏高度
+
+
+def review_journal_path(label_dir, store_path=None):
+    if store_path:
+        return os.path.splitext(store_path)[0] + "_" + REVIEW_NAME
+    return os.path.join(label_dir, REVIEW_NAME)
+
+
+class ReviewJournal:
+    """复查结论和上次停下的位置，追加写入"""
+
+    def __init__(self, path):
+        self.path = path
+        self.status = {}  # 图片名 -> accept / reject / flag
+        self.last_image = None  # 最后一次翻到的图片
+        events, self.skipped = read_events(path)  # 损坏的行 [(行号, 内容)]
+        for event in events:
+            self._apply(event)
+        self.saved_image = self.last_image  # 日志中记录的位置，close 时与 last_image 不同才追加
+        self.file = None
+
+    def _apply(self, event):
+        image = event["image"]
+        if event["op"] == "mark":
+            self.status[image] = event["status"]
+        elif event["op"] == "unmark":
+            self.status.pop(image, None)
+        self.last_image = image
+
+    def _append(self, event):
+        if self.file is None:
+            self.file = open_append(self.path)
+        event["time"] = round(time.time(), 3)
+        self.file.write(json.dumps(event, ensure_ascii=False) + "\n")
+        self.file.flush()
+        self._apply(event)
+        self.saved_image = self.last_image
+
+    def get(self, image):
+        return self.status.get(image)
+
+    def mark(self, image, status):
+        if status not in STATUSES:
+            raise ValueError(f"未知的复查结论 {status}，可选 {STATUSES}")
+        self._append({"op": "mark", "image": image, "status": status})
+
+    def unmark(self, image):
+        if image in self.status:
+            self._append({"op": "unmark", "image": image})
+
+    def view(self, image):
+        """只在内存中记下位置，退出时写一次（翻页不再每次追加一行）"""
+        self.last_image = image
+
+    def counts(self):
+        counts = dict.fromkeys(STATUSES, 0)
+        for status in self.status.values():
+            counts[status] += 1
+        return counts
+
+    def close(self):
+        if self.last_image is not None and self.last_image != self.saved_image:
+            self._append({"op": "view", "image": self.last_image})
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def _shrink(img, max_side=DISPLAY_MAX_SIDE):
+    h, w = img.shape[:2]
+    ratio = max_side / max(h, w)
+    if ratio >= 1:
+        return img
+    return cv2.resize(img, (max(int(w * ratio), 1), max(int(h * ratio), 1)), interpolation=cv2.INTER_AREA)
+
+
+def _placeholder(text):
+    img = np.zeros((480, 640, 3), dtype=np.uint8)
+    cv2.putText(img, text, (20, 240), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0, 0, 255), 2)
+    return img
+
+
+def render_overlay(img_path, label_path, store=None):
+    """读图并画出外接框（绿）和多边形（红），返回 (叠加图, 提示信息列表)；在后台线程执行"""
+    messages = []
+    img = cv2.imread(img_path)
+    if img is None:
+        return _placeholder("unreadable image"), [f"[ERROR] Cannot read image: {img_path}"]
+    img = _shrink(img)
+    h, w = img.shape[:2]
+    base = os.path.splitext(os.path.basename(img_path))[0]
+
+    boxes = None
+    if store is not None:
+        # 打包文件中只有多边形（cls x1 y1 ...）
+        if base not in store:
+            messages.append(f"[WARN] No label for {os.path.basename(img_path)}")
+            cv2.putText(img, "no label", (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0, 0, 255), 2)
+            return img, messages
+        coords, offsets, _ = store.get(base)
+        coords = np.asarray(coords, dtype=np.float64)
+    else:
+        if not os.path.exists(label_path):
+            messages.append(f"[WARN] No label for {os.path.basename(img_path)}")
+            cv2.putText(img, "no label", (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0, 0, 255), 2)
+            return img, messages
+        # 两种格式（cls poly... / cls cx cy bw bh poly...）都能识别，整个文件一次解析
+        labels = read_yolo_labels(label_path, dtype=np.float64)
+        for line_no, _, msg in labels.bad:
+            messages.append(f"[ERROR] Invalid seg label: {label_path} (line {line_no}: {msg})")
+        coords, offsets = labels.coords, labels.offsets
+        if labels.boxes is not None:
+            centers, sizes = labels.boxes[:, :2] * (w, h), labels.boxes[:, 2:] * (w, h)
+            boxes = np.hstack([centers - sizes / 2, centers + sizes / 2])
+
+    coords = coords * (w, h)
+    # 没有外接框字段时由多边形计算
+    if boxes is None:
+        starts = offsets[:-1]
+        boxes = np.hstack([np.minimum.reduceat(coords, starts), np.maximum.reduceat(coords, starts)]) \
+            if len(starts) else np.zeros((0, 4))
+    for x1, y1, x2, y2 in boxes.astype(np.int32).tolist():
+        cv2.rectangle(img, (x1, y1), (x2, y2), (0, 255, 0), 2)
+
+    pts = [p.astype(np.int32).reshape((-1, 1, 2)) for p in split_polygons(coords, offsets)]
+    cv2.polylines(img, pts, isClosed=True, color=(0, 0, 255), thickness=2)
+    return img, messages
+
+
+class OverlayCache:
+    """线程池预读 + 按内存淘汰的 LRU 叠加图缓存（与 image_cache.ImagePrefetcher 相同的结构）"""
+
+    def __init__(self, render, workers=REVIEW_WORKERS, max_bytes=OVERLAY_CACHE_BYTES):
+        self.render = render  # key -> (叠加图, 提示信息)
+        self.max_bytes = max_bytes
+        self.cache = OrderedDict()  # key -> (叠加图, 提示信息)，末尾为最近使用
+        self.pending = {}  # key -> Future
+        self.current = None  # 当前显示的，不参与淘汰
+        self.lock = threading.Lock()
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="review")
+
+    def get(self, key):
+        """取叠加图；未命中时同步等待生成"""
+        with self.lock:
+            self.current = key
+            item = self.cache.get(key)
+            if item is not None:
+                self.cache.move_to_end(key)
+                return item
+            future = self.pending.get(key)
+            if future is None:
+                future = self.pending[key] = self.pool.submit(self._load, key)
+        return future.result()
+
+    def prefetch(self, keys):
+        """按优先级预读一组；不在本次列表中、尚未开始的旧请求取消（快速连续翻页时不排队）"""
+        wanted = set(keys)
+        with self.lock:
+            for key, future in list(self.pending.items()):
+                if key not in wanted and key != self.current and future.cancel():
+                    del self.pending[key]
+            for key in keys:
+                if key not in self.cache and key not in self.pending:
+                    self.pending[key] = self.pool.submit(self._load, key)
+
+    def _load(self, key):
+        try:
+            item = self.render(key)
+        except Exception as e:
+            item = (_placeholder("render error"), [f"[ERROR] {type(e).__name__}: {e}"])
+        with self.lock:
+            self.pending.pop(key, None)
+            self.cache[key] = item
+            self._evict(keep=key)
+        return item
+
+    def _evict(self, keep=None):
+        """超出内存上限时从最久未使用的开始淘汰（需持有锁）"""
+        total = sum(item[0].nbytes for item in self.cache.values())
+        for key in list(self.cache):
+            if total <= self.max_bytes:
+                break
+            if key == keep or key == self.current:
+                continue
+            total -= self.cache.pop(key)[0].nbytes
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+class ReviewSession:
+    """按文件名排序逐张复查，从日志中上次停下的图片继续"""
+
+    def __init__(self, img_dir, label_dir, journal_path, store=None, img_exts=(".jpg", ".png")):
+        self.img_dir = img_dir
+        self.label_dir = label_dir
+        self.store = store
+        self.names = sorted(f for f in os.listdir(img_dir) if f.lower().endswith(img_exts))
+        self.journal = ReviewJournal(journal_path)
+        if self.journal.skipped:
+            print(f"[WARN] Skipped {len(self.journal.skipped)} corrupt line(s) in {journal_path} "
+                  f"(first at line {self.journal.skipped[0][0]})")
+        self.overlays = OverlayCache(self.render)
+        self.shown = set()  # 已经打印过提示信息的图片
+        self.index = self.names.index(self.journal.last_image) if self.journal.last_image in self.names else 0
+
+    def render(self, index):
+        name = self.names[index]
+        label_path = os.path.join(self.label_dir, os.path.splitext(name)[0] + ".txt")
+        return render_overlay(os.path.join(self.img_dir, name), label_path, self.store)
+
+    def next_unreviewed(self):
+        n = len(self.names)
+        for step in range(1, n + 1):
+            i = (self.index + step) % n
+            if self.journal.get(self.names[i]) is None:
+                return i
+        return None
+
+    def show(self):
+        name = self.names[self.index]
+        overlay, messages = self.overlays.get(self.index)
+        if name not in self.shown:
+            self.shown.add(name)
+            for msg in messages:
+                print(msg)
+
+        ahead = range(self.index + 1, min(self.index + 1 + REVIEW_AHEAD, len(self.names)))
+        behind = range(self.index - 1, max(self.index - 1 - REVIEW_BEHIND, -1), -1)
+        self.overlays.prefetch(list(ahead) + list(behind))
+
+        # 状态栏画在副本上（cv2.putText 不支持中文，文件名放在窗口标题里）
+        status = self.journal.get(name)
+        frame = cv2.copyMakeBorder(overlay, BAR_H, 0, 0, 0, cv2.BORDER_CONSTANT, value=(40, 40, 40))
+        counts = self.journal.counts()
+        text = (f"{self.index + 1}/{len(self.names)}  [{status or 'unreviewed'}]  "
+                f"ok {counts['accept']}  bad {counts['reject']}  flag {counts['flag']}")
+        cv2.putText(frame, text, (8, BAR_H - 9), cv2.FONT_HERSHEY_SIMPLEX, 0.6, STATUS_COLORS[status], 1)
+        cv2.imshow(WINDOW_NAME, frame)
+        cv2.setWindowTitle(WINDOW_NAME, f"{WINDOW_NAME} - {name}")
+        self.journal.view(name)
+
+    def run(self):
+        if not self.names:
+            print(f"[WARN] No images in {self.img_dir}")
+            return
+        cv2.namedWindow(WINDOW_NAME, cv2.WINDOW_NORMAL)
+        try:
+            while True:
+                self.show()
+                key = cv2.waitKeyEx(0)
+                if key == -1 or cv2.getWindowProperty(WINDOW_NAME, cv2.WND_PROP_VISIBLE) < 1:
+                    break  # 窗口被关闭
+                if key in KEY_LEFT:
+                    char = "a"
+                elif key in KEY_RIGHT:
+                    char = "d"
+                else:
+                    char = chr(key & 0xFF).lower()
+
+                name = self.names[self.index]
+                if key == 27 or char == "q":
+                    break
+                elif char in ("d", " "):
+                    self.index = min(self.index + 1, len(self.names) - 1)
+                elif char == "a":
+                    self.index = max(self.index - 1, 0)
+                elif char in STATUS_KEYS:
+                    self.journal.mark(name, STATUS_KEYS[char])
+                    self.index = min(self.index + 1, len(self.names) - 1)
+                elif char == "u":
+                    self.journal.unmark(name)
+                elif char == "j":
+                    index = self.next_unreviewed()
+                    if index is None:
+                        print("[INFO] All images reviewed")
+                    else:
+                        self.index = index
+        finally:
+            self.close()
+
+    def close(self):
+        self.overlays.shutdown()
+        self.journal.close()
+        cv2.destroyAllWindows()
+        counts = self.journal.counts()
+        print(f"[INFO] Reviewed {sum(counts.values())}/{len(self.names)}: {counts} "
+              f"(journal: {self.journal.path})")
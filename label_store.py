@@ -0,0 +1,229 @@
+"""YOLO seg 标签的打包存储：整个数据集的多边形放在一个文件里，可内存映射、按图片名随机访问
+
+文件结构（小端）：
+    8 字节魔数 | uint64 头部长度 | JSON 头部 | 按 64 字节对齐的各数组原始数据
+
+数组：
+    coords        float32 (P, 2)   所有多边形点的归一化坐标，依次排列
+    poly_offsets  int64   (M + 1,) 第 i 个多边形的点为 coords[poly_offsets[i]:poly_offsets[i + 1]]
+    poly_cls      int32   (M,)     每个多边形（实例）的类别
+    image_offsets int64   (N + 1,) 第 j 张图片的多边形为 [image_offsets[j], image_offsets[j + 1])
+图片名（不含扩展名）按顺序保存在头部的 names 中。
+
+用法：
+    python label_store.py pack   标签目录 输出.ysp
+    python label_store.py export 输入.ysp 标签目录
+"""
+import os
+import sys
+import json
+import shutil
+import struct
+import tempfile
+import numpy as np
+
+from label_io import atomic_write_text, format_yolo_seg
+from label_parse import read_yolo_labels
+
+MAGIC = b"YSEGPK01"
+ALIGN = 64
+STORE_EXT = ".ysp"
+
+
+class LabelStoreWriter:
+    """逐张图片追加多边形，坐标先写入临时文件，close() 时拼成一个打包文件"""
+
+    def __init__(self, path):
+        self.path = path
+        self.names = []
+        self.poly_counts = []
+        self.point_counts = []
+        self.poly_cls = []
+        self.num_points = 0
+
+        out_dir = os.path.dirname(os.path.abspath(path))
+        os.makedirs(out_dir, exist_ok=True)
+        self._coords_fp = tempfile.TemporaryFile(dir=out_dir)
+
+    def add(self, name, coords, offsets, cls=0):
+        """追加一张图片：coords 为 (P, 2) 归一化坐标，offsets 为 (M + 1,) 多边形起止下标"""
+        coords = np.ascontiguousarray(coords, dtype="<f4").reshape(-1, 2)
+        offsets = np.asarray(offsets, dtype=np.int64)
+        num_polys = len(offsets) - 1
+
+        self.names.append(name)
+        self.poly_counts.append(num_polys)
+        self.point_counts.append(np.diff(offsets))
+        self.poly_cls.append(np.broadcast_to(np.asarray(cls, dtype="<i4"), (num_polys,)))
+        self._coords_fp.write(coords.tobytes())
+        self.num_points += len(coords)
+
+    def close(self):
+        """写出最终文件（先写临时文件再替换）"""
+        point_counts = np.concatenate(self.point_counts) if self.point_counts else np.zeros(0, np.int64)
+        poly_offsets = np.zeros(len(point_counts) + 1, dtype="<i8")
+        np.cumsum(point_counts, out=poly_offsets[1:])
+
+        image_offsets = np.zeros(len(self.names) + 1, dtype="<i8")
+        np.cumsum(self.poly_counts, out=image_offsets[1:])
+
+        poly_cls = np.concatenate(self.poly_cls) if self.poly_cls else np.zeros(0, "<i4")
+
+        arrays = {
+            "poly_offsets": poly_offsets,
+            "poly_cls": poly_cls.astype("<i4"),
+            "image_offsets": image_offsets,
+        }
+        specs = {name: {"dtype": arr.dtype.str, "shape": list(arr.shape)} for name, arr in arrays.items()}
+        specs["coords"] = {"dtype": "<f4", "shape": [self.num_points, 2]}
+
+        # 头部长度依赖各数组的偏移量，反复估算直到头部能放进第一个数组之前
+        header = {"version": 1, "names": self.names, "arrays": specs}
+        order = ["poly_offsets", "poly_cls", "image_offsets", "coords"]
+        header_bytes = b""
+        while True:
+            pos = _align(len(MAGIC) + 8 + len(header_bytes))
+            for name in order:
+                spec = specs[name]
+                spec["offset"] = pos
+                pos = _align(pos + int(np.prod(spec["shape"])) * np.dtype(spec["dtype"]).itemsize)
+            header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+            if len(MAGIC) + 8 + len(header_bytes) <= specs[order[0]]["offset"]:
+                break
+
+        fd, tmp_path = tempfile.mkstemp(prefix=".tmp_", suffix=STORE_EXT,
+                                        dir=os.path.dirname(os.path.abspath(self.path)))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(MAGIC)
+                f.write(struct.pack("<Q", len(header_bytes)))
+                f.write(header_bytes)
+                for name in order:
+                    f.write(b"\0" * (specs[name]["offset"] - f.tell()))
+                    if name == "coords":
+                        self._coords_fp.seek(0)
+                        shutil.copyfileobj(self._coords_fp, f)
+                    else:
+                        f.write(arrays[name].tobytes())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        finally:
+            self._coords_fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._coords_fp.close()
+
+
+def _align(pos):
+    return (pos + ALIGN - 1) // ALIGN * ALIGN
+
+
+class LabelStore:
+    """只读打开打包文件，所有数组都是内存映射，按图片名 O(1) 取出多边形"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"不是标签打包文件: {path}")
+            (header_len,) = struct.unpack("<Q", f.read(8))
+            header = json.loads(f.read(header_len).decode("utf-8"))
+
+        self.names = header["names"]
+        self.index = {name: i for i, name in enumerate(self.names)}
+        for name, spec in header["arrays"].items():
+            setattr(self, name, _map_array(path, spec))
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def get(self, name):
+        """返回 (coords, offsets, cls)：coords 为该图所有点的视图，offsets 从 0 开始"""
+        i = self.index[name]
+        p0, p1 = self.image_offsets[i], self.image_offsets[i + 1]
+        offsets = np.asarray(self.poly_offsets[p0:p1 + 1])
+        coords = self.coords[offsets[0]:offsets[-1]]
+        return coords, offsets - offsets[0], np.asarray(self.poly_cls[p0:p1])
+
+    def polygons(self, name):
+        """返回该图的多边形列表（每个为 (N, 2) 归一化坐标）和类别数组"""
+        coords, offsets, cls = self.get(name)
+        return [coords[a:b] for a, b in zip(offsets[:-1], offsets[1:])], cls
+
+    def to_yolo_text(self, name):
+        """还原为 YOLO seg 文本：poly 格式且没有坏行时与打包前的 .txt 完全一致（见 pack_label_dir）"""
+        polygons, cls = self.polygons(name)
+        return format_yolo_seg(polygons, 1, 1, cls)
+
+    def export_yolo(self, label_dir):
+        """把所有图片导出为 标签目录/名称.txt"""
+        os.makedirs(label_dir, exist_ok=True)
+        for name in self.names:
+            atomic_write_text(os.path.join(label_dir, name + ".txt"), self.to_yolo_text(name))
+
+
+def _map_array(path, spec):
+    shape = tuple(spec["shape"])
+    if int(np.prod(shape)) == 0:
+        return np.zeros(shape, dtype=spec["dtype"])
+    return np.memmap(path, dtype=spec["dtype"], mode="r", offset=spec["offset"], shape=shape)
+
+
+def pack_label_dir(label_dir, store_path, strict=False):
+    """把标签目录下的所有 .txt 打包成一个文件，返回 (打包的图片数, 有损的文件 [(文件名, 说明)])
+
+    打包格式只保存多边形和类别：bbox 格式的外接框和无法使用的行不会进入打包文件，
+    导出时也就无法还原。strict=True 时遇到这类文件直接报错（不生成打包文件）。
+    """
+    names = sorted(f for f in os.listdir(label_dir) if f.endswith(".txt"))
+    lossy = []
+    with LabelStoreWriter(store_path) as writer:
+        for file_name in names:
+            labels = read_yolo_labels(os.path.join(label_dir, file_name))
+            reasons = []
+            if labels.boxes is not None:
+                reasons.append("bbox 格式的外接框不会保存")
+            if labels.bad:
+                reasons.append(f"{len(labels.bad)} 行无法使用，已跳过（第 {labels.bad[0][0]} 行起）")
+            if reasons:
+                if strict:
+                    raise ValueError(f"{file_name}: {'；'.join(reasons)}")
+                lossy.append((file_name, "；".join(reasons)))
+            writer.add(os.path.splitext(file_name)[0], labels.coords, labels.offsets, labels.cls)
+    return len(names), lossy
+
+
+def main():
+    if len(sys.argv) != 4 or sys.argv[1] not in ("pack", "export"):
+        print(__doc__)
+        sys.exit(1)
+
+    cmd, src, dst = sys.argv[1:]
+    if cmd == "pack":
+        n, lossy = pack_label_dir(src, dst)
+        for file_name, reason in lossy:
+            print(f"⚠️ {file_name}: {reason}")
+        print(f"✅ 已打包 {n} 个标签 → {dst}")
+    else:
+        store = LabelStore(src)
+        store.export_yolo(dst)
+        print(f"✅ 已导出 {len(store)} 个标签 → {dst}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+"""超大图（拼接后的 30k × 30k 显微图）的内存映射后端
+
+像素数超过 LARGE_PIXELS 的图片不再整张解码到内存，而是以 (H, W[, C]) 的 uint8 .npy 内存映射访问：
+    - .npy 原图直接内存映射
+    - TIFF：装了 tifffile 时，未压缩的直接内存映射；分块/压缩的逐块解码写入缓存 .npy
+    - 其他格式：第一次打开时解码一次写入缓存（_image_cache/{name}.npy），之后都走内存映射
+      PNG/JPEG 不支持按区域解码，解码后超过 decode_limit() 的直接报错，不会把内存耗尽
+    - 非 8 位像素（16 位 TIFF、浮点 .npy 等）按全图最小/最大值线性缩放为 8 位写入缓存
+显示时按比例分带读取并降采样生成金字塔层，裁剪时只读取裁剪框内的像素，峰值内存与原图大小无关。
+
+LargeImage 提供界面和裁剪代码用到的 PIL.Image 子集：size/width/height/mode、crop、reduce、resize(box=...)。
+"""
+import os
+import tempfile
+import threading
+import numpy as np
+from PIL import Image
+
+try:
+    import tifffile
+except ImportError:  # 可选依赖：没有时 TIFF 也走 PIL 解码缓存
+    tifffile = None
+
+LARGE_PIXELS = 64_000_000  # 超过该像素数（约 8k × 8k）的图片使用内存映射后端
+IMAGE_CACHE_DIRNAME = "_image_cache"  # 解码缓存目录名（位于图片所在目录下）
+BAND_ROWS = 512  # 降采样时每次读取的行数（按降采样倍数取整）
+RESAMPLE_MARGIN = 8  # 按框缩放时框外多读的像素（LANCZOS 缩小 2 倍时滤波半径为 6）
+TIFF_EXTS = (".tif", ".tiff")
+MAX_DECODE_BYTES = 16 << 30  # 只能整张解码的格式（PNG/JPEG 等）解码后的大小上限，另不超过物理内存的一半
+
+# Image.MAX_IMAGE_PIXELS 是进程全局的，预取、缩略图和配准线程会同时读文件头：
+# 临时关闭检查的整个过程加锁，保证多线程交错时总能恢复原值
+_bomb_check_lock = threading.Lock()
+
+
+def _open_unchecked(path):
+    """打开图片但不触发 PIL 的解压炸弹检查（只读头部，不解码）"""
+    with _bomb_check_lock:
+        old = Image.MAX_IMAGE_PIXELS
+        Image.MAX_IMAGE_PIXELS = None
+        try:
+            return Image.open(path)
+        finally:
+            Image.MAX_IMAGE_PIXELS = old
+
+
+def decode_limit():
+    """整张解码允许的最大字节数"""
+    limit = MAX_DECODE_BYTES
+    try:
+        limit = min(limit, os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // 2)
+    except (AttributeError, ValueError, OSError):  # Windows 没有 sysconf
+        pass
+    return limit
+
+
+def _decoded_bytes(img):
+    """PIL 解码后占用的内存（多通道图在 PIL 内部每像素 4 字节）"""
+    if img.mode.startswith("I;16"):
+        per_pixel = 2
+    elif len(img.getbands()) > 1 or img.mode in ("I", "F"):
+        per_pixel = 4
+    else:
+        per_pixel = 1
+    return img.width * img.height * per_pixel
+
+
+def image_size(path):
+    """只读文件头得到 (宽, 高)"""
+    if path.lower().endswith(".npy"):
+        shape = np.load(path, mmap_mode="r").shape
+        return shape[1], shape[0]
+    with _open_unchecked(path) as img:
+        return img.size
+
+
+def is_large(path):
+    w, h = image_size(path)
+    return w * h > LARGE_PIXELS
+
+
+def image_cache_path(path):
+    folder, name = os.path.split(os.path.abspath(path))
+    return os.path.join(folder, IMAGE_CACHE_DIRNAME, name + ".npy")
+
+
+def _cache_is_fresh(cache_path, path):
+    return os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(path)
+
+
+def _pil_rows(img, y0, y1):
+    """已解码的 PIL 图中 [y0, y1) 行的像素，不常见的模式逐条转换为 RGB"""
+    strip = img.crop((0, y0, img.width, min(y1, img.height)))
+    if strip.mode not in ("L", "RGB", "RGBA", "I;16", "I", "F"):
+        strip = strip.convert("RGB")
+    return np.asarray(strip)
+
+
+def _write_uint8(read_rows, height, out_path):
+    """按 BAND_ROWS 分带把像素写成 uint8 .npy；非 8 位时先分带扫描一遍求最小/最大值再线性缩放"""
+    first = read_rows(0, min(BAND_ROWS, height))
+    if first.ndim == 3 and first.shape[2] == 1:
+        first = first[:, :, 0]
+    if first.ndim not in (2, 3) or (first.ndim == 3 and first.shape[2] not in _MODES):
+        raise ValueError(f"不支持的像素形状 {first.shape[1:]}（需要灰度、RGB 或 RGBA）")
+
+    lo = hi = None
+    if first.dtype != np.uint8:
+        lo, hi = np.inf, -np.inf
+        for y in range(0, height, BAND_ROWS):
+            rows = read_rows(y, y + BAND_ROWS)
+            lo, hi = min(lo, float(np.nanmin(rows))), max(hi, float(np.nanmax(rows)))
+    scale = 255.0 / (hi - lo) if lo is not None and hi > lo else 0.0
+
+    out = np.lib.format.open_memmap(out_path, mode="w+", dtype=np.uint8, shape=(height,) + first.shape[1:])
+    for y in range(0, height, BAND_ROWS):
+        rows = read_rows(y, y + BAND_ROWS).reshape((-1,) + first.shape[1:])
+        if lo is not None:
+            rows = np.clip(np.nan_to_num((rows - lo) * scale), 0, 255).round()
+        out[y:y + len(rows)] = rows
+    out.flush()
+    del out
+
+
+def _build_cache(path, cache_path):
+    """把原图分带写入 uint8 .npy 缓存（先写临时文件再替换）"""
+    folder = os.path.dirname(cache_path)
+    os.makedirs(folder, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp_", suffix=".npy", dir=folder)
+    os.close(fd)
+    raw_path = None
+    try:
+        if path.lower().endswith(".npy"):
+            src = np.load(path, mmap_mode="r")
+            _write_uint8(lambda y0, y1: np.asarray(src[y0:y1]), src.shape[0], tmp_path)
+            del src
+        elif tifffile is not None and path.lower().endswith(TIFF_EXTS):
+            with tifffile.TiffFile(path) as tif:
+                page = tif.pages[0]
+                if page.dtype == np.uint8:
+                    target = tmp_path
+                else:  # 先按原类型逐块解码到磁盘，再分带缩放为 8 位
+                    fd, raw_path = tempfile.mkstemp(prefix=".raw_", suffix=".npy", dir=folder)
+                    os.close(fd)
+                    target = raw_path
+                out = np.lib.format.open_memmap(target, mode="w+", dtype=page.dtype, shape=page.shape)
+                page.asarray(out=out)  # 按 tile/strip 逐块解码进内存映射
+                out.flush()
+                del out
+            if raw_path:
+                src = np.load(raw_path, mmap_mode="r")
+                _write_uint8(lambda y0, y1: np.asarray(src[y0:y1]), src.shape[0], tmp_path)
+                del src
+        else:
+            # PNG/JPEG 不支持按区域解码，只能整张解码一次；解码前先检查大小，写缓存时分带复制
+            with _open_unchecked(path) as img:
+                need, limit = _decoded_bytes(img), decode_limit()
+                if need > limit:
+                    raise MemoryError(f"{os.path.basename(path)} 整张解码需要约 {need / 2 ** 30:.1f} GB 内存"
+                                      f"（上限 {limit / 2 ** 30:.1f} GB）：{img.format} 不支持分块解码，"
+                                      f"请先转换为分块 TIFF（并安装 tifffile）或 .npy")
+                img.load()
+                _write_uint8(lambda y0, y1: _pil_rows(img, y0, y1), img.height, tmp_path)
+        os.replace(tmp_path, cache_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    finally:
+        if raw_path and os.path.exists(raw_path):
+            os.remove(raw_path)
+
+
+def map_image(path):
+    """返回原图像素的只读 uint8 内存映射 (H, W[, C])"""
+    if path.lower().endswith(".npy"):
+        arr = np.load(path, mmap_mode="r")
+        if arr.dtype == np.uint8:
+            return arr
+
+    if tifffile is not None and path.lower().endswith(TIFF_EXTS):
+        try:
+            arr = tifffile.memmap(path, mode="r")  # 未压缩、连续存储的 8 位 TIFF 无需缓存
+            if arr.dtype == np.uint8:
+                return arr
+        except ValueError:
+            pass
+
+    cache_path = image_cache_path(path)
+    if not _cache_is_fresh(cache_path, path):
+        _build_cache(path, cache_path)
+    return np.load(cache_path, mmap_mode="r")
+
+
+_MODES = {1: "L", 3: "RGB", 4: "RGBA"}
+
+
+class LargeImage:
+    """内存映射的大图，只在需要时读取区域"""
+
+    cache_nbytes = 0  # 像素在磁盘上，不计入解码缓存的内存
+
+    def __init__(self, path):
+        self.path = path
+        self.array = map_image(path)
+        channels = 1 if self.array.ndim == 2 else self.array.shape[2]
+        self.mode = _MODES[channels]
+        self.height, self.width = self.array.shape[:2]
+        self.size = (self.width, self.height)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.array = None
+
+    def load(self):
+        """兼容 PIL 接口：像素按需读取，无需预先加载"""
+
+    def region(self, box):
+        """读取 box = (x1, y1, x2, y2) 内的像素，超出图片的部分补 0（与 PIL crop 一致）"""
+        x1, y1, x2, y2 = [int(v) for v in box]
+        out = np.zeros((y2 - y1, x2 - x1) + self.array.shape[2:], dtype=self.array.dtype)
+        sx1, sy1 = max(x1, 0), max(y1, 0)
+        sx2, sy2 = min(x2, self.width), min(y2, self.height)
+        if sx2 > sx1 and sy2 > sy1:
+            out[sy1 - y1:sy2 - y1, sx1 - x1:sx2 - x1] = self.array[sy1:sy2, sx1:sx2]
+        return out
+
+    def crop(self, box):
+        return Image.fromarray(self.region(box))
+
+    def reduce(self, factor):
+        """按 factor 倍块平均降采样（与 PIL reduce 逐像素一致，边缘不足的块按已有像素平均），分带读取
+
+        除以像素数 n 的方式与 PIL 的 Reduce.c 相同：乘以单精度算出的 floor(2^32 / (256 n)) 再右移 24 位。
+        RGBA 按各通道直接平均；PIL 会先预乘 alpha，两者只在 alpha 不全为 255 时有差别。
+        """
+        factor = int(factor)
+        out_h = -(-self.height // factor)
+        out_w = -(-self.width // factor)
+        out = np.empty((out_h, out_w) + self.array.shape[2:], dtype=np.uint8)
+
+        band = max(BAND_ROWS // factor, 1) * factor
+        pad_w = out_w * factor - self.width
+        # 每个输出列实际覆盖的原图列数（最后一列可能不足 factor）
+        col_counts = np.minimum(self.width - np.arange(out_w) * factor, factor)
+        for y in range(0, self.height, band):
+            rows = np.asarray(self.array[y:y + band], dtype=np.float32)
+            pad_h = -(-rows.shape[0] // factor) * factor - rows.shape[0]
+            if pad_h or pad_w:
+                pad = [(0, pad_h), (0, pad_w)] + [(0, 0)] * (rows.ndim - 2)
+                rows = np.pad(rows, pad)
+            blocks = rows.reshape(rows.shape[0] // factor, factor, out_w, factor, *rows.shape[2:])
+            row_counts = np.minimum(rows.shape[0] - pad_h - np.arange(blocks.shape[0]) * factor, factor)
+            counts = np.outer(row_counts, col_counts).reshape(blocks.shape[0], out_w, *([1] * (rows.ndim - 2)))
+            oy = y // factor
+            sums = blocks.sum(axis=(1, 3), dtype=np.float64).astype(np.uint64)
+            counts = counts.astype(np.uint64)
+            multiplier = (np.float32(2 ** 32) / (counts * 256).astype(np.float32)).astype(np.uint64)
+            out[oy:oy + blocks.shape[0]] = ((sums + counts // 2) * multiplier) >> 24
+        return Image.fromarray(out)
+
+    def resize(self, size, resample=Image.BICUBIC, box=None):
+        """只读取 box 覆盖的像素再缩放（TiledRenderer 从原分辨率层取瓦片时使用）"""
+        if box is None:
+            box = (0, 0, self.width, self.height)
+        bx1, by1, bx2, by2 = box
+        # 多读一圈像素给重采样滤波器用，相邻瓦片的边缘与整图缩放一致
+        x1, y1 = max(int(np.floor(bx1)) - RESAMPLE_MARGIN, 0), max(int(np.floor(by1)) - RESAMPLE_MARGIN, 0)
+        x2 = min(int(np.ceil(bx2)) + RESAMPLE_MARGIN, self.width)
+        y2 = min(int(np.ceil(by2)) + RESAMPLE_MARGIN, self.height)
+        patch = self.crop((x1, y1, x2, y2))
+        return patch.resize(size, resample, box=(bx1 - x1, by1 - y1, bx2 - x1, by2 - y1))
+
+
+def open_image(path):
+    """小图照常返回 PIL.Image；超大图（以及 .npy 像素数组）返回内存映射的 LargeImage"""
+    if path.lower().endswith(".npy") or is_large(path):
+        return LargeImage(path)
+    return Image.open(path)
+
+
+def fit_display(img, w, h, resample=Image.LANCZOS):
+    """生成 (w, h) 的显示图；大图先整数倍块平均降采样，避免读入整张原图"""
+    if isinstance(img, LargeImage):
+        factor = max(1, min(img.width // max(w, 1), img.height // max(h, 1)))
+        img = img.reduce(factor)
+    return img.resize((w, h), resample)
@@ -0,0 +1,106 @@
+import os
+import json
+import hashlib
+
+from label_io import atomic_write_text
+
+MANIFEST_NAME = ".convert_manifest.json"  # 保存在标签目录下
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """分块计算文件的 sha1"""
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def file_stamp(path):
+    """(size, mtime_ns, sha1)：记录到清单里的源文件指纹"""
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns, file_digest(path)
+
+
+class Manifest:
+    """增量转换清单：源文件 → 指纹 + 标签文件，转换参数变化时整体失效
+
+    清单中的 key 由调用方的 key_func 决定（转换脚本用源文件名 os.path.basename），value 为
+    {"size", "mtime_ns", "sha1", "label"}。
+    """
+
+    def __init__(self, label_dir, params):
+        self.path = os.path.join(label_dir, MANIFEST_NAME)
+        self.params = dict(params)
+        self.entries = {}
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.entries = data.get("entries", {})
+        # 参数不同则所有已有标签都需重新生成，但保留条目以便清理已删除的源文件
+        if data.get("params") != self.params:
+            self.invalidate()
+
+    def invalidate(self):
+        """让所有条目失效（下次 plan 全部重新转换）"""
+        for entry in self.entries.values():
+            entry["sha1"] = None
+
+    def save(self):
+        data = {"params": self.params, "entries": self.entries}
+        atomic_write_text(self.path, json.dumps(data, ensure_ascii=False, indent=1))
+
+    def is_fresh(self, key, npy_path, label_path):
+        """源文件未变化且标签仍存在时返回 True；只在 size/mtime 变了时才计算哈希"""
+        entry = self.entries.get(key)
+        if not entry or not entry.get("sha1") or not os.path.exists(label_path):
+            return False
+        if entry["label"] != os.path.basename(label_path):
+            return False
+
+        st = os.stat(npy_path)
+        if st.st_size == entry["size"] and st.st_mtime_ns == entry["mtime_ns"]:
+            return True
+        if st.st_size != entry["size"]:
+            return False
+
+        # 时间戳变了但内容可能没变（如重新拷贝），按哈希判断
+        if file_digest(npy_path) != entry["sha1"]:
+            return False
+        entry["mtime_ns"] = st.st_mtime_ns
+        return True
+
+    def plan(self, jobs, key_func):
+        """返回 (需要转换的 jobs, 跳过数, 源文件已消失的条目 key 列表)"""
+        todo = []
+        skipped = 0
+        present = set()
+        for npy_path, label_path in jobs:
+            key = key_func(npy_path)
+            present.add(key)
+            if self.is_fresh(key, npy_path, label_path):
+                skipped += 1
+            else:
+                todo.append((npy_path, label_path))
+
+        removed = [key for key in self.entries if key not in present]
+        return todo, skipped, removed
+
+    def record(self, key, label_path, stamp):
+        size, mtime_ns, sha1 = stamp
+        self.entries[key] = {
+            "size": size,
+            "mtime_ns": mtime_ns,
+            "sha1": sha1,
+            "label": os.path.basename(label_path),
+        }
+
+    def forget(self, key):
+        return self.entries.pop(key, None)
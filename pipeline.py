@@ -0,0 +1,477 @@
+"""端到端流水线：Cellpose _seg.npy → 整图 YOLO 标签 → 滑窗分块（图片 + 分块 masks/标签）→ 标签检验
+
+用一个 JSON 配置文件代替各脚本里写死的路径和参数（python pipeline.py --init pipeline.json 写出默认配置）。
+每张图片按依赖关系流过各阶段，不等整个数据集跑完一个阶段再开始下一个：
+
+    masks ──┬── labels ──┬── validate
+            └── tiles ───┘
+
+    masks     读取 Cellpose _seg.npy 中的实例图（只反序列化 masks 字段，见 seg_io）
+    labels    实例图 → 整图 YOLO seg 标签 {out_dir}/labels/{name}.txt
+    tiles     滑窗分块 + 背景过滤，输出 {out_dir}/tiles/{name}_cut_{idx}.png 及 tiles/labels、tiles/masks
+    validate  与 seg标签检验1222.py --headless 相同的检查，汇总为 {out_dir}/validation.json
+
+没有 _seg.npy 的图片不生成整图标签（labels 不适用），分块的标注来自 label_dir 中的整图标签，validate 只检查分块。
+
+实例图、标签文本等中间结果在内存中传给下游阶段，不写盘再读回；下游都用完后即释放。
+每个阶段有自己的线程池或进程池（executor / workers），进程池只收到该阶段需要的输入；
+同时在处理中的图片数不超过 max_in_flight，内存占用与数据集大小无关。
+
+已完成的阶段记在 {out_dir}/pipeline_state.jsonl（只追加），再次运行时跳过源文件（图片、_seg.npy，
+没有 _seg.npy 时为 label_dir 中的标签）和参数都没变的阶段，
+中断后重新运行即从断点继续；上游重跑时下游也重跑。--full 忽略记录全部重跑。
+
+用法：
+    python pipeline.py --init pipeline.json     写出默认配置
+    python pipeline.py pipeline.json            运行（中断后再次运行即继续）
+    python pipeline.py pipeline.json --only labels validate
+"""
+import os
+import glob
+import json
+import time
+import queue
+import hashlib
+import argparse
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import numpy as np
+from PIL import Image
+
+import cellpose標簽轉換 as converter
+import seg标签检验1222 as checker
+from crop_engine import CROP_W, crop_filename
+from crop_journal import read_events, open_append, skipped_message
+from crop_labels import find_masks, find_label, instance_areas, read_yolo_polygons, tile_annotations, \
+    tile_label_paths
+from crop_tiling import STRIDE, MIN_FOREGROUND, IMAGE_EXTS, propose_tiles
+from crop_writer import save_image_atomic
+from label_io import atomic_write_text, format_yolo_seg
+from large_image import open_image
+from seg_io import load_masks, write_seg_masks
+
+STATE_NAME = "pipeline_state.jsonl"
+REPORT_NAME = "validation.json"
+LABELS_SUBDIR = "labels"
+TILES_SUBDIR = "tiles"
+NUM_WORKERS = os.cpu_count() or 1
+MAX_IN_FLIGHT = 2 * NUM_WORKERS  # 同时在处理中的图片数上限（每张的实例图都在内存中）
+EXECUTORS = ("thread", "process")
+
+DEFAULT_CONFIG = {
+    "image_dir": "dataset/images1222",
+    "npy_dir": converter.NPY_DIR,  # Cellpose _seg.npy 目录，null 时在图片同目录查找
+    "label_dir": None,  # 没有 _seg.npy 的图片分块时从这里读整图标签
+    "out_dir": "dataset/pipeline_out",
+    "max_in_flight": MAX_IN_FLIGHT,
+    "convert": converter.convert_params(),  # 整图和分块标签共用的轮廓提取/简化参数
+    "stages": {
+        "masks": {"executor": "thread", "workers": 2, "cache_masks": converter.CACHE_MASKS},
+        "labels": {"executor": "process", "workers": NUM_WORKERS},
+        "tiles": {"executor": "process", "workers": NUM_WORKERS, "size": CROP_W, "stride": STRIDE,
+                  "min_foreground": MIN_FOREGROUND, "use_masks": True, "write_masks": True,
+                  "write_labels": True, "ext": None},
+        "validate": {"executor": "thread", "workers": 1},
+    },
+}
+
+# inputs: 从上游取的内存中间结果；record: 是否记入状态文件（masks 只是读取，每次需要时重新读）
+Stage = namedtuple("Stage", "name needs inputs record")
+STAGES = (
+    Stage("masks", (), (), False),
+    Stage("labels", ("masks",), ("masks",), True),
+    Stage("tiles", ("masks",), ("masks",), True),
+    Stage("validate", ("labels", "tiles"), ("label_text", "tiles"), True),
+)
+STAGE_BY_NAME = {s.name: s for s in STAGES}
+SHARES_CONVERT = ("labels", "tiles")  # 参数变化时需要重跑的阶段
+
+
+# ================= 各阶段（在线程池或子进程中执行） =================
+# 每个阶段为 func(job, params) -> (传给下游的结果, 记入状态文件的内容)
+
+def masks_stage(job, params):
+    if not job["npy"]:
+        return {"masks": None}, None
+    return {"masks": np.asarray(load_masks(job["npy"], use_cache=params["cache_masks"]))}, None
+
+
+def labels_stage(job, params):
+    masks = job["masks"]
+    if masks is None:
+        raise FileNotFoundError("没有对应的 _seg.npy")
+    h, w = masks.shape
+    text = format_yolo_seg(converter.masks_to_polygons(masks, params["convert"]), w, h)
+    label_path = os.path.join(job["out_dir"], LABELS_SUBDIR, job["base"] + ".txt")
+    os.makedirs(os.path.dirname(label_path), exist_ok=True)
+    atomic_write_text(label_path, text)
+    return {"label_text": text}, {"label": os.path.basename(label_path)}
+
+
+def tiles_stage(job, params):
+    """分块并保存，分块 masks/标签由内存中的整图实例图直接切出；返回各分块的 [文件名, 标签文本]"""
+    tiles_dir = os.path.join(job["out_dir"], TILES_SUBDIR)
+    masks = job["masks"]
+    tiles = []
+    with open_image(job["image"]) as img:
+        img.load()
+        if masks is not None:
+            if masks.shape != (img.height, img.width):
+                raise ValueError(f"masks 尺寸 {masks.shape} 与图片 {img.size} 不一致")
+            sources = {"masks": masks, "full_areas": instance_areas(masks)}
+        else:
+            label_path = find_label(job["image"], job["label_dir"])
+            sources = {}
+            if label_path is not None:
+                polygons, classes = read_yolo_polygons(label_path, img.width, img.height)
+                sources = {"polygons": polygons, "classes": classes}
+
+        size = params["size"]
+        kept, _, _ = propose_tiles(img, masks if params["use_masks"] else None, size, size,
+                                   params["stride"], params["min_foreground"] or None)
+        fmt = Image.registered_extensions().get((params["ext"] or os.path.splitext(job["image"])[1]).lower())
+        to_rgb = fmt == "JPEG" and img.mode not in ("RGB", "L")
+
+        for idx, box in enumerate(kept.tolist(), 1):
+            file_name = crop_filename(job["image"], idx, params["ext"])
+            tile = img.crop(tuple(box))
+            save_image_atomic(tile.convert("RGB") if to_rgb else tile, os.path.join(tiles_dir, file_name))
+
+            tile_name = os.path.splitext(file_name)[0]
+            label_path, mask_path = tile_label_paths(tiles_dir, tile_name)
+            tile_masks, tile_polys, tile_cls = tile_annotations(box, **sources, with_polygons=params["write_labels"],
+                                                                params=params["convert"])
+            if params["write_masks"] and tile_masks is not None:
+                write_seg_masks(mask_path, tile_masks)
+            text = None
+            if tile_polys is not None:
+                text = format_yolo_seg(tile_polys, box[2] - box[0], box[3] - box[1], tile_cls)
+                os.makedirs(os.path.dirname(label_path), exist_ok=True)
+                atomic_write_text(label_path, text)
+            tiles.append([file_name, text])
+    return {"tiles": tiles}, {"tiles": [name for name, _ in tiles]}
+
+
+def _read_text(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return f.read()
+
+
+def _check(image, label, text):
+    if text is None:
+        return {"image": image, "label": label, "instances": 0,
+                "issues": [{"line": 0, "type": "missing_label", "msg": "没有对应的标签"}]}
+    issues, polygons = checker.check_label_text(text)
+    return {"image": image, "label": label, "instances": len(polygons), "issues": issues}
+
+
+def validate_stage(job, params):
+    """检查整图标签和所有分块标签；上游在之前的运行中已完成时从磁盘读取"""
+    out_dir, records = job["out_dir"], job["records"]
+    results = []
+
+    if "labels" in records:
+        label = f"{LABELS_SUBDIR}/{job['base']}.txt"
+        text = job.get("label_text")
+        if text is None:
+            text = _read_text(os.path.join(out_dir, label))
+        results.append(_check(job["name"], label, text))
+
+    tiles = job.get("tiles")
+    if tiles is None:
+        tiles = [[name, None] for name in records.get("tiles", {}).get("tiles", [])]
+    tiles_dir = os.path.join(out_dir, TILES_SUBDIR)
+    for file_name, text in tiles:
+        label_path, _ = tile_label_paths(tiles_dir, os.path.splitext(file_name)[0])
+        if text is None:
+            text = _read_text(label_path)
+        results.append(_check(file_name, os.path.relpath(label_path, out_dir).replace(os.sep, "/"), text))
+    return {}, {"results": results}
+
+
+STAGE_FUNCS = {"masks": masks_stage, "labels": labels_stage, "tiles": tiles_stage, "validate": validate_stage}
+
+
+# ================= 配置与状态 =================
+
+def load_config(path):
+    """读取配置，缺省的字段用 DEFAULT_CONFIG 补齐"""
+    with open(path, "r", encoding="utf-8") as f:
+        user = json.load(f)
+    config = dict(DEFAULT_CONFIG, **{k: v for k, v in user.items() if k not in ("convert", "stages")})
+    config["convert"] = converter.convert_params(**user.get("convert", {}))  # 同时检查参数是否合理
+    config["stages"] = {name: dict(params, **user.get("stages", {}).get(name, {}))
+                        for name, params in DEFAULT_CONFIG["stages"].items()}
+    for name, params in config["stages"].items():
+        if params["executor"] not in EXECUTORS:
+            raise ValueError(f"阶段 {name} 的 executor 为 {params['executor']}，可选 {EXECUTORS}")
+    return config
+
+
+def stage_params(config, name):
+    params = dict(config["stages"][name])
+    if name in SHARES_CONVERT:
+        params["convert"] = config["convert"]
+    return params
+
+
+def stage_key(config, name):
+    """决定输出内容的参数的指纹（不含 workers/executor），变化后该阶段重跑"""
+    params = {k: v for k, v in stage_params(config, name).items() if k not in ("workers", "executor")}
+    raw = json.dumps(params, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:12]
+
+
+def _stamp(path):
+    if not path:
+        return None
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+class PipelineState:
+    """每张图片每个阶段最后一次完成的记录，追加写入"""
+
+    def __init__(self, path):
+        self.path = path
+        self.records = {}  # (图片名, 阶段) -> 事件
+        events, self.skipped = read_events(path)  # 损坏的行 [(行号, 内容)]，对应的阶段会重新执行
+        for event in events:
+            self.records[(event["image"], event["stage"])] = event
+        self.file = None
+
+    def get(self, image, stage):
+        return self.records.get((image, stage))
+
+    def is_done(self, image, stage, key, src):
+        event = self.get(image, stage)
+        return event is not None and event["key"] == key and event["src"] == src
+
+    def record(self, image, stage, key, src, out):
+        event = {"op": "done", "image": image, "stage": stage, "key": key, "src": src, "out": out,
+                 "time": round(time.time(), 3)}
+        if self.file is None:
+            self.file = open_append(self.path)
+        self.file.write(json.dumps(event, ensure_ascii=False) + "\n")
+        self.file.flush()
+        self.records[(image, stage)] = event
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+# ================= 调度 =================
+
+def list_images(image_dir):
+    paths = []
+    for ext in IMAGE_EXTS:
+        paths.extend(glob.glob(os.path.join(image_dir, ext)))
+    return sorted(set(paths))
+
+
+def plan(config, state, full=False, only=None):
+    """每张图片这次要跑的阶段：未完成/参数或源文件变了的，及其下游；再补上它们依赖的读取阶段"""
+    items = []
+    keys = {s.name: stage_key(config, s.name) for s in STAGES}
+    for path in list_images(config["image_dir"]):
+        name = os.path.basename(path)
+        npy = find_masks(path, config["npy_dir"])
+        label = find_label(path, config["label_dir"]) if npy is None else None
+        src = [_stamp(path), _stamp(npy), _stamp(label)]
+        skip = {"labels"} if npy is None else set()  # 没有实例图时无法生成整图标签
+
+        todo = set()
+        for stage in STAGES:
+            if not stage.record or stage.name in skip or (only and stage.name not in only):
+                continue
+            if full or not state.is_done(name, stage.name, keys[stage.name], src) or todo & set(stage.needs):
+                todo.add(stage.name)
+        for stage in reversed(STAGES):
+            if not stage.record and any(stage.name in STAGE_BY_NAME[t].needs for t in todo):
+                todo.add(stage.name)
+        if todo:
+            items.append({"name": name, "image": path, "npy": npy, "src": src, "todo": todo, "skip": skip})
+    return items, keys
+
+
+def _remove_stale_tiles(tiles_dir, old, new):
+    """重新分块后，上次有、这次没有的分块文件及其标注删除"""
+    for file_name in set(old) - set(new):
+        tile_name = os.path.splitext(file_name)[0]
+        for path in (os.path.join(tiles_dir, file_name), *tile_label_paths(tiles_dir, tile_name)):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def run_pipeline(config, full=False, only=None):
+    """按配置运行流水线，返回 (失败列表 [(图片, 阶段, 错误)], 检验报告)"""
+    out_dir = config["out_dir"]
+    os.makedirs(out_dir, exist_ok=True)
+    state = PipelineState(os.path.join(out_dir, STATE_NAME))
+    if state.skipped:
+        print(f"⚠️ {skipped_message(state.path, state.skipped)}，对应的阶段会重新执行")
+    items, keys = plan(config, state, full, only)
+    total = len(items)
+    print(f"共 {len(list_images(config['image_dir']))} 张图片，需要处理 {total} 张")
+
+    pools = {}
+    for stage in STAGES:
+        if any(stage.name in item["todo"] for item in items):
+            params = config["stages"][stage.name]
+            pool_cls = ProcessPoolExecutor if params["executor"] == "process" else ThreadPoolExecutor
+            pools[stage.name] = pool_cls(max_workers=max(int(params["workers"]), 1))
+
+    events = queue.SimpleQueue()  # (item, 阶段, future)，在主线程中处理，状态文件只由主线程写
+    failures = []
+    finished = 0
+    active = []
+    waiting = iter(items)
+
+    def submit(item, stage):
+        job = {"name": item["name"], "base": os.path.splitext(item["name"])[0], "image": item["image"],
+               "npy": item["npy"], "out_dir": out_dir, "label_dir": config["label_dir"],
+               "records": {n: state.get(item["name"], n)["out"] for n in stage.needs
+                           if n not in item["skip"] and state.get(item["name"], n) is not None}}
+        job.update({k: item["data"][k] for k in stage.inputs if k in item["data"]})
+        item["running"].add(stage.name)
+        future = pools[stage.name].submit(STAGE_FUNCS[stage.name], job, stage_params(config, stage.name))
+        future.add_done_callback(lambda f: events.put((item, stage, f)))
+
+    def schedule(item):
+        """提交依赖已满足的阶段；没有在运行的阶段时该图片处理完毕，返回 True"""
+        for stage in STAGES:
+            name = stage.name
+            if name in item["todo"] and name not in item["done"] | item["running"] | item["dropped"]:
+                if any(n in item["dropped"] for n in stage.needs):
+                    item["dropped"].add(name)
+                elif all(n in item["done"] or n not in item["todo"] for n in stage.needs):
+                    submit(item, stage)
+        # 下游都不再需要的中间结果释放掉
+        remaining = item["todo"] - item["done"] - item["dropped"]
+        needed = {k for n in remaining for k in STAGE_BY_NAME[n].inputs}
+        for k in list(item["data"]):
+            if k not in needed:
+                del item["data"][k]
+        return not item["running"]
+
+    def finish(item):
+        nonlocal finished
+        finished += 1
+        active.remove(item)
+        parts = []
+        for stage in STAGES:
+            if stage.record and stage.name in item["done"]:
+                out = state.get(item["name"], stage.name)["out"]
+                if stage.name == "tiles":
+                    parts.append(f"{len(out['tiles'])} 块")
+                elif stage.name == "validate":
+                    parts.append(f"{sum(len(r['issues']) for r in out['results'])} 个问题")
+                else:
+                    parts.append(stage.name)
+        errors = [f"{s} 失败：{e}" for n, s, e in failures if n == item["name"]]
+        mark = "❌" if errors else "✅"
+        print(f"{mark} [{finished}/{total}] {item['name']}: {', '.join(parts + errors)}")
+
+    def fill():
+        while len(active) < config["max_in_flight"]:
+            item = next(waiting, None)
+            if item is None:
+                return
+            item.update(data={}, done=set(), running=set(), dropped=set())
+            active.append(item)
+            if schedule(item):
+                finish(item)
+
+    try:
+        fill()
+        while active:
+            item, stage, future = events.get()
+            item["running"].discard(stage.name)
+            try:
+                outputs, record = future.result()
+            except Exception as e:
+                failures.append((item["name"], stage.name, f"{type(e).__name__}: {e}"))
+                item["dropped"].add(stage.name)
+            else:
+                item["data"].update(outputs)
+                item["done"].add(stage.name)
+                if stage.record:
+                    if stage.name == "tiles":
+                        old = state.get(item["name"], "tiles")
+                        if old is not None:
+                            _remove_stale_tiles(os.path.join(out_dir, TILES_SUBDIR), old["out"]["tiles"],
+                                                record["tiles"])
+                    state.record(item["name"], stage.name, keys[stage.name], item["src"], record)
+            if schedule(item):
+                finish(item)
+                fill()
+    finally:
+        for pool in pools.values():
+            pool.shutdown(wait=True, cancel_futures=True)
+        state.close()
+
+    report = build_report(config, state)
+    with open(os.path.join(out_dir, REPORT_NAME), "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    return failures, report
+
+
+def build_report(config, state):
+    """把状态文件中所有图片的检验结果汇总为与 seg标签检验1222.py --headless 相同结构的报告"""
+    names = [os.path.basename(p) for p in list_images(config["image_dir"])]
+    results = []
+    for name in names:
+        event = state.get(name, "validate")
+        if event is not None:
+            results.extend(event["out"]["results"])
+
+    counts = {}
+    for r in results:
+        for item in r["issues"]:
+            counts[item["type"]] = counts.get(item["type"], 0) + 1
+    return {
+        "summary": {
+            "images": len(names),
+            "labels": len(results),
+            "instances": sum(r["instances"] for r in results),
+            "files_with_issues": sum(1 for r in results if r["issues"]),
+            "issues": counts,
+        },
+        "files": [r for r in results if r["issues"]],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cellpose → YOLO 标签 → 分块 → 检验 流水线")
+    parser.add_argument("config", help="流水线配置 JSON")
+    parser.add_argument("--init", action="store_true", help="把默认配置写到 config 路径后退出")
+    parser.add_argument("--full", action="store_true", help="忽略已完成的记录，全部重跑")
+    parser.add_argument("--only", nargs="+", choices=[s.name for s in STAGES if s.record],
+                        help="只运行这些阶段（未选的上游视为已完成）")
+    args = parser.parse_args()
+
+    if args.init:
+        if os.path.exists(args.config):
+            raise SystemExit(f"❌ {args.config} 已存在")
+        atomic_write_text(args.config, json.dumps(DEFAULT_CONFIG, ensure_ascii=False, indent=2))
+        print(f"✅ 已写出默认配置 {args.config}")
+        return
+
+    config = load_config(args.config)
+    failures, report = run_pipeline(config, args.full, set(args.only) if args.only else None)
+
+    summary = report["summary"]
+    print(f"\n🎉 完成：失败 {len(failures)}，检验 {summary['labels']} 个标签，"
+          f"{summary['files_with_issues']} 个有问题：{summary['issues']}"
+          f"（报告 {os.path.join(config['out_dir'], REPORT_NAME)}）")
+    for name, stage, error in failures:
+        print(f"  ❌ {name} [{stage}] | {error}")
+    raise SystemExit(1 if failures or summary["files_with_issues"] else 0)
+
+
+if __name__ == "__main__":
+    main()
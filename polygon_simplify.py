@@ -0,0 +1,43 @@
+import cv2
+
+SIMPLIFY_MODES = ("fixed", "relative")
+
+
+def _approx(cnt, epsilon):
+    return cv2.approxPolyDP(cnt, epsilon=epsilon, closed=True)
+
+
+def simplify_contour(cnt, mode="fixed", epsilon=1.5, rel_epsilon=0.005, max_vertices=None):
+    """按所选策略简化轮廓
+
+    mode="fixed"    : 固定 epsilon（像素）
+    mode="relative" : epsilon = rel_epsilon × 轮廓周长，大细胞和小细胞的简化程度一致
+    max_vertices    : 每个多边形的顶点上限；超出时二分查找更大的 epsilon 直到满足
+    """
+    if mode == "fixed":
+        eps = epsilon
+    elif mode == "relative":
+        eps = rel_epsilon * cv2.arcLength(cnt, True)
+    else:
+        raise ValueError(f"未知的简化策略: {mode}（可选 {SIMPLIFY_MODES}）")
+
+    approx = _approx(cnt, eps)
+    if not max_vertices or len(approx) <= max_vertices:
+        return approx
+
+    # 顶点数随 epsilon 单调不增：先倍增找到上界，再二分逼近最小可行 epsilon
+    perimeter = cv2.arcLength(cnt, True)
+    lo, hi = eps, max(eps, 0.5)
+    while True:
+        hi *= 2
+        best = _approx(cnt, hi)
+        if len(best) <= max_vertices or hi > perimeter:
+            break
+    for _ in range(8):
+        mid = (lo + hi) / 2
+        candidate = _approx(cnt, mid)
+        if len(candidate) <= max_vertices:
+            hi, best = mid, candidate
+        else:
+            lo = mid
+    return best
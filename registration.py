@@ -0,0 +1,207 @@
+"""主图 ↔ 参考图配准：估计一次每对图片的变换并缓存，参考窗口的联动裁剪按变换映射裁剪中心
+
+荧光/明场配对图往往有平移、甚至比例不同，直接按相同像素坐标裁剪会错位。
+在长边缩小到 REG_MAX_SIDE 的灰度图上估计变换（全分辨率坐标 主图 → 参考图，2×3 仿射矩阵）：
+    orb     ORB 特征 + RANSAC 相似变换（平移 + 旋转 + 等比缩放），同模态、纹理丰富时最准
+    phase   梯度幅值图上的相位相关，只估计平移（比例按两图尺寸），跨模态时更稳
+    auto    先 ORB，内点不足时退回相位相关
+结果（包括失败的结果）缓存在 cutoff/registration.json，按 (主图, 参考图) 的路径和修改时间失效，
+文件不变时失败的图片对也不会重复计算；
+后台线程计算，裁剪时只查缓存，不等待。
+"""
+import os
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import cv2
+
+from large_image import open_image, fit_display
+
+REGISTRATION_NAME = "registration.json"  # 缓存文件名（位于主图文件夹的 cutoff 目录）
+REG_MAX_SIDE = 1024  # 配准在长边不超过该值的缩小图上进行
+ORB_FEATURES = 2000
+ORB_MIN_INLIERS = 15  # RANSAC 内点少于该值认为 ORB 配准失败
+PHASE_MIN_RESPONSE = 0.05  # 相位相关峰值低于该值认为配准失败
+METHODS = ("auto", "orb", "phase")
+
+
+def load_gray_small(path, max_side=REG_MAX_SIDE):
+    """返回 (缩小后的 uint8 灰度图, x 方向缩放, y 方向缩放)"""
+    img = open_image(path)
+    ratio = min(1.0, max_side / max(img.width, img.height))
+    w, h = max(int(round(img.width * ratio)), 1), max(int(round(img.height * ratio)), 1)
+    small = fit_display(img, w, h) if (w, h) != img.size else img
+    gray = np.asarray(small.convert("L"))
+    return gray, w / img.width, h / img.height
+
+
+def _scale_matrix(sx, sy):
+    return np.array([[sx, 0, 0], [0, sy, 0], [0, 0, 1]], dtype=np.float64)
+
+
+def _to3x3(m):
+    return np.vstack([np.asarray(m, dtype=np.float64), [0, 0, 1]])
+
+
+def register_orb(main_gray, ref_gray):
+    """ORB 匹配 + RANSAC 相似变换，返回 (缩小图坐标的 2×3 矩阵, 内点数) 或 (None, 内点数)"""
+    orb = cv2.ORB_create(ORB_FEATURES)
+    kp1, des1 = orb.detectAndCompute(main_gray, None)
+    kp2, des2 = orb.detectAndCompute(ref_gray, None)
+    if des1 is None or des2 is None or len(kp1) < ORB_MIN_INLIERS or len(kp2) < ORB_MIN_INLIERS:
+        return None, 0
+
+    matches = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=True).match(des1, des2)
+    if len(matches) < ORB_MIN_INLIERS:
+        return None, 0
+    src = np.float32([kp1[m.queryIdx].pt for m in matches])
+    dst = np.float32([kp2[m.trainIdx].pt for m in matches])
+    matrix, inliers = cv2.estimateAffinePartial2D(src, dst, method=cv2.RANSAC, ransacReprojThreshold=3.0)
+    n_inliers = int(inliers.sum()) if inliers is not None else 0
+    if matrix is None or n_inliers < ORB_MIN_INLIERS:
+        return None, n_inliers
+    return matrix, n_inliers
+
+
+def _gradient(gray):
+    g = gray.astype(np.float32)
+    gx = cv2.Sobel(g, cv2.CV_32F, 1, 0, ksize=3)
+    gy = cv2.Sobel(g, cv2.CV_32F, 0, 1, ksize=3)
+    return cv2.magnitude(gx, gy)
+
+
+def register_phase(main_gray, ref_gray):
+    """梯度图相位相关（参考图先缩放到主图缩小图的尺寸），返回 (缩小图坐标的 2×3 矩阵, 峰值响应)"""
+    h, w = main_gray.shape
+    ref_resized = cv2.resize(ref_gray, (w, h), interpolation=cv2.INTER_AREA)
+    window = cv2.createHanningWindow((w, h), cv2.CV_32F)
+    (dx, dy), response = cv2.phaseCorrelate(_gradient(main_gray), _gradient(ref_resized), window)
+
+    # 主图缩小图 → 参考图缩放到同尺寸后的坐标：平移 (dx, dy)；再换回参考图缩小图的比例
+    rh, rw = ref_gray.shape
+    shift = np.array([[1, 0, dx], [0, 1, dy], [0, 0, 1]], dtype=np.float64)
+    matrix = _scale_matrix(rw / w, rh / h) @ shift
+    return matrix[:2], float(response)
+
+
+def estimate_transform(main_path, ref_path, method="auto"):
+    """估计全分辨率坐标 主图 → 参考图 的变换，返回 {matrix, method, score}；失败时 matrix 为 None"""
+    main_gray, msx, msy = load_gray_small(main_path)
+    ref_gray, rsx, rsy = load_gray_small(ref_path)
+
+    small, used, score = None, method, 0.0
+    if method in ("auto", "orb"):
+        small, score = register_orb(main_gray, ref_gray)
+        used = "orb"
+    if small is None and method in ("auto", "phase"):
+        small, score = register_phase(main_gray, ref_gray)
+        used = "phase"
+        if score < PHASE_MIN_RESPONSE:
+            small = None
+
+    matrix = None
+    if small is not None:
+        # 主图全分辨率 → 主图缩小图 → 参考图缩小图 → 参考图全分辨率
+        full = _scale_matrix(1 / rsx, 1 / rsy) @ _to3x3(small) @ _scale_matrix(msx, msy)
+        matrix = full[:2].tolist()
+    return {"matrix": matrix, "method": used, "score": round(float(score), 4)}
+
+
+def map_point(matrix, x, y):
+    m = np.asarray(matrix, dtype=np.float64)
+    rx, ry = m @ (x, y, 1.0)
+    return float(rx), float(ry)
+
+
+def transform_scale(matrix):
+    """变换的等比缩放系数（参考图像素 / 主图像素）"""
+    m = np.asarray(matrix, dtype=np.float64)[:, :2]
+    return float(np.sqrt(abs(np.linalg.det(m))))
+
+
+def _pair_key(main_path, ref_path):
+    return f"{os.path.abspath(main_path)}|{os.path.abspath(ref_path)}"
+
+
+def _mtimes(main_path, ref_path):
+    return [os.stat(main_path).st_mtime_ns, os.stat(ref_path).st_mtime_ns]
+
+
+class PairRegistry:
+    """按图片对缓存的配准结果（JSON 文件），后台线程计算"""
+
+    def __init__(self, path, method="auto", workers=1):
+        self.path = path
+        self.method = method
+        self.records = {}
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self.records = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                print(f"忽略损坏的配准缓存 {path}: {e}")
+        self.pending = {}  # key -> Future
+        self.save_error = None  # 最近一次写缓存文件失败的原因，由界面通过 last_save_error() 显示
+        self.lock = threading.Lock()
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="register")
+
+    def get(self, main_path, ref_path):
+        """已缓存且未过期的结果 {matrix, method, score}，没有时返回 None（不阻塞）"""
+        key = _pair_key(main_path, ref_path)
+        with self.lock:
+            record = self.records.get(key)
+        try:
+            if record is not None and record.get("mtimes") == _mtimes(main_path, ref_path):
+                return record
+        except OSError:
+            pass
+        return None
+
+    def is_pending(self, main_path, ref_path):
+        with self.lock:
+            return _pair_key(main_path, ref_path) in self.pending
+
+    def request(self, main_path, ref_path):
+        """缓存中没有或源文件已改动时提交后台配准（图片不存在时不提交）"""
+        try:
+            mtimes = _mtimes(main_path, ref_path)
+        except OSError:
+            return
+        key = _pair_key(main_path, ref_path)
+        with self.lock:
+            record = self.records.get(key)
+            if key in self.pending or (record is not None and record.get("mtimes") == mtimes):
+                return
+            self.pending[key] = self.pool.submit(self._register, key, main_path, ref_path, mtimes)
+
+    def _register(self, key, main_path, ref_path, mtimes):
+        """mtimes 为提交时的修改时间：计算期间文件有改动时，下次 request 会重新计算"""
+        try:
+            record = estimate_transform(main_path, ref_path, self.method)
+        except Exception as e:
+            record = {"matrix": None, "method": self.method, "score": 0.0, "error": f"{type(e).__name__}: {e}"}
+        record["mtimes"] = mtimes
+        with self.lock:
+            self.records[key] = record
+            self.pending.pop(key, None)
+            try:
+                self._save()
+                self.save_error = None
+            except Exception as e:  # 结果仍在内存中可用，下次保存成功时一起写入
+                self.save_error = f"{type(e).__name__}: {e}"
+
+    def last_save_error(self):
+        with self.lock:
+            return self.save_error
+
+    def _save(self):
+        """整体写临时文件再替换（需持有锁）"""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".part"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.records, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.path)
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
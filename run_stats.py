@@ -0,0 +1,176 @@
+"""轻量计时与计数：上下文管理器计时 + 计数器，运行结束汇总各阶段的 p50/p95/max 和每秒处理张数
+
+    stats = RunStats("convert")
+    with stats.time("decode"):                 # 单次事件（界面里的解码、缩放、保存等）
+        ...
+    rec = ItemStats("a_seg.npy")               # 一个文件一条记录，可在子进程里记录后随结果返回
+    with rec.time("load"):
+        ...
+    rec.count("instances", 12)
+    stats.add_item(rec.as_dict())
+    stats.write_report("run.json")             # .json 含汇总和逐文件明细；.csv 为各阶段汇总表
+
+不记逐文件明细时用计数器统计处理数：RunStats("gui", item_count="images") 后每处理一张 stats.count("images")。
+
+不需要计时的地方传 NULL_STATS，调用处不用判断是否开启；RunStats 可在多个线程中同时记录。
+"""
+import csv
+import json
+import time
+import threading
+from contextlib import contextmanager, nullcontext
+import numpy as np
+
+from label_io import atomic_write_text
+
+# 每行一个阶段，整次运行的字段在每行重复（多次运行的表可以直接拼接）；计数为 stage = "count:名称"、n = 数量 的行
+CSV_FIELDS = ("name", "wall_s", "items", "items_per_s", "stage", "n", "total_s", "mean_ms", "p50_ms", "p95_ms",
+              "max_ms")
+
+
+class _NullStats:
+    """不记录任何东西"""
+
+    def time(self, stage):
+        return nullcontext()
+
+    def record(self, stage, seconds):
+        pass
+
+    def count(self, name, n=1):
+        pass
+
+
+NULL_STATS = _NullStats()
+
+
+class ItemStats:
+    """一个文件的各阶段耗时（同一阶段多次计时累加）和计数"""
+
+    def __init__(self, name):
+        self.name = name
+        self.times = {}
+        self.counts = {}
+
+    @contextmanager
+    def time(self, stage):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - t0)
+
+    def record(self, stage, seconds):
+        self.times[stage] = self.times.get(stage, 0.0) + seconds
+
+    def count(self, name, n=1):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def as_dict(self):
+        return {"name": self.name, "times": self.times, "counts": self.counts}
+
+
+def timed_iter(iterable, stats, stage):
+    """逐个产出 iterable 的元素，取下一个元素所花的时间记入 stats 的 stage（用于计时生成器本身）"""
+    it = iter(iterable)
+    while True:
+        with stats.time(stage):
+            try:
+                item = next(it)
+            except StopIteration:
+                return
+        yield item
+
+
+def _summarize(samples):
+    arr = np.asarray(samples, dtype=np.float64) * 1000
+    p50, p95 = np.percentile(arr, [50, 95])
+    return {"n": len(arr), "total_s": round(float(arr.sum()) / 1000, 4), "mean_ms": round(float(arr.mean()), 3),
+            "p50_ms": round(float(p50), 3), "p95_ms": round(float(p95), 3), "max_ms": round(float(arr.max()), 3)}
+
+
+class RunStats:
+    """一次运行的全部计时样本：各阶段每次耗时一个样本，逐文件记录另存一份明细
+
+    item_count 为计数器名称时，处理数取该计数（不调用 add_item 的界面程序用），否则为逐文件记录数。
+    """
+
+    def __init__(self, name, item_count=None):
+        self.name = name
+        self.item_count = item_count
+        self.start = time.perf_counter()
+        self.samples = {}  # 阶段 -> [秒]
+        self.counts = {}
+        self.items = []  # 逐文件明细（ItemStats.as_dict()）
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def time(self, stage):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - t0)
+
+    def record(self, stage, seconds):
+        with self.lock:
+            self.samples.setdefault(stage, []).append(seconds)
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counts[name] = self.counts.get(name, 0) + n
+
+    def add_item(self, item):
+        """合并一个文件的记录（可来自子进程）"""
+        with self.lock:
+            self.items.append(item)
+            for stage, seconds in item["times"].items():
+                self.samples.setdefault(stage, []).append(seconds)
+            for name, n in item["counts"].items():
+                self.counts[name] = self.counts.get(name, 0) + n
+
+    def summary(self):
+        with self.lock:
+            wall = time.perf_counter() - self.start
+            items = self.counts.get(self.item_count, 0) if self.item_count else len(self.items)
+            summary = {
+                "name": self.name,
+                "wall_s": round(wall, 3),
+                "items": items,
+                "items_per_s": round(items / wall, 3) if wall > 0 else None,
+                "stages": {stage: _summarize(s) for stage, s in self.samples.items() if s},
+                "counts": dict(self.counts),
+            }
+        return summary
+
+    def format_summary(self):
+        """终端输出用的多行表格"""
+        summary = self.summary()
+        head = f"⏱ {summary['name']}: {summary['wall_s']:.1f} 秒"
+        if summary["items"]:
+            head += f"，{summary['items']} 个文件，{summary['items_per_s']:.2f} 个/秒"
+        lines = [head]
+        lines.append(f"  {'阶段':<8}{'次数':>6}{'总计(s)':>8}{'p50(ms)':>10}{'p95(ms)':>10}{'max(ms)':>10}")  # 中文占两列
+        for stage, s in summary["stages"].items():
+            lines.append(f"  {stage:<10}{s['n']:>8}{s['total_s']:>10.2f}{s['p50_ms']:>10.1f}"
+                         f"{s['p95_ms']:>10.1f}{s['max_ms']:>10.1f}")
+        if summary["counts"]:
+            lines.append("  计数: " + ", ".join(f"{k} {v}" for k, v in summary["counts"].items()))
+        return "\n".join(lines)
+
+    def write_report(self, path):
+        """按扩展名写出报告：.csv 为各阶段汇总表（见 CSV_FIELDS），其余为 JSON（汇总 + 逐文件明细）"""
+        summary = self.summary()
+        if path.lower().endswith(".csv"):
+            run = {k: summary[k] for k in ("name", "wall_s", "items", "items_per_s")}
+            with open(path, "w", encoding="utf-8", newline="") as f:
+                writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+                writer.writeheader()
+                for stage, s in summary["stages"].items():
+                    writer.writerow({**run, "stage": stage, **s})
+                for name, n in summary["counts"].items():
+                    writer.writerow({**run, "stage": f"count:{name}", "n": n})
+            return
+        with self.lock:
+            summary["items_detail"] = list(self.items)
+        atomic_write_text(path, json.dumps(summary, ensure_ascii=False, indent=1))
@@ -0,0 +1,100 @@
+import numpy as np
+import cv2
+
+
+def find_instances(masks):
+    """一次遍历整张 mask，求出每个实例的 id、外接框和像素面积
+
+    返回 (ids, boxes, areas)：
+        ids   : (N,) 实例 id（已去掉背景 0，升序）
+        boxes : (N, 4) 外接框 [y0, x0, y1, x1]，右/下边界为开区间
+        areas : (N,) 每个实例的像素数
+    """
+    h, w = masks.shape
+    flat = masks.ravel()
+
+    # 只处理前景像素，按实例 id 稳定排序后同一实例的像素连续排列
+    fg = np.flatnonzero(flat)
+    if fg.size == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, np.zeros((0, 4), dtype=np.int64), empty
+
+    labels = flat[fg]
+    order = np.argsort(labels, kind="stable")
+    fg = fg[order]
+    labels = labels[order]
+
+    ids, starts, areas = np.unique(labels, return_index=True, return_counts=True)
+    ys, xs = np.divmod(fg, w)
+
+    # 组内像素按行优先顺序排列：首尾即为 y 的最小/最大值，x 需要分段归约
+    y0 = ys[starts]
+    y1 = ys[starts + areas - 1] + 1
+    x0 = np.minimum.reduceat(xs, starts)
+    x1 = np.maximum.reduceat(xs, starts) + 1
+
+    boxes = np.stack([y0, x0, y1, x1], axis=1)
+    return ids, boxes, areas
+
+
+def iter_instance_rois(masks, min_area=0):
+    """逐实例产出 (inst_id, binary_roi, (x_off, y_off))
+
+    binary_roi 只覆盖该实例外接框外扩 1 像素（不超出原图）的区域，
+    在 ROI 上找到的轮廓加上偏移量即为原图坐标。
+    """
+    h, w = masks.shape
+    ids, boxes, areas = find_instances(masks)
+
+    for inst_id, (y0, x0, y1, x1), area in zip(ids, boxes, areas):
+        if area < min_area:
+            continue
+
+        # 外扩 1 像素，保证轮廓追踪与整图上的结果一致
+        y0 = max(y0 - 1, 0)
+        x0 = max(x0 - 1, 0)
+        y1 = min(y1 + 1, h)
+        x1 = min(x1 + 1, w)
+
+        binary = (masks[y0:y1, x0:x1] == inst_id).astype(np.uint8)
+        yield inst_id, binary, (int(x0), int(y0))
+
+
+def instance_contours(masks, min_area=10):
+    """逐实例在 ROI 内找外轮廓，产出 (inst_id, contours)，坐标为原图坐标"""
+    for inst_id, binary, offset in iter_instance_rois(masks, min_area):
+        contours, _ = cv2.findContours(
+            binary,
+            cv2.RETR_EXTERNAL,
+            cv2.CHAIN_APPROX_SIMPLE,
+            offset=offset
+        )
+        yield inst_id, contours
+
+
+def rasterize_polygons(polygons, inst_ids, shape):
+    """把多边形（像素坐标）按实例 id 填充回实例图，用于和原始 mask 对比"""
+    canvas = np.zeros(shape, dtype=np.int32)
+    for poly, inst_id in zip(polygons, inst_ids):
+        pts = np.round(np.asarray(poly).reshape(-1, 1, 2)).astype(np.int32)
+        cv2.fillPoly(canvas, [pts], int(inst_id))
+    return canvas
+
+
+def instance_iou(gt, pred):
+    """逐实例 IoU：gt/pred 为同尺寸的实例图，实例 id 需一一对应
+
+    返回 (ids, iou)，ids 为 gt 中出现的实例；pred 中缺失的实例 IoU 为 0。
+    """
+    gt = np.asarray(gt).ravel().astype(np.int64)
+    pred = np.asarray(pred).ravel().astype(np.int64)
+    size = int(max(gt.max(initial=0), pred.max(initial=0))) + 1
+
+    area_gt = np.bincount(gt, minlength=size)
+    area_pred = np.bincount(pred, minlength=size)
+    inter = np.bincount(gt[gt == pred], minlength=size)
+
+    ids = np.flatnonzero(area_gt)
+    ids = ids[ids != 0]
+    union = area_gt[ids] + area_pred[ids] - inter[ids]
+    return ids, inter[ids] / np.maximum(union, 1)
@@ -0,0 +1,141 @@
+import os
+import pickle
+import tempfile
+import numpy as np
+
+from label_io import _UMASK
+
+MASK_CACHE_DIRNAME = "_masks_cache"  # 缓存目录名（位于 _seg.npy 所在目录下）
+
+# numpy 1.x / 2.x 中 ndarray 反序列化入口的两种模块路径
+_RECONSTRUCT = {
+    ("numpy.core.multiarray", "_reconstruct"),
+    ("numpy._core.multiarray", "_reconstruct"),
+}
+
+
+class _LazyArray:
+    """反序列化时代替 ndarray：只记下形状/类型和原始字节，不做拷贝"""
+
+    def __init__(self, *args):
+        self.shape = ()
+        self.dtype = None
+        self.fortran = False
+        self.raw = None
+
+    def __setstate__(self, state):
+        _, self.shape, self.dtype, self.fortran, self.raw = state
+
+    def materialize(self):
+        """把原始字节零拷贝地包装成 ndarray（只读）"""
+        if self.dtype.hasobject:
+            arr = np.empty(len(self.raw), dtype=object)
+            arr[:] = self.raw
+            return arr.reshape(self.shape)
+        order = "F" if self.fortran else "C"
+        return np.frombuffer(self.raw, dtype=self.dtype).reshape(self.shape, order=order)
+
+
+class _LeanUnpickler(pickle.Unpickler):
+    """所有 ndarray 都先反序列化成 _LazyArray，只有需要的才真正转成数组"""
+
+    def find_class(self, module, name):
+        if (module, name) in _RECONSTRUCT:
+            return _LazyArray
+        return super().find_class(module, name)
+
+
+def _read_seg_dict(fp):
+    """读取 .npy 头部后用精简 Unpickler 取出 Cellpose 字典"""
+    version = np.lib.format.read_magic(fp)
+    if version == (1, 0):
+        shape, fortran, dtype = np.lib.format.read_array_header_1_0(fp)
+    else:
+        shape, fortran, dtype = np.lib.format.read_array_header_2_0(fp)
+
+    if not dtype.hasobject:
+        # 不是 pickle 的字典，而是直接保存的数组
+        return None
+
+    top = _LeanUnpickler(fp).load()
+    # np.save 保存字典时外层是一个 0 维 object 数组
+    if isinstance(top, _LazyArray):
+        top = top.raw[0]
+    return top
+
+
+def read_masks(npy_path):
+    """从 _seg.npy 中只取出 masks 数组，flows/outlines/图像等字段不会生成 ndarray"""
+    with open(npy_path, "rb") as fp:
+        data = _read_seg_dict(fp)
+
+    if data is None:
+        # 直接保存的 masks 数组，可以内存映射读取
+        return np.load(npy_path, mmap_mode="r")
+
+    masks = data["masks"]
+    if isinstance(masks, _LazyArray):
+        masks = masks.materialize()
+    return np.asarray(masks)
+
+
+def mask_cache_path(npy_path, cache_dir=None):
+    """masks 缓存文件路径，默认放在 _seg.npy 同目录的 _masks_cache 下"""
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(npy_path), MASK_CACHE_DIRNAME)
+    name = os.path.splitext(os.path.basename(npy_path))[0]
+    return os.path.join(cache_dir, name + ".masks.npy")
+
+
+def _cache_is_fresh(cache_path, npy_path):
+    try:
+        return os.stat(cache_path).st_mtime_ns >= os.stat(npy_path).st_mtime_ns
+    except FileNotFoundError:
+        return False
+
+
+def write_mask_cache(masks, cache_path):
+    """将 masks 以 uint16/uint32 普通 .npy 保存（原子替换），之后可用 mmap 读取"""
+    dtype = np.uint16 if masks.size == 0 or masks.max() <= np.iinfo(np.uint16).max else np.uint32
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp_", suffix=".npy", dir=os.path.dirname(cache_path))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, np.ascontiguousarray(masks, dtype=dtype))
+        os.replace(tmp_path, cache_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def write_seg_masks(npy_path, masks):
+    """按 Cellpose 的 _seg.npy 格式（含 "masks" 的字典）原子写入，供分块后的 masks 使用"""
+    dir_name = os.path.dirname(os.path.abspath(npy_path))
+    os.makedirs(dir_name, exist_ok=True)
+
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp_", suffix=".npy", dir=dir_name)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, {"masks": np.ascontiguousarray(masks)}, allow_pickle=True)
+        os.chmod(tmp_path, 0o666 & ~_UMASK)
+        os.replace(tmp_path, npy_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def load_masks(npy_path, use_cache=False, cache_dir=None):
+    """读取 masks；use_cache=True 时优先内存映射读取缓存，缓存过期或缺失则重建"""
+    if not use_cache:
+        return read_masks(npy_path)
+
+    cache_path = mask_cache_path(npy_path, cache_dir)
+    if _cache_is_fresh(cache_path, npy_path):
+        return np.load(cache_path, mmap_mode="r")
+
+    masks = read_masks(npy_path)
+    write_mask_cache(masks, cache_path)
+    return np.load(cache_path, mmap_mode="r")
@@ -1,62 +1,248 @@
 import os
+import sys
+import json
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 import cv2
 import numpy as np
 
+from label_store import LabelStore
+from large_image import image_size
+from label_parse import parse_yolo_labels, split_polygons
+from label_review import ReviewSession, review_journal_path
+
 IMG_DIR = r"C:\Users\Administrator\PycharmProjects\YOLOimg_cutoff\dataset\dataset122202\images1222"
 LABEL_DIR = r"C:\Users\Administrator\PycharmProjects\YOLOimg_cutoff\dataset\dataset122202\labels122203"
+STORE_PATH = None  # 设为 .ysp 打包文件路径时，从打包文件读取标签而不是 LABEL_DIR
 
-img_list = [f for f in os.listdir(IMG_DIR) if f.endswith((".jpg", ".png"))]
+IMG_EXTS = (".jpg", ".png")
+NUM_WORKERS = os.cpu_count() or 1  # 无界面检验的并行进程数
+MIN_POLY_AREA = 1e-7  # 归一化面积小于该值的多边形视为退化（约为 2k 图上的 0.4 像素²）
 
-for img_name in img_list:
-    base = os.path.splitext(img_name)[0]
-    img_path = os.path.join(IMG_DIR, img_name)
-    label_path = os.path.join(LABEL_DIR, base + ".txt")
 
-    img = cv2.imread(img_path)
-    if img is None:
-        continue
+def interactive_check(img_dir, label_dir, store=None, journal_path=None):
+    """逐张弹窗复查标签：前后翻页、y/n/f 记录结论，ESC 退出，下次从停下的位置继续（按键见 label_review）"""
+    if journal_path is None:
+        journal_path = review_journal_path(label_dir, store.path if store is not None else None)
+    ReviewSession(img_dir, label_dir, journal_path, store, IMG_EXTS).run()
 
-    h, w = img.shape[:2]
 
-    if not os.path.exists(label_path):
-        print(f"[WARN] No label for {img_name}")
-        continue
+# ================= 无界面批量检验 =================
+
+def check_label_text(text):
+    """检查标签文本（两种格式自动识别），返回 (问题列表, 合法多边形列表)
+
+    解析和逐多边形的检查都是整个文件上的数组运算，问题按行号排序。
+    """
+    labels = parse_yolo_labels(text, dtype=np.float64)
+    bad = [{"line": line_no, "type": kind, "msg": msg} for line_no, kind, msg in labels.bad]
+    issues, polygons = check_polygons(labels.coords, labels.offsets, labels.lines)
+    issues = sorted(bad + issues, key=lambda item: item["line"])
+    return issues, polygons
+
+
+def check_polygons(coords, offsets, lines):
+    """检查扁平坐标 + 偏移表示的多边形（lines 为每个多边形的行号），返回 (问题列表, 合法多边形列表)"""
+    coords = np.asarray(coords, dtype=np.float64)
+    n = len(offsets) - 1
+    poly_of = np.repeat(np.arange(n), np.diff(offsets))
+
+    # 坐标超出 [0, 1]（含 NaN / inf）
+    bad_pt = ~(np.isfinite(coords) & (coords >= 0) & (coords <= 1)).all(axis=1)
+    out_of_range = np.bincount(poly_of, weights=bad_pt, minlength=n) > 0
+
+    # 不同顶点数：按 (多边形, x, y) 排序后数相邻不同的点
+    order = np.lexsort((coords[:, 1], coords[:, 0], poly_of))
+    sorted_pts, sorted_poly = coords[order], poly_of[order]
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = (sorted_poly[1:] != sorted_poly[:-1]) | (sorted_pts[1:] != sorted_pts[:-1]).any(axis=1)
+    distinct = np.bincount(sorted_poly, weights=first, minlength=n)
 
-    with open(label_path, "r") as f:
-        lines = f.readlines()
+    # 鞋带公式：每个点与同一多边形内的下一个点（最后一个点接回第一个点）
+    nxt = np.arange(1, len(coords) + 1)
+    nxt[offsets[1:] - 1] = offsets[:-1]
+    cross = coords[:, 0] * coords[nxt, 1] - coords[nxt, 0] * coords[:, 1]
+    area = 0.5 * np.abs(np.bincount(poly_of, weights=cross, minlength=n))
 
-    for line in lines:
-        parts = list(map(float, line.strip().split()))
-        if len(parts) < 11:
-            print(f"[ERROR] Invalid seg label: {label_path}")
-            continue
+    degenerate = ~out_of_range & (distinct < 3)
+    too_small = ~out_of_range & ~degenerate & (area < MIN_POLY_AREA)
+    lines = np.asarray(lines).tolist()
+    issues = []
+    for i in np.flatnonzero(out_of_range):
+        issues.append({"line": lines[i], "type": "out_of_range", "msg": "坐标超出 [0, 1]"})
+    for i in np.flatnonzero(degenerate):
+        issues.append({"line": lines[i], "type": "degenerate",
+                       "msg": f"不同的顶点少于 3 个（共 {offsets[i + 1] - offsets[i]} 个点）"})
+    for i in np.flatnonzero(too_small):
+        issues.append({"line": lines[i], "type": "degenerate", "msg": f"多边形面积过小（{area[i]:.2e}）"})
+    issues.sort(key=lambda item: item["line"])
 
-        cls = int(parts[0])
-        cx, cy, bw, bh = parts[1:5]
-        poly = parts[5:]
+    keep = ~(out_of_range | degenerate | too_small)
+    polygons = [poly for poly, ok in zip(split_polygons(coords, offsets), keep) if ok]
+    return issues, polygons
 
-        # ---------- bbox ----------
-        x1 = int((cx - bw / 2) * w)
-        y1 = int((cy - bh / 2) * h)
-        x2 = int((cx + bw / 2) * w)
-        y2 = int((cy + bh / 2) * h)
 
-        cv2.rectangle(img, (x1, y1), (x2, y2), (0, 255, 0), 2)
+_stores = {}
 
-        # ---------- polygon ----------
-        pts = []
-        for i in range(0, len(poly), 2):
-            px = int(poly[i] * w)
-            py = int(poly[i + 1] * h)
-            pts.append([px, py])
 
-        pts = np.array(pts, np.int32).reshape((-1, 1, 2))
-        cv2.polylines(img, [pts], isClosed=True, color=(0, 0, 255), thickness=2)
+def _open_store(store_path):
+    """每个进程只打开一次打包文件"""
+    if store_path not in _stores:
+        _stores[store_path] = LabelStore(store_path)
+    return _stores[store_path]
 
-    cv2.imshow("YOLO Seg Label Check", img)
-    key = cv2.waitKey(0)
 
-    if key == 27:  # ESC 退出
-        break
+def check_labels(base, label_path, store_path=None):
+    """检查一张图片的标签，没有标签时返回 None
 
-cv2.destroyAllWindows()
+    使用打包文件时直接检查内存映射的坐标数组（行号为导出成 .txt 后的行号），不经过文本。
+    """
+    if store_path:
+        store = _open_store(store_path)
+        if base not in store:
+            return None
+        coords, offsets, _ = store.get(base)
+        return check_polygons(coords, offsets, np.arange(1, len(offsets)))
+
+    if not os.path.exists(label_path):
+        return None
+    with open(label_path, "rb") as f:
+        return check_label_text(f.read())
+
+
+def render_overlay(img, polygons, out_path):
+    """把多边形画到图片上并保存，不需要显示器"""
+    h, w = img.shape[:2]
+    pts = [np.round(p * (w, h)).astype(np.int32).reshape((-1, 1, 2)) for p in polygons]
+    cv2.polylines(img, pts, isClosed=True, color=(0, 0, 255), thickness=2)
+    cv2.imwrite(out_path, img)
+
+
+def check_image(img_path):
+    """不渲染时也读一遍图片文件头（不解码像素），无法读取或尺寸为 0 时返回 bad_image 问题"""
+    try:
+        w, h = image_size(img_path)
+    except Exception as e:
+        return [{"line": 0, "type": "bad_image", "msg": f"图片无法读取: {type(e).__name__}: {e}"}]
+    if not (w and h):
+        return [{"line": 0, "type": "bad_image", "msg": f"图片尺寸为 {w}x{h}"}]
+    return []
+
+
+def check_pair(img_path, label_path, store_path=None, render_dir=None):
+    """检查一对图片/标签，返回结果字典（子进程入口，异常也记为问题）"""
+    img_name = os.path.basename(img_path)
+    base = os.path.splitext(img_name)[0]
+    result = {"image": img_name, "label": base + ".txt", "instances": 0, "issues": []}
+
+    try:
+        result["issues"].extend(check_image(img_path))
+        checked = check_labels(base, label_path, store_path)
+        if checked is None:
+            result["issues"].append({"line": 0, "type": "missing_label", "msg": "没有对应的标签"})
+            return result
+
+        issues, polygons = checked
+        result["issues"].extend(issues)
+        result["instances"] = len(polygons)
+
+        if render_dir:
+            img = cv2.imread(img_path)
+            if img is None:
+                result["issues"].append({"line": 0, "type": "bad_image", "msg": "图片无法解码"})
+            else:
+                render_overlay(img, polygons, os.path.join(render_dir, base + ".png"))
+    except Exception as e:
+        result["issues"].append({"line": 0, "type": "error", "msg": f"{type(e).__name__}: {e}"})
+
+    return result
+
+
+def headless_check(img_dir, label_dir, store_path=None, workers=NUM_WORKERS, render_dir=None):
+    """并行检查整个数据集，返回报告字典"""
+    img_names = sorted(f for f in os.listdir(img_dir) if f.endswith(IMG_EXTS))
+    img_bases = {os.path.splitext(f)[0] for f in img_names}
+
+    if store_path:
+        label_bases = set(LabelStore(store_path).names)
+    else:
+        label_bases = {os.path.splitext(f)[0] for f in os.listdir(label_dir) if f.endswith(".txt")}
+
+    if render_dir:
+        os.makedirs(render_dir, exist_ok=True)
+
+    jobs = [(os.path.join(img_dir, f), os.path.join(label_dir, os.path.splitext(f)[0] + ".txt"))
+            for f in img_names]
+
+    if workers <= 1 or len(jobs) <= 1:
+        results = [check_pair(img_path, label_path, store_path, render_dir) for img_path, label_path in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(
+                check_pair,
+                [j[0] for j in jobs],
+                [j[1] for j in jobs],
+                [store_path] * len(jobs),
+                [render_dir] * len(jobs),
+                chunksize=max(1, len(jobs) // (workers * 8))
+            ))
+
+    # 有标签但没有图片
+    for base in sorted(label_bases - img_bases):
+        results.append({"image": None, "label": base + ".txt", "instances": 0,
+                        "issues": [{"line": 0, "type": "missing_image", "msg": "没有对应的图片"}]})
+
+    counts = {}
+    for r in results:
+        for item in r["issues"]:
+            counts[item["type"]] = counts.get(item["type"], 0) + 1
+
+    return {
+        "summary": {
+            "images": len(img_names),
+            "labels": len(label_bases),
+            "instances": sum(r["instances"] for r in results),
+            "files_with_issues": sum(1 for r in results if r["issues"]),
+            "issues": counts,
+        },
+        "files": [r for r in results if r["issues"]],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="YOLO seg 标签检验")
+    parser.add_argument("--img-dir", default=IMG_DIR)
+    parser.add_argument("--label-dir", default=LABEL_DIR)
+    parser.add_argument("--store", default=STORE_PATH, help="从 .ysp 打包文件读取标签")
+    parser.add_argument("--headless", action="store_true", help="不弹窗，批量检查并输出报告")
+    parser.add_argument("--workers", type=int, default=NUM_WORKERS)
+    parser.add_argument("--report", default=None, help="检验报告 JSON 路径（默认打印到终端）")
+    parser.add_argument("--render-dir", default=None, help="把叠加标签的图片保存到该目录")
+    parser.add_argument("--review-journal", default=None,
+                        help="复查日志路径（默认为标签目录下的 review_journal.jsonl）")
+    args = parser.parse_args()
+
+    if not args.headless:
+        store = LabelStore(args.store) if args.store else None
+        interactive_check(args.img_dir, args.label_dir, store, args.review_journal)
+        return
+
+    report = headless_check(args.img_dir, args.label_dir, args.store, args.workers, args.render_dir)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+
+    # 汇总行写到 stderr，stdout 上只有 JSON 报告，可以直接接 | jq
+    summary = report["summary"]
+    print(f"[INFO] {summary['images']} images, {summary['labels']} labels, "
+          f"{summary['files_with_issues']} files with issues: {summary['issues']}", file=sys.stderr)
+
+    # 有问题时返回非零退出码，便于在流水线中卡住数据集构建
+    raise SystemExit(1 if summary["files_with_issues"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""转换脚本的输出必须与最初的逐实例整图比较算法逐字节一致"""
+import numpy as np
+import cv2
+import pytest
+
+import cellpose標簽轉換 as converter
+
+
+def reference_labels(masks):
+    """最初版本的算法：每个实例在整图上做 masks == id，再找轮廓、简化、逐点格式化"""
+    h, w = masks.shape
+    lines = []
+    for inst_id in np.unique(masks):
+        if inst_id == 0:
+            continue
+        binary = (masks == inst_id).astype(np.uint8)
+        if binary.sum() < 10:
+            continue
+        contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        for cnt in contours:
+            cnt = cv2.approxPolyDP(cnt, epsilon=1.5, closed=True)
+            if len(cnt) < 6:
+                continue
+            line = "0"
+            for p in cnt:
+                x, y = p[0]
+                line += f" {x / w:.6f} {y / h:.6f}"
+            lines.append(line + "\n")
+    return "".join(lines)
+
+
+def synth_masks(dtype, seed=0, shape=(240, 320)):
+    """随机椭圆 + 带洞的环 + 两个连通块的实例 + 贴边实例 + 面积过小的实例"""
+    rng = np.random.default_rng(seed)
+    canvas = np.zeros(shape, dtype=np.int32)
+    h, w = shape
+    for i in range(1, 41):
+        center = (int(rng.integers(0, w)), int(rng.integers(0, h)))
+        axes = (int(rng.integers(3, 20)), int(rng.integers(3, 20)))
+        cv2.ellipse(canvas, center, axes, float(rng.uniform(0, 180)), 0, 360, i, -1)
+    cv2.circle(canvas, (60, 60), 25, 41, -1)
+    cv2.circle(canvas, (60, 60), 10, 0, -1)  # 环：外轮廓只有一个
+    cv2.rectangle(canvas, (200, 10), (215, 25), 42, -1)
+    cv2.rectangle(canvas, (240, 10), (255, 25), 42, -1)  # 同一实例的两个连通块
+    cv2.rectangle(canvas, (0, h - 15), (30, h - 1), 43, -1)  # 贴左下边缘
+    canvas[5, 5:8] = 44  # 3 个像素，应被丢弃
+    return canvas.astype(dtype)
+
+
+@pytest.mark.parametrize("dtype", [np.uint16, np.uint32])
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_convert_file_matches_reference(tmp_path, dtype, seed):
+    masks = synth_masks(dtype, seed)
+    npy_path = tmp_path / "a_seg.npy"
+    np.save(npy_path, {"masks": masks, "outlines": np.zeros_like(masks), "filename": "a.png"}, allow_pickle=True)
+    label_path = tmp_path / "a.txt"
+
+    converter.convert_file(str(npy_path), str(label_path))
+
+    assert label_path.read_text() == reference_labels(masks)
+
+
+def test_instance_polygons_matches_reference():
+    masks = synth_masks(np.uint16, 3)
+    h, w = masks.shape
+    polygons = [poly for _, poly in converter.instance_polygons(masks)]
+    expected = reference_labels(masks).splitlines()
+    assert len(polygons) == len(expected)
+    for poly, line in zip(polygons, expected):
+        coords = np.array(line.split()[1:], dtype=np.float64).reshape(-1, 2)
+        np.testing.assert_allclose(poly.reshape(-1, 2) / (w, h), coords, atol=5e-7)
+
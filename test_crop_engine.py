@@ -0,0 +1,131 @@
+"""无界面裁剪：清单读取与编号、越界平移、输出缩放、日志重放参考裁剪、标注随裁剪输出、按图片汇总错误"""
+import json
+import os
+
+import cv2
+import numpy as np
+import pytest
+from PIL import Image
+
+from crop_engine import REF_CROP_H, REF_CROP_W, box_from_center, clamp_box, crop_one_image, load_specs, run_specs
+from crop_journal import CropJournal
+from crop_labels import tile_label_paths
+from seg_io import read_masks, write_seg_masks
+
+W, H = 300, 200
+
+
+@pytest.fixture
+def image_path(tmp_path):
+    arr = np.random.default_rng(0).integers(0, 256, (H, W, 3), dtype=np.uint8)
+    path = tmp_path / "imgs" / "a.png"
+    path.parent.mkdir()
+    Image.fromarray(arr).save(path)
+    return str(path)
+
+
+def spec(image, cx, cy, size=64, idx=1, clamp=True):
+    return {"image": image, "cx": cx, "cy": cy, "w": size, "h": size, "idx": idx, "clamp": clamp}
+
+
+def test_box_from_center_and_clamp():
+    assert box_from_center(100, 50, 64, 32) == (68, 34, 132, 66)
+    assert clamp_box((-10, 180, 54, 244), W, H) == (0, 136, 64, 200)
+    assert clamp_box((250, -5, 314, 59), W, H) == (236, 0, 300, 64)
+    assert clamp_box((10, 10, 74, 74), W, H) == (10, 10, 74, 74)
+
+
+def test_load_specs_json_and_csv(tmp_path):
+    rows = [
+        {"image": "imgs/a.png", "cx": 10, "cy": 20},
+        {"image": "imgs/b.png", "cx": 1, "cy": 2, "size": 100},
+        {"image": "imgs/a.png", "cx": 30, "cy": 40, "w": 50, "h": 60, "clamp": 0},
+        {"image": "imgs/a.png", "cx": 5, "cy": 5, "idx": 9},
+    ]
+    (tmp_path / "crops.json").write_text(json.dumps(rows))
+    (tmp_path / "crops.csv").write_text(
+        "image,cx,cy,size,w,h,idx,clamp\n"
+        "imgs/a.png,10,20,,,,,\n"
+        "imgs/b.png,1,2,100,,,,\n"
+        "imgs/a.png,30,40,,50,60,,false\n"
+        "imgs/a.png,5,5,,,,9,\n", encoding="utf-8")
+
+    for name in ("crops.json", "crops.csv"):
+        specs = load_specs(str(tmp_path / name))
+        assert [s["image"] for s in specs] == [str(tmp_path / "imgs" / n) for n in ("a.png", "b.png", "a.png", "a.png")]
+        assert [(s["w"], s["h"]) for s in specs] == [(640, 640), (100, 100), (50, 60), (640, 640)]
+        assert [s["idx"] for s in specs] == [1, 1, 2, 9]  # 未写 idx 的按图片内出现顺序编号
+        assert [s["clamp"] for s in specs] == [True, True, False, True]
+
+
+def test_crop_one_image_clamps_resizes_and_converts(image_path, tmp_path):
+    out_dir = str(tmp_path / "out")
+    specs = [spec(image_path, 10, 10, idx=1), spec(image_path, 10, 10, idx=2, clamp=False)]
+    path, saved, error = crop_one_image(image_path, specs, out_dir)
+    assert error is None and [os.path.basename(p) for p in saved] == ["a_cut_1.png", "a_cut_2.png"]
+
+    full = Image.open(image_path)
+    assert np.array_equal(np.asarray(Image.open(saved[0])), np.asarray(full.crop((0, 0, 64, 64))))
+    unclamped = np.asarray(Image.open(saved[1]))
+    assert unclamped.shape == (64, 64, 3) and not unclamped[:22, :22].any()  # 图外部分为 0，与 PIL crop 一致
+
+    _, saved, error = crop_one_image(image_path, specs[:1], out_dir, ext=".jpg", size=100, out_size=(32, 32))
+    assert error is None and saved[0].endswith("a_cut_1.jpg")
+    assert Image.open(saved[0]).size == (32, 32)
+
+
+def test_annotations_follow_the_crop(image_path, tmp_path):
+    masks = np.zeros((H, W), dtype=np.uint16)
+    cv2.circle(masks, (40, 40), 20, 1, -1)
+    cv2.circle(masks, (200, 120), 25, 2, -1)
+    write_seg_masks(image_path.replace(".png", "_seg.npy"), masks)
+
+    out_dir = str(tmp_path / "out")
+    annotate = {"write_masks": True, "write_labels": True}
+    _, saved, error = crop_one_image(image_path, [spec(image_path, 200, 120, size=80)], out_dir, annotate=annotate)
+    assert error is None
+    label_path, mask_path = tile_label_paths(out_dir, "a_cut_1")
+    tile = read_masks(mask_path)
+    assert np.array_equal(tile, masks[80:160, 160:240])
+    with open(label_path) as f:
+        assert len(f.readlines()) == 1
+
+    # 输出缩放时 masks 按最近邻缩放到相同尺寸
+    _, _, error = crop_one_image(image_path, [spec(image_path, 200, 120, size=80)], out_dir,
+                                 out_size=(40, 40), annotate=annotate)
+    assert error is None and read_masks(mask_path).shape == (40, 40)
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_run_specs_reports_failures_per_image(image_path, tmp_path, workers):
+    missing = str(tmp_path / "imgs" / "missing.png")
+    specs = [spec(image_path, 50, 50, idx=1), spec(missing, 50, 50), spec(image_path, 150, 100, idx=2)]
+    saved, failed = run_specs(specs, str(tmp_path / "out"), workers=workers)
+    assert saved == 2
+    assert [path for path, _ in failed] == [missing]
+    assert "FileNotFoundError" in failed[0][1]
+
+
+def test_journal_ref_replay_keeps_out_size(tmp_path, image_path):
+    path = str(tmp_path / "imgs" / "cutoff" / "crop_journal.jsonl")
+    journal = CropJournal(path)
+    # 配准带缩放：参考图裁剪框 80×80，界面缩放到 REF_CROP 保存；旧日志没有 out_size
+    journal.record_crop("a.png", 1, (0, 0, 64, 64), ref_image=image_path, ref_box=(10, 10, 90, 90),
+                        ref_out_size=(50, 40))
+    journal.record_crop("a.png", 2, (0, 0, 64, 64), ref_image=image_path, ref_box=(20, 20, 100, 100))
+    journal.close()
+
+    specs = load_specs(path, ref=True)
+    assert [s["out_size"] for s in specs] == [(50, 40), (REF_CROP_W, REF_CROP_H)]
+    out_dir = str(tmp_path / "ref_out")
+    saved, failed = run_specs(specs, out_dir, workers=1)
+    assert saved == 2 and failed == []
+    with Image.open(os.path.join(out_dir, "a_cut_1.png")) as img:
+        assert img.size == (50, 40)
+    with Image.open(os.path.join(out_dir, "a_cut_2.png")) as img:
+        assert img.size == (REF_CROP_W, REF_CROP_H)
+
+    # 命令行 --out-size 优先
+    run_specs(specs, out_dir, workers=1, out_size=(32, 32))
+    with Image.open(os.path.join(out_dir, "a_cut_1.png")) as img:
+        assert img.size == (32, 32)
@@ -0,0 +1,93 @@
+"""裁剪日志：损坏行的跳过与报告、写到一半的行的修复、重放得到的标注和序号"""
+import json
+import os
+
+from crop_journal import CropJournal, journal_specs, open_append, read_events
+
+
+def test_broken_tail_is_repaired_before_append(tmp_path):
+    path = str(tmp_path / "cutoff" / "crop_journal.jsonl")
+    journal = CropJournal(path)
+    journal.record_crop("a.png", 1, (0, 0, 10, 10))
+    journal.close()
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"op": "crop", "image": "a.png", "idx"')  # 崩溃时写到一半
+
+    journal = CropJournal(path)
+    assert journal.skipped == [(2, '{"op": "crop", "image": "a.png", "idx"')]
+    journal.record_crop("a.png", journal.next_index("a.png"), (5, 5, 15, 15))
+    journal.close()
+
+    events, skipped = read_events(path)
+    assert [e["idx"] for e in events] == [1, 2]
+    assert [n for n, _ in skipped] == [2]  # 新记录没有接在损坏行后面
+
+
+def test_open_append_keeps_complete_file_untouched(tmp_path):
+    path = str(tmp_path / "j.jsonl")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('{"op": "clear", "image": "a.png"}\n')
+    open_append(path).close()
+    with open(path, encoding="utf-8") as f:
+        assert f.read() == '{"op": "clear", "image": "a.png"}\n'
+
+
+def test_replay_clear_and_index(tmp_path):
+    path = str(tmp_path / "crop_journal.jsonl")
+    journal = CropJournal(path)
+    journal.record_crop("a.png", 1, (0, 0, 10, 10))
+    journal.record_crop("a.png", 2, (10, 0, 20, 10))
+    journal.record_crop("b.png", 1, (0, 0, 4, 4))
+    journal.record_clear("a.png")
+    journal.record_crop("a.png", journal.next_index("a.png"), (1, 1, 11, 11))
+    journal.close()
+
+    reopened = CropJournal(path)
+    assert reopened.skipped == []
+    assert reopened.regions("a.png") == [(1, 1, 11, 11, 3)]  # 清除后序号继续递增
+    assert reopened.next_index("a.png") == 4
+    assert reopened.regions("b.png") == [(0, 0, 4, 4, 1)]
+    assert reopened.next_index("c.png") == 1
+
+
+def test_skipped_lines_keep_line_numbers(tmp_path):
+    path = str(tmp_path / "j.jsonl")
+    lines = [json.dumps({"op": "clear", "image": "a.png"}), "not json", "", "{", json.dumps({"op": "clear", "image": "b.png"})]
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    events, skipped = read_events(path)
+    assert [e["image"] for e in events] == ["a.png", "b.png"]
+    assert skipped == [(2, "not json"), (4, "{")]
+
+
+def test_journal_specs_main_and_ref(tmp_path):
+    folder = tmp_path / "images"
+    path = str(folder / "cutoff" / "crop_journal.jsonl")
+    journal = CropJournal(path)
+    journal.record_crop("a.png", 1, (0, 0, 10, 20), ref_image="/ref/a.png", ref_box=(2, 2, 8, 8))
+    journal.record_clear("a.png")
+    journal.record_crop("a.png", 2, (4, 4, 6, 6))
+    journal.close()
+
+    rows, skipped = journal_specs(path)
+    assert skipped == []
+    assert [(r["image"], r["idx"], r["cx"], r["cy"], r["w"], r["h"]) for r in rows] == [
+        (os.path.join(str(folder), "a.png"), 1, 5, 10, 10, 20),
+        (os.path.join(str(folder), "a.png"), 2, 5, 5, 2, 2),  # 被清除的标注同样导出
+    ]
+    assert all(r["clamp"] is False for r in rows)
+
+    rows, _ = journal_specs(path, ref=True)
+    assert [(r["image"], r["idx"], r["w"], r["out_size"]) for r in rows] == [("/ref/a.png", 1, 6, None)]
+
+
+def test_ref_out_size_is_recorded(tmp_path):
+    path = str(tmp_path / "cutoff" / "crop_journal.jsonl")
+    journal = CropJournal(path)
+    journal.record_crop("a.png", 1, (0, 0, 10, 10), ref_image="/ref/a.png", ref_box=(0, 0, 14, 14),
+                        ref_out_size=(10, 10))
+    journal.close()
+    rows, _ = journal_specs(path, ref=True)
+    assert rows[0]["w"] == 14 and rows[0]["out_size"] == [10, 10]
+    rows, _ = journal_specs(path)
+    assert "out_size" not in rows[0]
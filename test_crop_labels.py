@@ -0,0 +1,65 @@
+"""标注裁剪到分块：凹多边形的面积、分块坐标和碎片过滤，masks 的碎片按整图面积过滤"""
+import numpy as np
+import pytest
+
+from crop_labels import clip_polygon, clip_polygons, crop_instance_masks, instance_areas, polygon_area
+
+# 开口朝下（y 增大方向）的 U 形：30 × 30 的正方形挖掉 x 10–20、y 10–30 的槽，面积 700
+U_SHAPE = np.array([(0, 0), (30, 0), (30, 30), (20, 30), (20, 10), (10, 10), (10, 30), (0, 30)], dtype=np.float64)
+
+
+@pytest.mark.parametrize("box, area", [
+    ((0, 0, 30, 30), 700),  # 完全在内
+    ((0, 0, 30, 20), 500),  # 截掉两条腿的下半截
+    ((5, 15, 25, 40), 150),  # 只剩两条分开的腿（中间由边界上的退化边相连）
+    ((-10, -10, 40, 5), 150),  # 只剩横梁
+    ((12, 12, 18, 28), 0),  # 完全落在槽里
+])
+def test_clip_concave_polygon_area(box, area):
+    clipped = clip_polygon(U_SHAPE, box)
+    clipped_area = polygon_area(clipped) if len(clipped) >= 3 else 0
+    assert clipped_area == pytest.approx(area)
+    if len(clipped):
+        x1, y1, x2, y2 = box
+        assert (clipped[:, 0] >= x1).all() and (clipped[:, 0] <= x2).all()
+        assert (clipped[:, 1] >= y1).all() and (clipped[:, 1] <= y2).all()
+
+
+def random_star(rng, n=24):
+    """随机半径的星形，通常是凹的"""
+    theta = np.sort(rng.uniform(0, 2 * np.pi, n))
+    r = rng.uniform(5, 40, n)
+    return np.stack([np.cos(theta) * r, np.sin(theta) * r], axis=1) + 50
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_complementary_clips_add_up_to_the_whole(seed):
+    rng = np.random.default_rng(seed)
+    poly = random_star(rng)
+    cx, cy = rng.uniform(20, 80, 2)
+    quadrants = [(0, 0, cx, cy), (cx, 0, 100, cy), (0, cy, cx, 100), (cx, cy, 100, 100)]
+    total = sum(polygon_area(clip_polygon(poly, box)) for box in quadrants)
+    assert total == pytest.approx(polygon_area(poly))
+
+
+def test_clip_polygons_shifts_to_tile_and_drops_fragments():
+    square = np.array([(100, 100), (140, 100), (140, 140), (100, 140)], dtype=np.float64)
+    sliver = square + (-75, 0)  # 只有 1 像素宽落在分块内，剩余面积不到原来的 10%
+    outside = square + (500, 500)
+    polys, cls = clip_polygons([square, sliver, outside], [3, 1, 2], (64, 64, 164, 164))
+    assert cls == [3]
+    np.testing.assert_allclose(polys[0], square - 64)
+
+
+def test_sparse_instance_ids_drop_fragments_by_full_area():
+    masks = np.zeros((200, 200), dtype=np.uint32)
+    masks[10:60, 10:60] = 4_000_000_000  # 稀疏的大 id 不能按 id 分配数组
+    masks[100:150, 100:150] = 7
+    masks[0:5, 195:200] = 123_456_789
+    ids, areas = instance_areas(masks)
+    assert ids.tolist() == [7, 123_456_789, 4_000_000_000]
+    assert areas.tolist() == [2500, 25, 2500]
+
+    # 分块内：大 id 剩 50×2=100 像素（不到 10%，丢弃），7 剩 50×50，123456789 剩 5×5
+    tile = crop_instance_masks(masks, (58, 0, 200, 200), (ids, areas), min_area=20)
+    assert set(np.unique(tile).tolist()) == {0, 7, 123_456_789}
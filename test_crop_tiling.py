@@ -0,0 +1,67 @@
+"""自动分块的统计量：小格积分图与逐块直接统计一致，分带求实例中心与整图一致"""
+import cv2
+import numpy as np
+import pytest
+
+from crop_tiling import foreground_fraction, instance_centers, instance_density, median_gray, tile_boxes
+
+
+def brute_tile_sums(values, boxes):
+    return np.array([values[y1:y2, x1:x2].sum() for x1, y1, x2, y2 in boxes])
+
+
+def make_masks(shape, n=40, seed=0):
+    """随机椭圆实例（后画的覆盖先画的），id 从 1 开始"""
+    rng = np.random.default_rng(seed)
+    masks = np.zeros(shape, dtype=np.int32)
+    for i in range(1, n + 1):
+        center = (int(rng.integers(0, shape[1])), int(rng.integers(0, shape[0])))
+        axes = (int(rng.integers(3, 60)), int(rng.integers(3, 60)))
+        cv2.ellipse(masks, center, axes, float(rng.uniform(0, 180)), 0, 360, i, -1)
+    return masks
+
+
+@pytest.mark.parametrize("shape", [(300, 500), (1000, 700), (2000, 1500)])
+def test_median_gray_matches_numpy(shape):
+    gray = np.random.default_rng(shape[0]).integers(0, 256, shape, dtype=np.uint8)
+    assert median_gray(gray) == np.median(gray)
+    assert median_gray(gray[:, :1]) == np.median(gray[:, :1])
+
+
+@pytest.mark.parametrize("size, tile, stride", [((900, 700), 256, 200), ((640, 640), 640, 512), ((300, 200), 256, 128)])
+def test_foreground_fraction_matches_per_tile(size, tile, stride):
+    w, h = size
+    rng = np.random.default_rng(0)
+    gray = cv2.GaussianBlur(rng.integers(0, 256, (h, w), dtype=np.uint8), (0, 0), 5)
+    gray = cv2.normalize(gray, None, 0, 255, cv2.NORM_MINMAX)
+    boxes = tile_boxes(w, h, tile, tile, stride)
+    background = int(np.median(gray))
+    fg = np.abs(gray.astype(np.int64) - background) > 20
+    area = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    np.testing.assert_allclose(foreground_fraction(gray, boxes, bg_delta=20), brute_tile_sums(fg, boxes) / area)
+
+
+def test_instance_centers_are_independent_of_band_size():
+    masks = make_masks((700, 500))
+    ids = np.unique(masks)[1:]
+    expected_y, expected_x = [], []
+    for i in ids:
+        yy, xx = np.nonzero(masks == i)
+        expected_y.append((yy.min() + yy.max()) // 2)
+        expected_x.append((xx.min() + xx.max()) // 2)
+    for band in (37, 256, 10000):
+        cy, cx = instance_centers(masks, band=band)
+        assert cy.tolist() == expected_y and cx.tolist() == expected_x
+
+
+def test_instance_density_matches_per_tile():
+    masks = make_masks((900, 800), n=60, seed=1)
+    boxes = tile_boxes(800, 900, 256, 256, 192)
+    fraction, counts = instance_density(masks, boxes)
+    area = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    np.testing.assert_allclose(fraction, brute_tile_sums(masks > 0, boxes) / area)
+
+    centers = np.zeros(masks.shape, dtype=np.int64)
+    cy, cx = instance_centers(masks)
+    np.add.at(centers, (cy, cx), 1)
+    assert counts.tolist() == brute_tile_sums(centers, boxes).tolist()
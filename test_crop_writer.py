@@ -0,0 +1,78 @@
+"""后台写入队列：按提交顺序写入、失败计数和提示、队列满时不阻塞、close() 写完剩余任务"""
+import queue
+import threading
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from crop_writer import CropWriter, save_image_atomic
+
+
+def test_jobs_run_in_submit_order_and_images_are_saved(tmp_path):
+    writer = CropWriter(workers=1)
+    order = []
+    img = Image.fromarray(np.full((8, 8, 3), 7, dtype=np.uint8))
+    for i in range(10):
+        writer.submit_call(f"job{i}", order.append, i)
+    writer.submit(img, str(tmp_path / "a" / "crop.png"))
+    writer.close()
+    assert order == list(range(10))
+    assert np.array_equal(np.asarray(Image.open(tmp_path / "a" / "crop.png")), np.asarray(img))
+    assert writer.status() == (0, 0) and writer.written == 11
+    assert not list((tmp_path / "a").glob(".*.part"))
+
+
+def test_failures_are_counted_and_reported_once(tmp_path):
+    writer = CropWriter(workers=2)
+
+    def fail(name):
+        raise OSError(f"disk full: {name}")
+
+    writer.submit_call(str(tmp_path / "x.png"), fail, "x")
+    writer.submit_call(str(tmp_path / "ok.png"), lambda: None)
+    writer.submit_call(str(tmp_path / "y.png"), fail, "y")
+    writer.flush()
+    assert writer.status() == (0, 2)
+    assert sorted(msg for _, msg in writer.pop_errors()) == ["OSError: disk full: x", "OSError: disk full: y"]
+    assert writer.pop_errors() == []
+    assert "失败: 2" in writer.status_text() and "disk full" in writer.status_text()
+    writer.close()
+
+
+def test_full_queue_raises_instead_of_blocking():
+    gate = threading.Event()
+    writer = CropWriter(workers=1, maxsize=2)
+    writer.submit_call("busy", gate.wait, 5)
+    while writer.queue.qsize():  # 等后台线程取走第一个任务
+        pass
+    writer.submit_call("a", lambda: None)
+    assert writer.has_room(1) and not writer.has_room(2)
+    writer.submit_call("b", lambda: None)
+    assert not writer.has_room(1)
+    with pytest.raises(queue.Full):
+        writer.submit_call("c", lambda: None)
+    assert writer.status() == (3, 0)  # 没放进去的任务不计入
+    gate.set()
+    writer.close()
+    assert writer.written == 3
+
+
+def test_close_drains_the_queue_and_rejects_new_jobs():
+    writer = CropWriter(workers=2, maxsize=64)
+    done = []
+    for i in range(50):
+        writer.submit_call(str(i), done.append, i)
+    writer.close()
+    assert sorted(done) == list(range(50))
+    assert all(not t.is_alive() for t in writer.threads)
+    with pytest.raises(RuntimeError):
+        writer.submit_call("late", done.append, -1)
+    writer.close()  # 重复关闭无副作用
+
+
+def test_save_image_atomic_leaves_no_partial_file(tmp_path):
+    path = tmp_path / "bad.unknownext"
+    with pytest.raises(Exception):
+        save_image_atomic(Image.new("RGB", (4, 4)), str(path))
+    assert list(tmp_path.iterdir()) == []
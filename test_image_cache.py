@@ -0,0 +1,103 @@
+"""解码预取缓存：按字节的 LRU 淘汰、当前图片不被淘汰、不再需要的预取被取消、peek 不阻塞"""
+import threading
+from concurrent.futures import wait
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import image_cache
+from image_cache import ImagePrefetcher
+
+VIEW = (50, 50)
+SIDE = 100  # 每张原图 100 × 100 RGB = 30000 字节，显示图 50 × 50 = 7500 字节
+ENTRY_BYTES = SIDE * SIDE * 3 + 50 * 50 * 3
+
+
+@pytest.fixture
+def paths(tmp_path):
+    result = []
+    for i in range(6):
+        path = str(tmp_path / f"{i}.png")
+        Image.fromarray(np.full((SIDE, SIDE, 3), i * 40, dtype=np.uint8)).save(path)
+        result.append(path)
+    return result
+
+
+def wait_all(prefetcher):
+    with prefetcher.lock:
+        futures = list(prefetcher.pending.values())
+    wait(futures)
+
+
+def test_lru_eviction_by_bytes(paths):
+    prefetcher = ImagePrefetcher(workers=1, max_bytes=ENTRY_BYTES * 3)
+    try:
+        for path in paths[:3]:
+            prefetcher.get(path, VIEW)
+        prefetcher.get(paths[0], VIEW)  # 0 变为最近使用
+        prefetcher.get(paths[3], VIEW)
+        assert list(prefetcher.cache) == [paths[2], paths[0], paths[3]]
+        original, display = prefetcher.get(paths[2], VIEW)
+        assert original.size == (SIDE, SIDE) and display.size == VIEW
+    finally:
+        prefetcher.shutdown()
+
+
+def test_current_images_are_never_evicted(paths):
+    prefetcher = ImagePrefetcher(workers=1, max_bytes=ENTRY_BYTES * 2)
+    try:
+        prefetcher.get(paths[0], VIEW, owner="main")
+        prefetcher.get(paths[1], VIEW, owner="ref")
+        prefetcher.prefetch(paths[2:5], VIEW)
+        wait_all(prefetcher)
+        assert paths[0] in prefetcher.cache and paths[1] in prefetcher.cache
+        # 单张超出上限时仍然能取到（当前图片保留，旧的预取被淘汰）
+        assert prefetcher.get(paths[5], VIEW)[0].size == (SIDE, SIDE)
+    finally:
+        prefetcher.shutdown()
+
+
+def test_stale_prefetches_are_cancelled(paths, monkeypatch):
+    started, gate = threading.Event(), threading.Event()
+    real = image_cache.decode_image
+
+    def slow_decode(path, view_size, stats):
+        started.set()
+        gate.wait(5)
+        return real(path, view_size, stats)
+
+    monkeypatch.setattr(image_cache, "decode_image", slow_decode)
+    prefetcher = ImagePrefetcher(workers=1)
+    try:
+        prefetcher.prefetch(paths[:1], VIEW, owner="ref")
+        assert started.wait(5)
+        prefetcher.prefetch(paths[:3], VIEW, owner="ref")  # 0 正在解码（取消不了），1、2 排队
+        prefetcher.prefetch(paths[2:4], VIEW, owner="main")
+        prefetcher.prefetch([paths[3]], VIEW, owner="ref")  # 1 不再需要；2 仍被 main 需要
+        assert paths[1] not in prefetcher.pending
+        assert paths[2] in prefetcher.pending and paths[3] in prefetcher.pending
+        gate.set()
+        wait_all(prefetcher)
+        assert set(prefetcher.cache) == {paths[0], paths[2], paths[3]}
+    finally:
+        gate.set()
+        prefetcher.shutdown()
+
+
+def test_peek_does_not_block_and_reports_failures(paths, tmp_path):
+    prefetcher = ImagePrefetcher(workers=1)
+    try:
+        assert prefetcher.peek(paths[0], VIEW, owner="ref") is None
+        wait_all(prefetcher)
+        original, display = prefetcher.peek(paths[0], VIEW, owner="ref")
+        assert display.size == VIEW and prefetcher.current["ref"] == paths[0]
+
+        broken = tmp_path / "broken.png"
+        broken.write_bytes(b"not an image")
+        assert prefetcher.peek(str(broken), VIEW) is None
+        wait_all(prefetcher)
+        with pytest.raises(Exception):
+            prefetcher.peek(str(broken), VIEW)
+    finally:
+        prefetcher.shutdown()
@@ -0,0 +1,74 @@
+"""无界面标签检验：逐多边形检查、打包文件与 .txt 结果一致、图片文件头检查、stdout 只有 JSON"""
+import json
+import subprocess
+import sys
+
+import numpy as np
+from PIL import Image
+
+import seg标签检验1222 as checker
+from label_parse import parse_yolo_labels
+from label_store import LabelStoreWriter
+
+GOOD = "0 0.100000 0.100000 0.300000 0.100000 0.300000 0.300000 0.100000 0.300000\n"
+LABEL_TEXT = (
+    GOOD
+    + "0 0.5 0.5 0.5 0.5 0.6 0.6\n"  # 只有 2 个不同的顶点
+    + "0 0.5 0.5 1.5 0.5 0.6 0.7\n"  # 坐标超出 [0, 1]
+    + "0 0.5 0.5 0.5001 0.5 0.5 0.5001\n"  # 面积过小
+    + "0 0.1 0.2 0.3\n"  # 字段数不对
+    + GOOD
+)
+
+
+def issue_types(issues):
+    return [(item["line"], item["type"]) for item in issues]
+
+
+def test_check_label_text_reports_each_problem_by_line():
+    issues, polygons = checker.check_label_text(LABEL_TEXT)
+    assert issue_types(issues) == [(2, "degenerate"), (3, "out_of_range"), (4, "degenerate"), (5, "malformed")]
+    assert len(polygons) == 2
+
+
+def test_store_arrays_give_the_same_issues_as_text(tmp_path):
+    text = GOOD + "0 0.5 0.5 0.5 0.5 0.6 0.6\n" + "0 0.5 0.5 1.5 0.5 0.6 0.7\n" + GOOD
+    labels = parse_yolo_labels(text)
+    store_path = str(tmp_path / "labels.ysp")
+    with LabelStoreWriter(store_path) as writer:
+        writer.add("a", labels.coords, labels.offsets, labels.cls)
+
+    from_text = checker.check_label_text(text)
+    from_store = checker.check_labels("a", None, store_path)
+    assert issue_types(from_store[0]) == issue_types(from_text[0])
+    assert len(from_store[1]) == len(from_text[1]) == 2
+    assert checker.check_labels("missing", None, store_path) is None
+
+
+def make_dataset(tmp_path):
+    img_dir, label_dir = tmp_path / "images", tmp_path / "labels"
+    img_dir.mkdir()
+    label_dir.mkdir()
+    Image.fromarray(np.zeros((40, 60, 3), dtype=np.uint8)).save(img_dir / "ok.png")
+    (img_dir / "broken.png").write_bytes(b"\x89PNG not really")
+    (label_dir / "ok.txt").write_text(GOOD)
+    (label_dir / "broken.txt").write_text(GOOD)
+    (label_dir / "orphan.txt").write_text(GOOD)
+    return str(img_dir), str(label_dir)
+
+
+def test_headless_check_reports_unreadable_images_without_rendering(tmp_path):
+    img_dir, label_dir = make_dataset(tmp_path)
+    report = checker.headless_check(img_dir, label_dir, workers=1)
+    by_image = {f["image"]: issue_types(f["issues"]) for f in report["files"]}
+    assert by_image == {"broken.png": [(0, "bad_image")], None: [(0, "missing_image")]}
+    assert report["summary"]["instances"] == 2
+
+
+def test_headless_stdout_is_pure_json(tmp_path):
+    img_dir, label_dir = make_dataset(tmp_path)
+    proc = subprocess.run([sys.executable, checker.__file__, "--img-dir", img_dir, "--label-dir", label_dir,
+                           "--headless", "--workers", "1"], capture_output=True, text=True, encoding="utf-8")
+    assert proc.returncode == 1
+    assert json.loads(proc.stdout)["summary"]["files_with_issues"] == 2
+    assert "[INFO]" in proc.stderr
@@ -0,0 +1,70 @@
+"""IoU 回环校验：没有多边形对应的实例按转换的过滤条件正确分类"""
+import json
+import os
+
+import cv2
+import numpy as np
+
+import cellpose標簽轉換 as converter
+import label_iou_check as checker
+from manifest import MANIFEST_NAME
+from seg_io import write_seg_masks
+
+
+def make_case(tmp_path):
+    """1、2 为圆（转换后保留），3 面积过小，4 为正方形（简化后只剩 4 个点）；标签中删掉 2 的多边形"""
+    masks = np.zeros((200, 200), dtype=np.uint16)
+    cv2.circle(masks, (50, 50), 20, 1, -1)
+    cv2.circle(masks, (150, 50), 20, 2, -1)
+    masks[100:103, 20:23] = 3
+    masks[120:150, 120:150] = 4
+    npy_dir, label_dir = tmp_path / "npy", tmp_path / "labels"
+    label_dir.mkdir()
+    npy_path = str(npy_dir / "a_seg.npy")
+    label_path = str(label_dir / "a.txt")
+    write_seg_masks(npy_path, masks)
+    converter.convert_file(npy_path, label_path)
+    with open(label_path) as f:
+        lines = f.readlines()
+    assert len(lines) == 2
+    with open(label_path, "w") as f:
+        f.write(lines[0])
+    return npy_path, label_path
+
+
+def test_unmatched_instances_are_classified_by_reason(tmp_path):
+    npy_path, label_path = make_case(tmp_path)
+    result = checker.validate_pair(npy_path, label_path)
+    assert "error" not in result
+    assert result["instances"] == 4 and result["polygons"] == 1
+    assert result["dropped_small_area"] == [3]
+    assert result["dropped_few_points"] == [4]
+    assert result["unmatched"] == [2]
+    assert result["low_iou"] == []
+
+
+def test_params_come_from_the_converter_manifest(tmp_path):
+    npy_path, label_path = make_case(tmp_path)
+    params = converter.convert_params(min_points=4)
+    with open(os.path.join(os.path.dirname(label_path), MANIFEST_NAME), "w") as f:
+        json.dump({"params": params, "entries": {}}, f)
+    assert checker.converter_params(os.path.dirname(label_path)) == params
+
+    # 按 min_points=4 转换时正方形会保留下来，现在它没有多边形就是未匹配
+    report = checker.validate_dir(str(tmp_path / "npy"), str(tmp_path / "labels"), workers=1)
+    s = report["summary"]
+    assert (s["dropped_small_area"], s["dropped_few_points"], s["unmatched"]) == (1, 0, 2)
+    assert checker.converter_params(str(tmp_path / "labels"), min_points=None)["min_points"] == 4
+    assert checker.converter_params(str(tmp_path / "labels"), min_points=6)["min_points"] == 6
+
+
+def test_touching_instances_keep_their_own_polygons(tmp_path):
+    masks = np.zeros((120, 200), dtype=np.uint16)
+    cv2.circle(masks, (60, 60), 30, 1, -1)
+    cv2.circle(masks, (115, 60), 30, 2, -1)  # 与 1 紧挨着，覆盖掉一部分
+    npy_path, label_path = str(tmp_path / "b_seg.npy"), str(tmp_path / "b.txt")
+    write_seg_masks(npy_path, masks)
+    converter.convert_file(npy_path, label_path)
+    result = checker.validate_pair(npy_path, label_path)
+    assert result["unmatched"] == [] and result["dropped_few_points"] == []
+    assert result["mean_instance_iou"] > 0.9
@@ -0,0 +1,72 @@
+"""YOLO seg 批量解析：两种格式、行号、坏行分类，快速路径与逐行兜底结果一致"""
+import numpy as np
+import pytest
+
+from label_io import format_yolo_seg
+from label_parse import LAYOUT_BBOX, LAYOUT_POLY, parse_yolo_labels, split_polygons
+
+POLY_TEXT = (
+    "0 0.1 0.1 0.3 0.1 0.3 0.3\n"
+    "\n"  # 空行：不影响后面的行号
+    "2 0.5 0.5 0.7 0.5 0.7 0.7 0.5 0.7\n"
+)
+
+
+def test_poly_layout_with_line_numbers():
+    labels = parse_yolo_labels(POLY_TEXT)
+    assert labels.layout == LAYOUT_POLY
+    assert labels.lines.tolist() == [1, 3]
+    assert labels.cls.tolist() == [0, 2]
+    assert labels.offsets.tolist() == [0, 3, 7]
+    assert labels.boxes is None and labels.bad == []
+    polygons = split_polygons(labels.coords, labels.offsets)
+    np.testing.assert_allclose(polygons[1], [(0.5, 0.5), (0.7, 0.5), (0.7, 0.7), (0.5, 0.7)], atol=1e-7)
+
+
+def test_bbox_layout_is_detected():
+    rows = ["0 0.2 0.2 0.2 0.2 0.1 0.1 0.3 0.1 0.3 0.3 0.1 0.3",
+            "1 0.55 0.6 0.1 0.2 0.5 0.5 0.6 0.5 0.6 0.7 0.5 0.7"]
+    labels = parse_yolo_labels("\n".join(rows) + "\n")
+    assert labels.layout == LAYOUT_BBOX
+    np.testing.assert_allclose(labels.boxes, [(0.2, 0.2, 0.2, 0.2), (0.55, 0.6, 0.1, 0.2)], atol=1e-7)
+    assert labels.offsets.tolist() == [0, 4, 8]
+    # 同样的内容按 poly 格式强制解析时，前四个数被当成顶点
+    assert parse_yolo_labels("\n".join(rows), layout="poly").offsets.tolist() == [0, 6, 12]
+
+
+@pytest.mark.parametrize("line, kind", [
+    ("0 0.1 0.2 0.3", "malformed"),  # 坐标个数为奇数
+    ("-1 0.1 0.1 0.3 0.1 0.3 0.3", "malformed"),  # 类别为负
+    ("1.5 0.1 0.1 0.3 0.1 0.3 0.3", "malformed"),  # 类别不是整数
+    ("0 0.1 0.1 0.3 0.1", "degenerate"),  # 只有 2 个点
+    ("0 0.1 abc 0.3 0.1 0.3 0.3", "malformed"),  # 非数字字段：走逐行兜底
+])
+def test_bad_lines_are_reported_and_skipped(line, kind):
+    text = POLY_TEXT + line + "\n" + "1 0.2 0.2 0.4 0.2 0.4 0.4\n"
+    labels = parse_yolo_labels(text)
+    assert [(n, k) for n, k, _ in labels.bad] == [(4, kind)]
+    assert labels.lines.tolist() == [1, 3, 5]
+    assert labels.cls.tolist() == [0, 2, 1]
+
+
+def test_fallback_path_matches_fast_path():
+    rng = np.random.default_rng(0)
+    polygons = [rng.uniform(0, 1, (int(rng.integers(3, 12)), 2)) for _ in range(50)]
+    text = format_yolo_seg(polygons, 1, 1, cls=rng.integers(0, 5, 50))
+    fast = parse_yolo_labels(text)
+    slow = parse_yolo_labels(text + "0 x 0.1 0.2 0.2 0.3 0.3\n")
+    assert np.array_equal(fast.coords, slow.coords)
+    assert np.array_equal(fast.offsets, slow.offsets)
+    assert np.array_equal(fast.cls, slow.cls)
+    assert np.array_equal(fast.lines, slow.lines)
+    assert [n for n, _, _ in slow.bad] == [51]
+
+
+def test_bytes_and_str_give_the_same_result():
+    a, b = parse_yolo_labels(POLY_TEXT), parse_yolo_labels(POLY_TEXT.encode())
+    assert np.array_equal(a.coords, b.coords) and np.array_equal(a.lines, b.lines)
+
+
+def test_empty_text():
+    labels = parse_yolo_labels("")
+    assert len(labels.coords) == 0 and labels.offsets.tolist() == [0] and labels.bad == []
@@ -0,0 +1,106 @@
+"""标签复查：日志重放与继续位置、叠加图缓存的淘汰与取消、跳到下一张未复查时回绕"""
+import os
+import threading
+from concurrent.futures import wait
+
+import numpy as np
+import pytest
+
+from crop_journal import read_events
+from label_review import OverlayCache, ReviewJournal, ReviewSession
+
+
+def test_journal_replay_and_resume(tmp_path):
+    path = str(tmp_path / "review_journal.jsonl")
+    journal = ReviewJournal(path)
+    journal.mark("a.png", "accept")
+    journal.mark("b.png", "reject")
+    journal.mark("c.png", "flag")
+    journal.unmark("b.png")
+    journal.unmark("d.png")  # 没有结论时不写
+    for name in ("a.png", "b.png", "c.png", "d.png", "e.png"):
+        journal.view(name)
+    with pytest.raises(ValueError):
+        journal.mark("a.png", "maybe")
+    journal.close()
+
+    events, skipped = read_events(path)
+    assert skipped == []
+    assert [e["op"] for e in events] == ["mark", "mark", "mark", "unmark", "view"]  # 翻页只在退出时写一次
+
+    reopened = ReviewJournal(path)
+    assert reopened.last_image == "e.png"
+    assert reopened.status == {"a.png": "accept", "c.png": "flag"}
+    assert reopened.counts() == {"accept": 1, "reject": 0, "flag": 1}
+    reopened.view("e.png")
+    reopened.close()
+    assert len(read_events(path)[0]) == 5  # 位置没变，不追加
+
+
+def solid(value, nbytes=100):
+    return np.full(nbytes, value, dtype=np.uint8), []
+
+
+def test_overlay_cache_evicts_oldest_but_keeps_current():
+    cache = OverlayCache(solid, workers=1, max_bytes=250)
+    try:
+        for key in (1, 2):
+            cache.get(key)
+        cache.get(1)  # 1 为当前显示且最近使用
+        cache.prefetch([3])
+        wait(list(cache.pending.values()), timeout=5)
+        assert list(cache.cache) == [1, 3]
+
+        cache.get(4)  # 当前换成 4 之后 1 按最久未使用淘汰
+        assert list(cache.cache) == [3, 4]
+    finally:
+        cache.shutdown()
+
+
+def test_overlay_prefetch_cancels_stale_requests():
+    started, release = threading.Event(), threading.Event()
+
+    def render(key):
+        if key == 0:
+            started.set()
+            release.wait(5)
+        return solid(key)
+
+    cache = OverlayCache(render, workers=1)
+    try:
+        cache.prefetch([0, 1, 2])
+        assert started.wait(5)
+        cache.prefetch([5])  # 快速翻页：1、2 还在排队，取消；0 已经开始
+        with cache.lock:
+            assert set(cache.pending) == {0, 5}
+        release.set()
+        assert cache.get(5)[0][0] == 5
+        assert 1 not in cache.cache and 2 not in cache.cache
+    finally:
+        release.set()
+        cache.shutdown()
+
+
+def test_next_unreviewed_wraps_around(tmp_path):
+    img_dir = tmp_path / "imgs"
+    img_dir.mkdir()
+    for name in ("a.png", "b.png", "c.png", "d.png"):
+        (img_dir / name).write_bytes(b"")
+    path = str(tmp_path / "review_journal.jsonl")
+    journal = ReviewJournal(path)
+    journal.mark("a.png", "accept")
+    journal.mark("d.png", "reject")
+    journal.view("c.png")
+    journal.close()
+
+    session = ReviewSession(str(img_dir), str(tmp_path), path)
+    try:
+        assert session.index == 2  # 从上次停下的 c.png 继续
+        session.index = 3
+        assert session.names[session.next_unreviewed()] == "b.png"  # 越过末尾回到开头
+        session.journal.mark("b.png", "flag")
+        session.journal.mark("c.png", "flag")
+        assert session.next_unreviewed() is None
+    finally:
+        session.overlays.shutdown()
+        session.journal.close()
@@ -0,0 +1,71 @@
+"""标签打包文件：打包 → 读取 → 导出与原 .txt 一致；有损的文件会被报告"""
+import os
+
+import numpy as np
+import pytest
+
+from label_io import format_yolo_seg
+from label_parse import read_yolo_labels
+from label_store import LabelStore, LabelStoreWriter, pack_label_dir
+
+
+def write_label_dir(label_dir, n=5, seed=0):
+    rng = np.random.default_rng(seed)
+    os.makedirs(label_dir)
+    texts = {}
+    for i in range(n):
+        count = int(rng.integers(0, 6))  # 允许空标签
+        polygons = [rng.uniform(0, 1, (int(rng.integers(3, 10)), 2)) for _ in range(count)]
+        text = format_yolo_seg(polygons, 1, 1, cls=rng.integers(0, 3, count))
+        texts[f"img_{i}"] = text
+        with open(os.path.join(label_dir, f"img_{i}.txt"), "w") as f:
+            f.write(text)
+    return texts
+
+
+def test_pack_then_export_reproduces_the_label_dir(tmp_path):
+    texts = write_label_dir(str(tmp_path / "labels"))
+    store_path = str(tmp_path / "labels.ysp")
+    n, lossy = pack_label_dir(str(tmp_path / "labels"), store_path)
+    assert n == len(texts) and lossy == []
+
+    store = LabelStore(store_path)
+    assert sorted(store) == sorted(texts)
+    store.export_yolo(str(tmp_path / "exported"))
+    for name, text in texts.items():
+        assert store.to_yolo_text(name) == text
+        with open(tmp_path / "exported" / f"{name}.txt") as f:
+            assert f.read() == text
+
+
+def test_get_returns_per_image_arrays(tmp_path):
+    store_path = str(tmp_path / "a.ysp")
+    square = np.array([(0.1, 0.1), (0.2, 0.1), (0.2, 0.2), (0.1, 0.2)])
+    with LabelStoreWriter(store_path) as writer:
+        writer.add("empty", np.zeros((0, 2)), [0])
+        writer.add("two", np.r_[square, square[:3] + 0.5], [0, 4, 7], cls=[2, 5])
+    store = LabelStore(store_path)
+    coords, offsets, cls = store.get("two")
+    assert offsets.tolist() == [0, 4, 7] and cls.tolist() == [2, 5]
+    np.testing.assert_allclose(coords[:4], square, atol=1e-7)
+    polygons, cls = store.polygons("empty")
+    assert polygons == [] and len(cls) == 0
+    assert "missing" not in store
+
+
+def test_lossy_files_are_reported_or_refused(tmp_path):
+    label_dir = tmp_path / "labels"
+    write_label_dir(str(label_dir), n=2)
+    (label_dir / "bbox.txt").write_text("0 0.2 0.2 0.2 0.2 0.1 0.1 0.3 0.1 0.3 0.3 0.1 0.3\n")
+    (label_dir / "bad.txt").write_text("0 0.1 0.1 0.3 0.1 0.3 0.3\n0 0.1 0.2 0.3\n")
+
+    n, lossy = pack_label_dir(str(label_dir), str(tmp_path / "a.ysp"))
+    assert n == 4 and [name for name, _ in lossy] == ["bad.txt", "bbox.txt"]
+    # 能用的多边形仍然打包进去
+    polygons, cls = LabelStore(str(tmp_path / "a.ysp")).polygons("bad")
+    assert len(polygons) == 1 and cls.tolist() == [0]
+    np.testing.assert_allclose(polygons[0], read_yolo_labels(str(label_dir / "bad.txt")).coords, atol=1e-7)
+
+    with pytest.raises(ValueError, match="bad.txt"):
+        pack_label_dir(str(label_dir), str(tmp_path / "b.ysp"), strict=True)
+    assert not (tmp_path / "b.ysp").exists()
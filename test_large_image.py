@@ -0,0 +1,90 @@
+"""内存映射大图与 PIL 的一致性：crop / reduce / resize(box=...)，以及缓存构建"""
+import threading
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import large_image
+from large_image import LargeImage
+
+SHAPE = (301, 457)
+
+
+@pytest.fixture(params=["RGB", "L", "RGBA"])
+def pair(request, tmp_path):
+    """(LargeImage, 同样像素的 PIL 图)，随机噪声让重采样的任何偏差都能体现出来（RGBA 为不透明图）"""
+    rng = np.random.default_rng(0)
+    channels = {"RGB": (3,), "L": (), "RGBA": (4,)}[request.param]
+    arr = rng.integers(0, 256, SHAPE + channels, dtype=np.uint8)
+    if request.param == "RGBA":
+        arr[:, :, 3] = 255
+    path = tmp_path / "big.npy"
+    np.save(path, arr)
+    with LargeImage(str(path)) as img:
+        yield img, Image.fromarray(arr)
+
+
+@pytest.mark.parametrize("box", [(0, 0, 457, 301), (10, 20, 110, 220), (-30, -5, 40, 60), (400, 250, 520, 340)])
+def test_crop_matches_pil(pair, box):
+    img, ref = pair
+    assert np.array_equal(np.asarray(img.crop(box)), np.asarray(ref.crop(box)))
+
+
+@pytest.mark.parametrize("factor", [2, 3, 7])
+def test_reduce_matches_pil(pair, factor):
+    img, ref = pair
+    assert np.array_equal(np.asarray(img.reduce(factor)), np.asarray(ref.reduce(factor)))
+
+
+@pytest.mark.parametrize("size, box", [
+    ((64, 64), (100, 50, 228, 178)),  # 缩小 2 倍
+    ((50, 40), (0.5, 10.25, 150.5, 130.25)),  # 小数坐标的框
+    ((200, 200), (300, 200, 400, 300)),  # 放大，框贴近图片右下角
+])
+@pytest.mark.parametrize("resample", [Image.BICUBIC, Image.LANCZOS])
+def test_resize_box_matches_full_image_resize(pair, size, box, resample):
+    img, ref = pair
+    out = img.resize(size, resample, box=box)
+    assert np.array_equal(np.asarray(out), np.asarray(ref.resize(size, resample, box=box)))
+
+
+def test_png_cache_matches_decoded_pixels(tmp_path):
+    arr = np.random.default_rng(1).integers(0, 256, (120, 90, 3), dtype=np.uint8)
+    Image.fromarray(arr).save(tmp_path / "a.png")
+    with LargeImage(str(tmp_path / "a.png")) as img:
+        assert img.mode == "RGB" and img.size == (90, 120)
+        assert np.array_equal(img.array, arr)
+
+
+def test_16bit_source_is_scaled_to_8bit(tmp_path):
+    arr = (np.arange(200 * 150).reshape(200, 150) % 4000).astype(np.uint16)
+    Image.fromarray(arr).save(tmp_path / "g16.png")
+    with LargeImage(str(tmp_path / "g16.png")) as img:
+        assert img.array.dtype == np.uint8
+        assert img.array.min() == 0 and img.array.max() == 255
+        assert np.array_equal(np.argsort(img.array[0], kind="stable"), np.argsort(arr[0], kind="stable"))
+
+
+def test_oversized_decode_is_refused(tmp_path, monkeypatch):
+    Image.fromarray(np.zeros((100, 100, 3), dtype=np.uint8)).save(tmp_path / "a.png")
+    monkeypatch.setattr(large_image, "MAX_DECODE_BYTES", 1000)
+    with pytest.raises(MemoryError):
+        LargeImage(str(tmp_path / "a.png"))
+    assert not list((tmp_path / large_image.IMAGE_CACHE_DIRNAME).iterdir())
+
+
+def test_concurrent_header_reads_restore_the_bomb_limit(tmp_path):
+    Image.fromarray(np.zeros((10, 10), dtype=np.uint8)).save(tmp_path / "a.png")
+    before = Image.MAX_IMAGE_PIXELS
+
+    def work():
+        for _ in range(300):
+            large_image.is_large(str(tmp_path / "a.png"))
+
+    threads = [threading.Thread(target=work) for _ in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert Image.MAX_IMAGE_PIXELS == before
@@ -0,0 +1,92 @@
+"""增量转换清单：未变化的源文件跳过，内容/参数/标签变化时重新转换"""
+import os
+
+from manifest import Manifest, file_stamp
+
+PARAMS = {"epsilon": 1.5, "min_points": 6}
+
+
+def setup_pair(tmp_path, content=b"masks-v1"):
+    npy_dir, label_dir = tmp_path / "npy", tmp_path / "labels"
+    npy_dir.mkdir()
+    label_dir.mkdir()
+    npy_path, label_path = npy_dir / "a_seg.npy", label_dir / "a.txt"
+    npy_path.write_bytes(content)
+    return str(npy_path), str(label_path), str(label_dir)
+
+
+def convert(manifest, npy_path, label_path):
+    """模拟一次转换：写标签并记录指纹"""
+    with open(label_path, "w") as f:
+        f.write("0 0.1 0.1 0.2 0.1 0.2 0.2\n")
+    manifest.record(os.path.basename(npy_path), label_path, file_stamp(npy_path))
+    manifest.save()
+
+
+def plan(label_dir, jobs, params=PARAMS):
+    return Manifest(label_dir, params).plan(jobs, os.path.basename)
+
+
+def test_new_source_is_converted_then_skipped(tmp_path):
+    npy_path, label_path, label_dir = setup_pair(tmp_path)
+    jobs = [(npy_path, label_path)]
+
+    manifest = Manifest(label_dir, PARAMS)
+    todo, skipped, removed = manifest.plan(jobs, os.path.basename)
+    assert (todo, skipped, removed) == (jobs, 0, [])
+
+    convert(manifest, npy_path, label_path)
+    assert plan(label_dir, jobs) == ([], 1, [])
+
+
+def test_touched_but_identical_source_is_skipped_by_hash(tmp_path):
+    npy_path, label_path, label_dir = setup_pair(tmp_path)
+    jobs = [(npy_path, label_path)]
+    convert(Manifest(label_dir, PARAMS), npy_path, label_path)
+
+    st = os.stat(npy_path)
+    os.utime(npy_path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    manifest = Manifest(label_dir, PARAMS)
+    assert manifest.plan(jobs, os.path.basename) == ([], 1, [])
+    # 哈希确认未变化后更新时间戳，下次不再计算哈希
+    assert manifest.entries["a_seg.npy"]["mtime_ns"] == st.st_mtime_ns + 10 ** 9
+
+
+def test_changed_content_of_same_size_is_reconverted(tmp_path):
+    npy_path, label_path, label_dir = setup_pair(tmp_path)
+    jobs = [(npy_path, label_path)]
+    convert(Manifest(label_dir, PARAMS), npy_path, label_path)
+
+    st = os.stat(npy_path)
+    with open(npy_path, "wb") as f:
+        f.write(b"masks-v2")
+    os.utime(npy_path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    assert plan(label_dir, jobs) == (jobs, 0, [])
+
+
+def test_param_change_and_invalidate_reconvert_everything(tmp_path):
+    npy_path, label_path, label_dir = setup_pair(tmp_path)
+    jobs = [(npy_path, label_path)]
+    convert(Manifest(label_dir, PARAMS), npy_path, label_path)
+
+    assert plan(label_dir, jobs, dict(PARAMS, epsilon=2.0)) == (jobs, 0, [])
+
+    manifest = Manifest(label_dir, PARAMS)
+    manifest.invalidate()
+    assert manifest.plan(jobs, os.path.basename) == (jobs, 0, [])
+
+
+def test_missing_label_is_regenerated(tmp_path):
+    npy_path, label_path, label_dir = setup_pair(tmp_path)
+    jobs = [(npy_path, label_path)]
+    convert(Manifest(label_dir, PARAMS), npy_path, label_path)
+
+    os.remove(label_path)
+    assert plan(label_dir, jobs) == (jobs, 0, [])
+
+
+def test_deleted_source_is_reported_for_cleanup(tmp_path):
+    npy_path, label_path, label_dir = setup_pair(tmp_path)
+    convert(Manifest(label_dir, PARAMS), npy_path, label_path)
+
+    assert plan(label_dir, []) == ([], 0, ["a_seg.npy"])
@@ -0,0 +1,103 @@
+"""流水线：中断后继续、参数变化只重跑受影响的阶段、只有 label_dir 标签的图片、重新分块后删除多余的分块"""
+import json
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import pipeline
+from label_io import format_yolo_seg
+from seg_io import write_seg_masks
+
+SIZE = 128
+
+
+def make_dataset(root):
+    rng = np.random.default_rng(0)
+    image_dir, npy_dir, label_dir = root / "images", root / "npy", root / "labels_in"
+    for d in (image_dir, npy_dir, label_dir):
+        d.mkdir()
+    for name in ("a", "b"):
+        Image.fromarray(rng.integers(0, 256, (SIZE, SIZE, 3), dtype=np.uint8)).save(image_dir / f"{name}.png")
+
+    masks = np.zeros((SIZE, SIZE), dtype=np.uint16)
+    for i, (y, x) in enumerate([(10, 10), (10, 80), (80, 10), (80, 80)], 1):
+        masks[y:y + 30, x:x + 30] = i
+    write_seg_masks(str(npy_dir / "a_seg.npy"), masks)
+
+    # b 只有整图标签，没有 _seg.npy
+    square = np.array([(20, 20), (100, 20), (100, 100), (20, 100)], dtype=np.float64)
+    (label_dir / "b.txt").write_text(format_yolo_seg([square], SIZE, SIZE))
+    return image_dir, npy_dir, label_dir
+
+
+def make_config(root, **tiles):
+    image_dir, npy_dir, label_dir = root / "images", root / "npy", root / "labels_in"
+    stages = {name: {"executor": "thread", "workers": 1} for name in ("masks", "labels", "tiles", "validate")}
+    stages["tiles"].update({"size": 64, "stride": 64, "min_foreground": 0, "use_masks": False}, **tiles)
+    path = root / "pipeline.json"
+    path.write_text(json.dumps({"image_dir": str(image_dir), "npy_dir": str(npy_dir), "label_dir": str(label_dir),
+                                "out_dir": str(root / "out"), "stages": stages}))
+    return pipeline.load_config(str(path))
+
+
+def planned(config):
+    state = pipeline.PipelineState(os.path.join(config["out_dir"], pipeline.STATE_NAME))
+    items, _ = pipeline.plan(config, state)
+    return {item["name"]: item["todo"] for item in items}
+
+
+@pytest.fixture
+def root(tmp_path):
+    make_dataset(tmp_path)
+    return tmp_path
+
+
+def test_run_then_resume_skips_everything(root):
+    config = make_config(root)
+    failures, report = pipeline.run_pipeline(config)
+    assert failures == []
+    out = root / "out"
+    assert (out / "labels" / "a.txt").exists() and not (out / "labels" / "b.txt").exists()
+    assert sorted(os.listdir(out / "tiles" / "labels")) == [f"{n}_cut_{i}.txt" for n in "ab" for i in range(1, 5)]
+    assert report["summary"]["labels"] == 1 + 4 + 4  # a 的整图标签 + 两张图各 4 块
+    assert planned(config) == {}
+
+
+def test_label_only_image_is_tiled_and_validated(root):
+    config = make_config(root)
+    pipeline.run_pipeline(config)
+    state = pipeline.PipelineState(os.path.join(config["out_dir"], pipeline.STATE_NAME))
+    assert state.get("b.png", "labels") is None
+    results = state.get("b.png", "validate")["out"]["results"]
+    assert [r["image"] for r in results] == [f"b_cut_{i}.png" for i in range(1, 5)]
+    assert all(r["instances"] == 1 and not r["issues"] for r in results)
+
+    # 修改 label_dir 中的标签后重新分块
+    with open(root / "labels_in" / "b.txt", "a") as f:
+        f.write(format_yolo_seg([np.array([(2, 2), (30, 2), (30, 30)], dtype=np.float64)], SIZE, SIZE))
+    assert planned(config) == {"b.png": {"masks", "tiles", "validate"}}
+
+
+def test_parameter_change_reruns_affected_stages(root):
+    config = make_config(root)
+    pipeline.run_pipeline(config)
+
+    convert = dict(config, convert=dict(config["convert"], epsilon=config["convert"]["epsilon"] + 0.5))
+    assert planned(convert) == {"a.png": {"masks", "labels", "tiles", "validate"},
+                                "b.png": {"masks", "tiles", "validate"}}
+
+    workers_only = make_config(root)
+    workers_only["stages"]["tiles"]["workers"] = 3  # 不影响输出的参数
+    assert planned(workers_only) == {}
+
+
+def test_retiling_removes_stale_tiles(root):
+    pipeline.run_pipeline(make_config(root))
+    failures, _ = pipeline.run_pipeline(make_config(root, size=128, stride=128))
+    assert failures == []
+    tiles = root / "out" / "tiles"
+    assert sorted(f for f in os.listdir(tiles) if f.endswith(".png")) == ["a_cut_1.png", "b_cut_1.png"]
+    assert sorted(os.listdir(tiles / "labels")) == ["a_cut_1.txt", "b_cut_1.txt"]
+    assert sorted(os.listdir(tiles / "masks")) == ["a_cut_1_seg.npy"]
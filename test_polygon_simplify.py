@@ -0,0 +1,37 @@
+"""多边形简化策略与转换参数检查"""
+import numpy as np
+import cv2
+import pytest
+
+import cellpose標簽轉換 as converter
+from polygon_simplify import simplify_contour
+
+
+def star_contour(spikes=40, radius=200):
+    """带很多尖角的星形，两种策略简化后顶点都远多于上限"""
+    theta = np.linspace(0, 2 * np.pi, 2 * spikes, endpoint=False)
+    r = np.where(np.arange(2 * spikes) % 2, radius * 0.6, radius)
+    pts = np.stack([np.cos(theta) * r, np.sin(theta) * r], axis=1) + radius + 10
+    img = np.zeros((2 * radius + 20, 2 * radius + 20), dtype=np.uint8)
+    cv2.fillPoly(img, [np.round(pts).astype(np.int32)], 1)
+    contours, _ = cv2.findContours(img, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    return contours[0]
+
+
+@pytest.mark.parametrize("mode", ["fixed", "relative"])
+@pytest.mark.parametrize("max_vertices", [6, 12, 30])
+def test_max_vertices_is_respected(mode, max_vertices):
+    cnt = star_contour()
+    assert len(simplify_contour(cnt, mode)) > max_vertices
+    assert len(simplify_contour(cnt, mode, max_vertices=max_vertices)) <= max_vertices
+
+
+def test_unknown_mode_is_rejected():
+    with pytest.raises(ValueError):
+        simplify_contour(star_contour(), "bogus")
+
+
+def test_convert_params_rejects_vertex_cap_below_min_points():
+    with pytest.raises(ValueError):
+        converter.convert_params(max_vertices=converter.MIN_POINTS - 1)
+    assert converter.convert_params(max_vertices=converter.MIN_POINTS)["max_vertices"] == converter.MIN_POINTS
@@ -0,0 +1,118 @@
+"""主图 ↔ 参考图配准：已知平移/缩放的图片对能还原出变换；失败结果也缓存"""
+import os
+
+import cv2
+import numpy as np
+import pytest
+from PIL import Image
+
+import registration
+from registration import PairRegistry, estimate_transform, map_point, transform_scale
+
+SHIFT = (30, 20)  # 参考图坐标 = 主图坐标 + SHIFT
+
+
+def textured(shape, seed=0):
+    """平滑噪声上叠加随机的方块和圆（提供 ORB 需要的角点），相位相关也能稳定匹配"""
+    rng = np.random.default_rng(seed)
+    img = cv2.GaussianBlur(rng.integers(0, 256, shape, dtype=np.uint8), (0, 0), 2)
+    for _ in range(150):
+        x, y = int(rng.integers(0, shape[1])), int(rng.integers(0, shape[0]))
+        size, color = int(rng.integers(4, 25)), int(rng.integers(0, 256))
+        if rng.random() < 0.5:
+            cv2.rectangle(img, (x, y), (x + size, y + size), color, -1)
+        else:
+            cv2.circle(img, (x, y), size, color, -1)
+    return img
+
+
+@pytest.fixture
+def shifted_pair(tmp_path):
+    big = textured((560, 700))
+    dx, dy = SHIFT
+    main = big[dy:dy + 500, dx:dx + 600]
+    ref = big[:500, :600]
+    Image.fromarray(main).save(tmp_path / "main.png")
+    Image.fromarray(ref).save(tmp_path / "ref.png")
+    return str(tmp_path / "main.png"), str(tmp_path / "ref.png")
+
+
+@pytest.mark.parametrize("method", ["orb", "phase", "auto"])
+def test_translation_is_recovered(shifted_pair, method):
+    record = estimate_transform(*shifted_pair, method)
+    assert record["matrix"] is not None
+    for x, y in [(0, 0), (300, 250), (599, 499)]:
+        rx, ry = map_point(record["matrix"], x, y)
+        assert rx == pytest.approx(x + SHIFT[0], abs=1.5)
+        assert ry == pytest.approx(y + SHIFT[1], abs=1.5)
+    assert transform_scale(record["matrix"]) == pytest.approx(1, abs=0.01)
+
+
+def test_scale_is_recovered(tmp_path):
+    main = textured((500, 600), seed=1)
+    ref = cv2.resize(main, (300, 250), interpolation=cv2.INTER_AREA)
+    Image.fromarray(main).save(tmp_path / "main.png")
+    Image.fromarray(ref).save(tmp_path / "ref.png")
+    record = estimate_transform(str(tmp_path / "main.png"), str(tmp_path / "ref.png"), "auto")
+    assert transform_scale(record["matrix"]) == pytest.approx(0.5, abs=0.02)
+    rx, ry = map_point(record["matrix"], 400, 300)
+    assert (rx, ry) == (pytest.approx(200, abs=2), pytest.approx(150, abs=2))
+
+
+def wait(registry, main_path, ref_path):
+    future = registry.pending.get(registration._pair_key(main_path, ref_path))
+    if future is not None:
+        future.result()
+
+
+def test_failed_pair_is_cached_until_a_file_changes(tmp_path, monkeypatch):
+    main_path, ref_path = str(tmp_path / "main.png"), str(tmp_path / "bad.png")
+    Image.fromarray(textured((100, 100))).save(main_path)
+    with open(ref_path, "wb") as f:
+        f.write(b"not an image")
+
+    calls = []
+    real = registration.estimate_transform
+    monkeypatch.setattr(registration, "estimate_transform", lambda *a: calls.append(a) or real(*a))
+    cache_path = str(tmp_path / "registration.json")
+    registry = PairRegistry(cache_path)
+    try:
+        for _ in range(3):
+            registry.request(main_path, ref_path)
+            wait(registry, main_path, ref_path)
+        assert len(calls) == 1
+        record = registry.get(main_path, ref_path)
+        assert record["matrix"] is None and "error" in record
+
+        # 重新打开缓存文件同样不会重算
+        reopened = PairRegistry(cache_path)
+        reopened.request(main_path, ref_path)
+        assert not reopened.is_pending(main_path, ref_path)
+        reopened.shutdown()
+
+        st = os.stat(ref_path)
+        os.utime(ref_path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+        registry.request(main_path, ref_path)
+        wait(registry, main_path, ref_path)
+        assert len(calls) == 2
+
+        registry.request(main_path, str(tmp_path / "missing.png"))
+        assert not registry.is_pending(main_path, str(tmp_path / "missing.png"))
+    finally:
+        registry.shutdown()
+
+
+def test_cache_write_failure_is_reported(tmp_path):
+    main_path, ref_path = str(tmp_path / "main.png"), str(tmp_path / "ref.png")
+    Image.fromarray(textured((100, 100))).save(main_path)
+    Image.fromarray(textured((100, 100))).save(ref_path)
+    (tmp_path / "blocked").write_text("")  # 缓存目录的位置被文件占用，写不进去
+    registry = PairRegistry(str(tmp_path / "blocked" / "registration.json"), method="phase")
+    try:
+        registry.request(main_path, ref_path)
+        wait(registry, main_path, ref_path)
+        assert registry.get(main_path, ref_path)["matrix"] is not None  # 结果仍可用
+        assert registry.last_save_error() is not None
+        assert not registry.is_pending(main_path, ref_path)
+    finally:
+        registry.shutdown()
@@ -0,0 +1,82 @@
+"""计时统计：分位数、多线程同时记录、处理数（逐文件记录或计数器）、CSV / JSON 报告"""
+import csv
+import json
+import threading
+
+import pytest
+
+from run_stats import CSV_FIELDS, ItemStats, RunStats
+
+
+def test_percentiles():
+    stats = RunStats("t")
+    for ms in range(1, 101):
+        stats.record("load", ms / 1000)
+    s = stats.summary()["stages"]["load"]
+    assert s["n"] == 100
+    assert s["p50_ms"] == pytest.approx(50.5)
+    assert s["p95_ms"] == pytest.approx(95.05)
+    assert s["max_ms"] == pytest.approx(100)
+    assert s["mean_ms"] == pytest.approx(50.5)
+    assert s["total_s"] == pytest.approx(5.05)
+
+
+def test_concurrent_records_are_not_lost():
+    stats = RunStats("t")
+    barrier = threading.Barrier(8)
+
+    def work():
+        barrier.wait()
+        for _ in range(1000):
+            stats.record("step", 0.001)
+            stats.count("images")
+            rec = ItemStats("x")
+            rec.record("item", 0.002)
+            rec.count("instances", 2)
+            stats.add_item(rec.as_dict())
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    summary = stats.summary()
+    assert summary["stages"]["step"]["n"] == 8000
+    assert summary["stages"]["item"]["n"] == 8000
+    assert summary["counts"] == {"images": 8000, "instances": 16000}
+    assert summary["items"] == 8000
+
+
+def test_item_counter_drives_items_per_s():
+    stats = RunStats("gui", item_count="images")
+    stats.start -= 1
+    stats.count("images", 5)
+    stats.record("decode", 0.01)
+    summary = stats.summary()
+    assert summary["items"] == 5 and summary["items_per_s"] > 0
+    assert RunStats("plain").summary()["items"] == 0
+
+
+def test_reports(tmp_path):
+    stats = RunStats("gui", item_count="images")
+    stats.start -= 2  # 运行了约 2 秒
+    stats.record("decode", 0.02)
+    stats.record("save", 0.01)
+    stats.count("images", 3)
+
+    stats.write_report(str(tmp_path / "r.csv"))
+    with open(tmp_path / "r.csv", encoding="utf-8", newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert tuple(rows[0]) == CSV_FIELDS
+    assert [r["stage"] for r in rows] == ["decode", "save", "count:images"]
+    assert all(r["name"] == "gui" and r["items"] == "3" and float(r["wall_s"]) >= 2
+               and float(r["items_per_s"]) == pytest.approx(3 / float(r["wall_s"]), rel=0.01) for r in rows)
+    assert rows[2]["n"] == "3" and rows[2]["p50_ms"] == ""
+
+    stats.add_item(ItemStats("a.png").as_dict())
+    stats.write_report(str(tmp_path / "r.json"))
+    with open(tmp_path / "r.json", encoding="utf-8") as f:
+        report = json.load(f)
+    assert report["items"] == 3 and report["counts"] == {"images": 3}
+    assert set(report["stages"]) == {"decode", "save"}
+    assert report["items_detail"] == [{"name": "a.png", "times": {}, "counts": {}}]
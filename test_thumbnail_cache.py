@@ -0,0 +1,83 @@
+"""缩略图缓存：原图修改后磁盘缓存失效、内存 LRU 淘汰、失败的图片不再重试"""
+import os
+import time
+from concurrent.futures import wait
+
+from PIL import Image
+
+from thumbnail_cache import ThumbnailCache, thumb_key
+
+
+def write_image(path, color, size=(300, 200)):
+    Image.new("RGB", size, color).save(path)
+    return str(path)
+
+
+def load_all(cache, paths, timeout=10):
+    """请求并等待全部生成完成，返回完成的路径"""
+    cache.request(paths)
+    with cache.lock:
+        futures = [f for f in cache.pending.values() if f is not None]
+    wait(futures, timeout=timeout)
+    deadline = time.time() + timeout
+    ready = []
+    while len(set(ready)) < len(paths) and time.time() < deadline:
+        ready += cache.pop_ready()
+        time.sleep(0.01)
+    return ready
+
+
+def test_disk_cache_reused_and_invalidated(tmp_path):
+    path = write_image(tmp_path / "a.png", (255, 0, 0))
+    cache = ThumbnailCache(str(tmp_path), size=64, workers=1)
+    load_all(cache, [path])
+    thumb = cache.get(path)
+    assert max(thumb.size) == 64 and thumb.getpixel((10, 10))[0] > 200
+    old_file = os.path.join(cache.thumb_dir, thumb_key(path) + ".jpg")
+    assert os.path.exists(old_file)
+    cache.shutdown()
+
+    # 新实例命中磁盘缓存
+    cache = ThumbnailCache(str(tmp_path), size=64, workers=1)
+    load_all(cache, [path])
+    assert cache.get(path).size == thumb.size
+    cache.shutdown()
+
+    # 原图被修改（大小变化）后按新的 key 重新生成
+    write_image(tmp_path / "a.png", (0, 0, 255), size=(200, 300))
+    new_file = os.path.join(str(tmp_path), "_image_cache", "thumbs", thumb_key(path) + ".jpg")
+    assert new_file != old_file
+    cache = ThumbnailCache(str(tmp_path), size=64, workers=1)
+    load_all(cache, [path])
+    assert os.path.exists(new_file)
+    assert cache.get(path).size == (43, 64) and cache.get(path).getpixel((10, 10))[2] > 200
+    cache.shutdown()
+
+
+def test_memory_lru_eviction(tmp_path):
+    paths = [write_image(tmp_path / f"{i}.png", (i * 40, 0, 0)) for i in range(3)]
+    cache = ThumbnailCache(str(tmp_path), size=32, workers=1, max_items=2)
+    load_all(cache, paths[:2])
+    assert cache.get(paths[0]) is not None  # 0 变为最近使用
+    load_all(cache, paths[2:])
+    assert cache.get(paths[1]) is None
+    assert cache.get(paths[0]) is not None and cache.get(paths[2]) is not None
+
+    load_all(cache, [paths[1]])  # 被淘汰的可以重新请求（从磁盘读回）
+    assert cache.get(paths[1]) is not None
+    cache.shutdown()
+
+
+def test_failed_thumbnail_reported_and_not_retried(tmp_path):
+    bad = tmp_path / "bad.png"
+    bad.write_bytes(b"not an image")
+    cache = ThumbnailCache(str(tmp_path), workers=1)
+    assert load_all(cache, [str(bad)]) == [str(bad)]
+    assert cache.get(str(bad)) is None
+    assert "UnidentifiedImageError" in cache.error(str(bad))
+
+    cache.request([str(bad)])
+    with cache.lock:
+        assert str(bad) not in cache.pending
+    assert cache.error(str(tmp_path / "other.png")) is None
+    cache.shutdown()
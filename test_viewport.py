@@ -0,0 +1,96 @@
+"""视口瓦片的下标范围、瓦片取样框、金字塔层选择和防抖（都不需要 Tk 窗口）"""
+import numpy as np
+import pytest
+from PIL import Image
+
+from viewport import Debouncer, ImagePyramid, TILE_SIZE, tile_range, tile_source
+
+
+@pytest.mark.parametrize("view, size, expected", [
+    ((0, 0, 600, 400), (2000, 1000), (range(0, 4), range(0, 3))),  # 左上角，右下多一圈
+    ((700, 300, 1300, 700), (2000, 1000), (range(1, 7), range(0, 4))),
+    ((0, 0, 600, 400), (300, 200), (range(0, 2), range(0, 1))),  # 图片比视口小
+    ((1900, 900, 2500, 1300), (2000, 1000), (range(6, 8), range(2, 4))),  # 滚到最右下
+])
+def test_tile_range(view, size, expected):
+    assert tile_range(view, size) == expected
+    assert tile_range(view, size, margin=0)[0].start >= expected[0].start
+
+
+def test_tile_range_covers_the_view():
+    cols, rows = tile_range((300.5, 10, 900.5, 610), (5000, 5000), margin=0)
+    assert cols.start * TILE_SIZE <= 300.5 and (cols.stop) * TILE_SIZE >= 900.5
+    assert rows.start * TILE_SIZE <= 10 and (rows.stop) * TILE_SIZE >= 610
+
+
+@pytest.mark.parametrize("scale, tol", [(0.5, 0), (0.64, 0), (0.7, 1)])
+def test_tiles_stitch_into_the_full_resize(scale, tol):
+    """各瓦片按 tile_source 的浮点 box 重采样后拼起来与整张图一次缩放一致（box 坐标不能精确表示时差 1 级灰度）"""
+    rng = np.random.default_rng(0)
+    img = Image.fromarray(rng.integers(0, 256, (300, 500, 3), dtype=np.uint8))
+    tile = 64
+    display = (int(img.width * scale), int(img.height * scale))
+    full = np.asarray(img.resize(display, Image.LANCZOS, box=(0, 0, display[0] / scale, display[1] / scale)),
+                      dtype=np.int16)
+
+    stitched = np.zeros_like(full)
+    cols, rows = tile_range((0, 0) + display, display, tile=tile, margin=0)
+    for i in cols:
+        for j in rows:
+            size, box = tile_source((i, j), display, scale, 1.0, img.size, tile=tile)
+            part = np.asarray(img.resize(size, Image.LANCZOS, box=box))
+            stitched[j * tile:j * tile + size[1], i * tile:i * tile + size[0]] = part
+    assert np.abs(stitched - full).max() <= tol
+    assert tile_source((cols.stop, 0), display, scale, 1.0, img.size, tile=tile) is None
+
+
+@pytest.mark.parametrize("scale, level", [(1.0, 1.0), (2.0, 1.0), (0.6, 1.0), (0.5, 0.5), (0.3, 0.5), (0.2, 0.25),
+                                          (0.01, 1 / 64)])
+def test_pyramid_picks_the_smallest_level_not_below_scale(scale, level):
+    pyramid = ImagePyramid(Image.new("RGB", (1024, 512)))
+    level_scale, level_img = pyramid.level_for(scale)
+    assert level_scale == pytest.approx(level)
+    assert level_img.width == round(1024 * level)
+    assert set(pyramid.pow2) <= {0, int(round(np.log2(1 / level)))}  # 只生成用到的层
+
+
+def test_pyramid_prefers_a_closer_extra_level():
+    pyramid = ImagePyramid(Image.new("RGB", (1000, 600)))
+    pyramid.add_level(Image.new("RGB", (350, 210)))  # 预取的适应窗口显示图，比例 0.35
+    assert pyramid.level_for(0.35)[0] == pytest.approx(0.35)
+    assert pyramid.level_for(0.3)[0] == pytest.approx(0.35)
+    assert pyramid.level_for(0.4)[0] == pytest.approx(0.5)
+
+
+class FakeWidget:
+    """只实现 after / after_cancel，由测试手动触发到期的回调"""
+
+    def __init__(self):
+        self.jobs = {}
+        self.next_id = 0
+
+    def after(self, delay_ms, func, *args):
+        self.next_id += 1
+        self.jobs[self.next_id] = (func, args)
+        return self.next_id
+
+    def after_cancel(self, job_id):
+        self.jobs.pop(job_id, None)
+
+    def run_pending(self):
+        jobs, self.jobs = self.jobs, {}
+        for func, args in jobs.values():
+            func(*args)
+
+
+def test_debouncer_fires_once_with_the_last_arguments():
+    widget, calls = FakeWidget(), []
+    debouncer = Debouncer(widget, 80, calls.append)
+    for size in (100, 200, 300):
+        debouncer.trigger(size)
+    widget.run_pending()
+    assert calls == [300]
+    debouncer.trigger(400)
+    debouncer.cancel()
+    widget.run_pending()
+    assert calls == [300]
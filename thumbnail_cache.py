@@ -0,0 +1,134 @@
+"""图片文件夹的缩略图缓存：磁盘上按 (路径, 修改时间, 大小) 保存，内存中 LRU，后台线程池按需生成
+
+磁盘缓存位于 {图片文件夹}/_image_cache/thumbs/{hash}.jpg，原图被修改后 hash 变化，自动重新生成。
+只在后台线程里读写文件和缩放，返回 PIL Image；PhotoImage 由调用方在 Tk 主线程创建。
+滚动很快时，已经移出视口、还没开始生成的请求会被取消，不会排队拖慢当前视口。
+"""
+import os
+import queue
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+
+from image_cache import fit_size
+from large_image import IMAGE_CACHE_DIRNAME, open_image, fit_display, is_large
+
+THUMB_SIZE = 128  # 缩略图长边（像素）
+THUMB_DIRNAME = "thumbs"
+THUMB_WORKERS = 4  # 后台生成线程数
+MEMORY_THUMBS = 4000  # 内存中保留的缩略图数量（每张约 50KB）
+
+
+def thumb_key(path):
+    """按绝对路径、修改时间和文件大小计算缓存文件名，原图变化后自然失效"""
+    st = os.stat(path)
+    raw = f"{os.path.abspath(path)}|{st.st_mtime_ns}|{st.st_size}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def make_thumbnail(path, size=THUMB_SIZE):
+    """解码并缩放为长边 size 的 RGB 缩略图；JPEG 用 draft 直接按 1/2^k 解码，大图走内存映射"""
+    if is_large(path):
+        img = open_image(path)
+        _, w, h = fit_size(img.width, img.height, size, size)
+        return fit_display(img, max(w, 1), max(h, 1)).convert("RGB")
+
+    with Image.open(path) as img:
+        img.draft("RGB", (size, size))
+        img = img.convert("RGB")
+        img.thumbnail((size, size), Image.LANCZOS)
+        return img
+
+
+class ThumbnailCache:
+    """磁盘 + 内存两级缩略图缓存"""
+
+    def __init__(self, folder, size=THUMB_SIZE, workers=THUMB_WORKERS, max_items=MEMORY_THUMBS):
+        self.size = size
+        self.max_items = max_items
+        self.thumb_dir = os.path.join(folder, IMAGE_CACHE_DIRNAME, THUMB_DIRNAME)
+        self.memory = OrderedDict()  # path -> 缩略图，末尾为最近使用
+        self.pending = {}  # path -> Future
+        self.failed = {}  # path -> 错误信息，不再重复尝试（界面通过 error() 读取）
+        self.ready = queue.SimpleQueue()  # 后台生成完成的 path，由界面定时取走
+        self.lock = threading.Lock()
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="thumbs")
+
+    def get(self, path):
+        """内存中已有的缩略图，没有时返回 None（不阻塞）"""
+        with self.lock:
+            thumb = self.memory.get(path)
+            if thumb is not None:
+                self.memory.move_to_end(path)
+            return thumb
+
+    def error(self, path):
+        """该图片生成缩略图失败的错误信息，没有失败时返回 None"""
+        with self.lock:
+            return self.failed.get(path)
+
+    def request(self, paths):
+        """请求一组缩略图（按优先级排列）；不在本次请求中、尚未开始的旧请求会被取消
+
+        在锁内挑出要生成的图片并先占位，提交线程池在锁外进行，不让后台线程等锁。
+        """
+        wanted = set(paths)
+        with self.lock:
+            for path, future in list(self.pending.items()):
+                if path not in wanted and future is not None and future.cancel():
+                    del self.pending[path]
+            todo = [path for path in paths
+                    if path not in self.memory and path not in self.pending and path not in self.failed]
+            for path in todo:
+                self.pending[path] = None  # 占位：提交之前不会重复请求
+
+        for path in todo:
+            future = self.pool.submit(self._load, path)
+            with self.lock:
+                if path in self.pending:  # 已经生成完的会自己移除占位
+                    self.pending[path] = future
+
+    def pop_ready(self):
+        """取出上次调用之后新生成的缩略图路径"""
+        paths = []
+        while True:
+            try:
+                paths.append(self.ready.get_nowait())
+            except queue.Empty:
+                return paths
+
+    def _load(self, path):
+        try:
+            thumb_path = os.path.join(self.thumb_dir, thumb_key(path) + ".jpg")
+            if os.path.exists(thumb_path):
+                with Image.open(thumb_path) as f:
+                    thumb = f.convert("RGB")
+            else:
+                thumb = make_thumbnail(path, self.size)
+                os.makedirs(self.thumb_dir, exist_ok=True)
+                tmp_path = thumb_path + ".part"
+                thumb.save(tmp_path, "JPEG", quality=85)
+                os.replace(tmp_path, thumb_path)
+        except Exception as e:
+            with self.lock:
+                self.pending.pop(path, None)
+                self.failed[path] = f"{type(e).__name__}: {e}"
+            self.ready.put(path)
+            return
+
+        with self.lock:
+            self.pending.pop(path, None)
+            self.memory[path] = thumb
+            while len(self.memory) > self.max_items:
+                self.memory.popitem(last=False)
+        self.ready.put(path)
+
+    def shutdown(self):
+        with self.lock:
+            for future in self.pending.values():
+                if future is not None:
+                    future.cancel()
+            self.pending.clear()
+        self.pool.shutdown(wait=False)
@@ -0,0 +1,198 @@
+import tkinter as tk
+from PIL import Image, ImageTk
+
+from run_stats import NULL_STATS
+
+TILE_SIZE = 256  # 显示坐标下的瓦片边长（像素）
+TILE_MARGIN = 1  # 视口外额外保留的瓦片圈数，平移时边缘不闪白
+FAST_RESAMPLE = Image.BILINEAR  # 窗口拖动过程中的快速滤波
+
+
+def tile_range(view, display_size, tile=TILE_SIZE, margin=TILE_MARGIN):
+    """视口 view=(x0, y0, x1, y1)（显示坐标）覆盖的瓦片下标范围 (列, 行)，含 margin 圈，限制在图片内"""
+    x0, y0, x1, y1 = view
+    w, h = display_size
+    n_cols = (w + tile - 1) // tile
+    n_rows = (h + tile - 1) // tile
+    i0 = max(int(x0 // tile) - margin, 0)
+    j0 = max(int(y0 // tile) - margin, 0)
+    i1 = min(int(x1 // tile) + margin, n_cols - 1)
+    j1 = min(int(y1 // tile) + margin, n_rows - 1)
+    return range(i0, i1 + 1), range(j0, j1 + 1)
+
+
+def tile_source(key, display_size, scale, level_scale, level_size, tile=TILE_SIZE):
+    """瓦片 key=(i, j) 的 (输出尺寸, 所选金字塔层上的浮点 box)；瓦片在图片外时返回 None"""
+    i, j = key
+    w, h = display_size
+    dx0, dy0 = i * tile, j * tile
+    dx1, dy1 = min(dx0 + tile, w), min(dy0 + tile, h)
+    if dx1 <= dx0 or dy1 <= dy0:
+        return None
+
+    # 显示坐标 → 所选金字塔层坐标（浮点 box，相邻瓦片之间无缝）
+    f = level_scale / scale
+    box = (dx0 * f, dy0 * f, min(dx1 * f, level_size[0]), min(dy1 * f, level_size[1]))
+    return (dx1 - dx0, dy1 - dy0), box
+
+
+class ImagePyramid:
+    """原图的多分辨率金字塔：第 k 层为原图缩小 2^k 倍，按需生成
+
+    还可以放入任意比例的额外层（如预取线程生成的适应窗口显示图）。
+    """
+
+    def __init__(self, image):
+        self.image = image
+        self.pow2 = {0: image}  # k -> 缩小 2^k 倍的层，只生成用到的层
+        self.extra = []
+
+    def add_level(self, level_image):
+        self.extra.append(level_image)
+
+    def _pow2_level(self, k):
+        """从已有的最近一层直接缩小到第 k 层（大图不会为中间层读整张原图）"""
+        if k not in self.pow2:
+            base = max(b for b in self.pow2 if b < k)
+            self.pow2[k] = self.pow2[base].reduce(2 ** (k - base))
+        return self.pow2[k]
+
+    def level_for(self, scale):
+        """返回不小于 scale 的最小一层 (比例, 图片)，从它缩放到目标比例最多缩小 2 倍"""
+        k = 0
+        while 2.0 ** -(k + 1) >= scale and min(self.image.size) >> (k + 1) >= 1:
+            k += 1
+        if k:
+            self._pow2_level(k)
+
+        levels = [(img.width / self.image.width, img) for img in list(self.pow2.values()) + self.extra]
+        candidates = [lv for lv in levels if lv[0] >= scale - 1e-9]
+        if not candidates:  # 放大显示：直接从原图采样
+            return levels[0]
+        return min(candidates, key=lambda lv: lv[0])
+
+
+class TiledRenderer:
+    """只重采样并绘制与画布视口相交的瓦片；平移时只补画新露出的瓦片"""
+
+    def __init__(self, canvas, tag="tile", stats=NULL_STATS):
+        self.canvas = canvas
+        self.stats = stats  # 记录每次 render/refine 的耗时（含金字塔层生成和瓦片重采样）
+        self.tag = tag
+        self.pyramid = None
+        self.scale = 1.0
+        self.tiles = {}  # (i, j) -> (PhotoImage, canvas item, 是否为高质量)
+
+    @property
+    def display_size(self):
+        if self.pyramid is None:
+            return 0, 0
+        img = self.pyramid.image
+        return int(img.width * self.scale), int(img.height * self.scale)
+
+    def set_image(self, image, extra_levels=()):
+        """切换图片：重建金字塔并清空已绘制的瓦片"""
+        self.pyramid = ImagePyramid(image)
+        for level in extra_levels:
+            if level is not None:
+                self.pyramid.add_level(level)
+        self.clear()
+
+    def set_scale(self, scale):
+        """设置显示比例（原图 → 画布），比例变化时已有瓦片全部作废"""
+        if abs(scale - self.scale) > 1e-12:
+            self.clear()
+        self.scale = scale
+        w, h = self.display_size
+        self.canvas.config(scrollregion=(0, 0, w, h))
+
+    def clear(self):
+        self.canvas.delete(self.tag)
+        self.tiles = {}
+
+    def visible_tiles(self):
+        """当前视口（含 TILE_MARGIN 圈）覆盖的瓦片下标范围"""
+        x0 = self.canvas.canvasx(0)
+        y0 = self.canvas.canvasy(0)
+        x1 = x0 + max(self.canvas.winfo_width(), 1)
+        y1 = y0 + max(self.canvas.winfo_height(), 1)
+        return tile_range((x0, y0, x1, y1), self.display_size)
+
+    def render(self, fast=False):
+        """补画视口内缺失的瓦片，删除已移出视口的瓦片
+
+        fast=True 时用 FAST_RESAMPLE 快速出图，之后可调用 refine() 换成 LANCZOS。
+        """
+        if self.pyramid is None:
+            return
+        with self.stats.time("render"):
+            self._render(fast)
+
+    def _render(self, fast):
+        cols, rows = self.visible_tiles()
+        wanted = {(i, j) for i in cols for j in rows}
+
+        for key in list(self.tiles):
+            if key not in wanted:
+                _, item, _ = self.tiles.pop(key)
+                self.canvas.delete(item)
+
+        level_scale, level_img = self.pyramid.level_for(self.scale)
+        resample = FAST_RESAMPLE if fast else Image.LANCZOS
+        for key in sorted(wanted - set(self.tiles)):
+            photo = self._render_tile(key, level_scale, level_img, resample)
+            if photo is None:
+                continue
+            i, j = key
+            item = self.canvas.create_image(i * TILE_SIZE, j * TILE_SIZE, image=photo,
+                                            anchor=tk.NW, tags=self.tag)
+            self.tiles[key] = (photo, item, not fast)
+
+        # 瓦片始终位于标注和选框下方
+        self.canvas.tag_lower(self.tag)
+
+    def refine(self):
+        """把快速绘制的瓦片原地替换为 LANCZOS 高质量版本"""
+        if self.pyramid is None:
+            return
+        with self.stats.time("refine"):
+            self._refine()
+
+    def _refine(self):
+        level_scale, level_img = self.pyramid.level_for(self.scale)
+        for key, (_, item, hq) in list(self.tiles.items()):
+            if hq:
+                continue
+            photo = self._render_tile(key, level_scale, level_img)
+            self.canvas.itemconfig(item, image=photo)
+            self.tiles[key] = (photo, item, True)
+
+    def _render_tile(self, key, level_scale, level_img, resample=Image.LANCZOS):
+        source = tile_source(key, self.display_size, self.scale, level_scale, level_img.size)
+        if source is None:
+            return None
+        size, box = source
+        return ImageTk.PhotoImage(level_img.resize(size, resample, box=box))
+
+
+class Debouncer:
+    """把短时间内的多次触发合并为一次回调（在 Tk 主线程中执行）"""
+
+    def __init__(self, widget, delay_ms, callback):
+        self.widget = widget
+        self.delay_ms = delay_ms
+        self.callback = callback
+        self._after_id = None
+
+    def trigger(self, *args):
+        self.cancel()
+        self._after_id = self.widget.after(self.delay_ms, self._fire, *args)
+
+    def cancel(self):
+        if self._after_id is not None:
+            self.widget.after_cancel(self._after_id)
+            self._after_id = None
+
+    def _fire(self, *args):
+        self._after_id = None
+        self.callback(*args)
@@ -3,6 +3,25 @@ import tkinter as tk
 from tkinter import filedialog, messagebox
 from PIL import Image, ImageTk
 import glob
+import time
+from functools import partial
+
+from image_cache import fit_size
+from viewport import TiledRenderer, Debouncer
+from crop_writer import CropWriter
+from crop_engine import CROP_W, CROP_H, box_from_center, clamp_box, crop_filename
+from crop_journal import CropJournal, JOURNAL_NAME, skipped_message
+from crop_tiling import propose_tiles, STRIDE
+from crop_labels import load_image_masks, load_sources, write_tile_annotations
+from large_image import open_image
+from filmstrip import FilmstripWindow
+from run_stats import RunStats
+
+RESIZE_DEBOUNCE_MS = 80  # 窗口尺寸停止变化多久后重绘
+REFINE_DELAY_MS = 250  # 快速重绘之后多久补一次高质量重采样
+WRITE_STATUS_POLL_MS = 200  # 刷新写入队列状态的间隔
+SAVE_JOBS_PER_CROP = 2  # 一次裁剪最多放入写入队列的任务数（主图、分块标注）
+STATS_REPORT_NAME = "crop_stats_{time}.json"  # 退出时写入 cutoff 目录的计时报告（按时间命名不覆盖），None 表示只打印
 
 
 class ImageCutter:
@@ -16,7 +35,6 @@ class ImageCutter:
         self.current_index = 0
         self.selected_region = None
         self.original_image = None
-        self.tk_image = None
         self.cropped_image = None
         self.scale_ratio = 1.0  # 图片缩放比例
         self.zoom_factor = 1.0  # 手动缩放因子
@@ -25,6 +43,17 @@ class ImageCutter:
         self.is_dragging_existing = False
         self.drag_offset_x = 0
         self.drag_offset_y = 0
+        self.journal = None  # 当前文件夹的裁剪记录，切换图片时从中恢复标注和序号
+        self.tile_proposals = []  # 自动分块建议：[[x1, y1, x2, y2], 是否保留]
+        self.tile_queue = []  # 已确认、等待写入队列腾出空位的分块
+        self.tile_total = 0
+        self.tile_after_id = None
+        self.annotation_sources = (None, {})  # (图片路径, 整图标注来源)，按图片缓存
+        self.filmstrip = None  # 缩略图总览窗口
+        # 解码/绘制/保存的耗时，退出时输出 p50/p95/max
+        self.stats = RunStats("crop_gui", item_count="images")
+        # 裁剪图在后台线程编码写盘，按回车不再卡界面
+        self.writer = CropWriter(stats=self.stats)
         # 创建界面组件
         self.create_widgets()
 
@@ -32,8 +61,8 @@ class ImageCutter:
         self.select_folder()
 
         # 固定裁剪尺寸（原图像素）
-        self.fixed_crop_w = 640
-        self.fixed_crop_h = 640
+        self.fixed_crop_w = CROP_W
+        self.fixed_crop_h = CROP_H
 
         # 绑定窗口大小变化事件
         self.root.bind("<Configure>", self.on_window_resize)
@@ -42,6 +71,9 @@ class ImageCutter:
         self.canvas.bind("<Button-4>", self.on_mouse_wheel)  # Linux
         self.canvas.bind("<Button-5>", self.on_mouse_wheel)  # Linux
 
+        # 关闭窗口前先写完队列中的裁剪图
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+
     def create_widgets(self):
         # 创建顶部按钮框架
         top_frame = tk.Frame(self.root)
@@ -51,6 +83,10 @@ class ImageCutter:
         self.select_folder_btn = tk.Button(top_frame, text="选择文件夹", command=self.select_folder)
         self.select_folder_btn.pack(side=tk.LEFT, padx=5)
 
+        # 缩略图总览：网格浏览整个文件夹，单击跳转，可只看未裁剪的图片
+        self.filmstrip_btn = tk.Button(top_frame, text="缩略图总览", command=self.open_filmstrip)
+        self.filmstrip_btn.pack(side=tk.LEFT, padx=5)
+
         # 全屏切换按钮
         self.fullscreen_btn = tk.Button(top_frame, text="切换全屏", command=self.toggle_fullscreen)
         self.fullscreen_btn.pack(side=tk.LEFT, padx=5)
@@ -62,6 +98,18 @@ class ImageCutter:
         self.zoom_out_btn = tk.Button(top_frame, text="缩小", command=lambda: self.zoom(-0.1))
         self.zoom_out_btn.pack(side=tk.LEFT, padx=5)
 
+        # 自动分块：先在画布上显示建议的块，Shift+单击取消/恢复某一块，确认后批量保存
+        self.tile_btn = tk.Button(top_frame, text="自动分块", command=self.propose_tile_grid)
+        self.tile_btn.pack(side=tk.LEFT, padx=5)
+        self.approve_tiles_btn = tk.Button(top_frame, text="确认分块", command=self.approve_tiles, state=tk.DISABLED)
+        self.approve_tiles_btn.pack(side=tk.LEFT, padx=5)
+        self.cancel_tiles_btn = tk.Button(top_frame, text="放弃分块", command=self.cancel_tiles, state=tk.DISABLED)
+        self.cancel_tiles_btn.pack(side=tk.LEFT, padx=5)
+
+        # 同时裁剪同名 _seg.npy / YOLO 标签，输出到 cutoff/masks、cutoff/labels
+        self.crop_labels_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(top_frame, text="同时裁剪标注", variable=self.crop_labels_var).pack(side=tk.LEFT, padx=5)
+
         # 清除标注按钮
         self.clear_marks_btn = tk.Button(top_frame, text="清除所有标注", command=self.clear_crop_marks)
         self.clear_marks_btn.pack(side=tk.LEFT, padx=5)
@@ -88,8 +136,13 @@ class ImageCutter:
             xscrollcommand=self.hscroll.set
         )
 
-        self.vscroll.config(command=self.canvas.yview)
-        self.hscroll.config(command=self.canvas.xview)
+        self.vscroll.config(command=self.on_yscroll)
+        self.hscroll.config(command=self.on_xscroll)
+
+        # 只绘制视口内的瓦片，缩放/平移不再整图重采样
+        self.renderer = TiledRenderer(self.canvas, stats=self.stats)
+        self.resize_debouncer = Debouncer(self.root, RESIZE_DEBOUNCE_MS, self.rerender_after_resize)
+        self.refine_debouncer = Debouncer(self.root, REFINE_DELAY_MS, self.renderer.refine)
 
         self.vscroll.pack(side=tk.RIGHT, fill=tk.Y)
         self.hscroll.pack(side=tk.BOTTOM, fill=tk.X)
@@ -99,6 +152,7 @@ class ImageCutter:
         self.canvas.bind("<ButtonPress-1>", self.on_mouse_down)
         self.canvas.bind("<B1-Motion>", self.on_mouse_drag)
         self.canvas.bind("<ButtonRelease-1>", self.on_mouse_up)
+        self.canvas.bind("<Shift-Button-1>", self.on_toggle_tile)
         # 鼠标拖动画布
         self.canvas.bind("<ButtonPress-2>", self.on_pan_start)
         self.canvas.bind("<B2-Motion>", self.on_pan_move)
@@ -132,6 +186,11 @@ class ImageCutter:
         self.crop_count_label = tk.Label(bottom_frame, text="当前图片已裁剪: 0次")
         self.crop_count_label.pack(side=tk.LEFT, padx=20)
 
+        # 后台写入队列状态
+        self.write_status_label = tk.Label(bottom_frame, text="已全部保存", fg="gray")
+        self.write_status_label.pack(side=tk.LEFT, padx=10)
+        self.root.after(WRITE_STATUS_POLL_MS, self.poll_write_status)
+
         # 全屏相关变量
         self.fullscreen = False
         self.root.bind("<Escape>", self.exit_fullscreen)  # ESC键退出全屏
@@ -142,12 +201,14 @@ class ImageCutter:
 
     def select_folder(self):
         """让用户选择图片所在的文件夹"""
+        if self.saving_tiles():
+            return
         self.folder_path = filedialog.askdirectory(title="选择图片文件夹")
         if not self.folder_path:
             return
 
         # 获取文件夹中所有图片文件
-        image_extensions = ['*.jpg', '*.jpeg', '*.png', '*.gif', '*.bmp']
+        image_extensions = ['*.jpg', '*.jpeg', '*.png', '*.gif', '*.bmp', '*.tif', '*.tiff']
         self.image_files = []
         for ext in image_extensions:
             self.image_files.extend(glob.glob(os.path.join(self.folder_path, ext)))
@@ -160,12 +221,17 @@ class ImageCutter:
         # 创建cutoff文件夹（如果不存在）
         self.cutoff_folder = os.path.join(self.folder_path, "cutoff")
         os.makedirs(self.cutoff_folder, exist_ok=True)
-
-        # 重置索引并显示第一张图片
+        if self.journal:
+            self.journal.close()
+        self.journal = CropJournal(os.path.join(self.cutoff_folder, JOURNAL_NAME))
+        if self.journal.skipped:  # 这些行记录的裁剪框不会显示，序号仍按其余记录递增
+            messagebox.showwarning("裁剪日志", skipped_message(self.journal.path, self.journal.skipped))
+        if self.filmstrip:  # 换了文件夹，总览窗口随之关闭
+            self.filmstrip.on_close()
+
+        # 重置索引并显示第一张图片（已裁剪区域和计数从裁剪记录恢复）
         self.current_index = 0
         self.zoom_factor = 1.0  # 重置缩放因子
-        self.crop_count = 0  # 重置裁剪计数
-        self.cropped_regions = []  # 重置已裁剪区域记录
         self.show_current_image()
 
         # 更新状态
@@ -185,7 +251,7 @@ class ImageCutter:
         self.fullscreen_btn.config(text="退出全屏" if self.fullscreen else "切换全屏")
         # 重新调整图片大小以适应新窗口
         if self.original_image:
-            self.show_current_image()
+            self.resize_debouncer.trigger()
 
     def exit_fullscreen(self, event=None):
         """退出全屏模式"""
@@ -193,7 +259,7 @@ class ImageCutter:
         self.root.attributes("-fullscreen", False)
         self.fullscreen_btn.config(text="切换全屏")
         if self.original_image:
-            self.show_current_image()
+            self.resize_debouncer.trigger()
 
     def zoom(self, amount):
         """缩放图片"""
@@ -204,7 +270,17 @@ class ImageCutter:
         new_zoom = self.zoom_factor + amount
         if 0.1 <= new_zoom <= 5.0:
             self.zoom_factor = new_zoom
-            self.show_current_image()
+            # 只按新比例重绘视口内的瓦片和标注，不重新打开图片
+            self.update_scale()
+            self.canvas.delete("crop_mark")
+            self.draw_cropped_marks()
+            self.draw_tile_proposals()
+
+            # 与切换图片时一致：缩放后重新选择区域
+            self.selected_region = None
+            self.canvas.delete("selection_rect")
+            self.preview_label.config(image="")
+            self.update_status()
 
     def on_mouse_wheel(self, event):
         """鼠标滚轮缩放"""
@@ -220,20 +296,46 @@ class ImageCutter:
         self.canvas.config(cursor="fleur")
 
     def on_pan_move(self, event):
-        """平移图片"""
+        """平移图片：画布整体移动，只补画新露出的瓦片"""
         dx = event.x - self.pan_start_x
         dy = event.y - self.pan_start_y
         self.canvas.xview_scroll(-dx, "units")
         self.canvas.yview_scroll(-dy, "units")
         self.pan_start_x = event.x
         self.pan_start_y = event.y
+        self.renderer.render()
+
+    def on_xscroll(self, *args):
+        """拖动水平滚动条"""
+        self.canvas.xview(*args)
+        self.renderer.render()
+
+    def on_yscroll(self, *args):
+        """拖动垂直滚动条"""
+        self.canvas.yview(*args)
+        self.renderer.render()
 
     def on_window_resize(self, event=None):
         """窗口大小变化时重新调整图片显示"""
         # 避免窗口初始化时的无效调用
         if event and (event.widget != self.root or not self.original_image):
             return
-        self.show_current_image()
+        # 拖动窗口时 <Configure> 每秒触发几十次，合并为停止变化后的一次重绘
+        self.resize_debouncer.trigger()
+
+    def rerender_after_resize(self):
+        """先用快速滤波重绘视口，稍后再补一次高质量重采样；标注和选框只移动不重建图片"""
+        old_scale = self.scale_ratio
+        self.update_scale(fast=True)
+        if abs(self.scale_ratio - old_scale) < 1e-9:
+            self.renderer.refine()
+            return
+
+        self.canvas.delete("crop_mark")
+        self.draw_cropped_marks()
+        self.draw_tile_proposals()
+        self.show_current_image_with_rect()
+        self.refine_debouncer.trigger()
 
     def show_current_image(self):
         """显示当前索引的图片，同时绘制已裁剪区域标注"""
@@ -244,44 +346,51 @@ class ImageCutter:
 
         # 打开图片
         file_path = self.image_files[self.current_index]
-        self.original_image = Image.open(file_path)
+        with self.stats.time("decode"):
+            self.original_image = open_image(file_path)  # 超大图为内存映射，只按需读取区域
+            self.original_image.load()
+        self.stats.count("images")
 
-        # 调整图片大小（结合窗口自适应和手动缩放）
-        self.tk_image = self.resize_image(self.original_image)
+        # 从裁剪记录恢复这张图片的标注和已用序号
+        file_name = os.path.basename(file_path)
+        self.cropped_regions = self.journal.regions(file_name)
+        self.crop_count = self.journal.last_index(file_name)
 
-        # 在画布上显示图片（先清空所有内容）
+        # 在画布上显示图片（先清空所有内容），按窗口自适应和手动缩放只绘制视口内的瓦片
+        self.cancel_tiles()  # 分块建议只对当前图片有效
         self.canvas.delete("all")
-        self.canvas.image = self.tk_image  # 保持引用，防止被垃圾回收
-        self.canvas.create_image(0, 0, image=self.tk_image, anchor=tk.NW)
+        self.renderer.set_image(self.original_image)
+        self.update_scale()
 
         # 绘制已裁剪区域的标注（半透明绿色矩形+序号）
         self.draw_cropped_marks()
 
-        # 设置画布滚动区域
-        self.canvas.config(scrollregion=self.canvas.bbox(tk.ALL))
-
         # 重置选择区域
         self.selected_region = None
         self.preview_label.config(image="")
 
         # 更新状态
-        file_name = os.path.basename(file_path)
-        self.status_label.config(
-            text=f"图片 {self.current_index + 1}/{len(self.image_files)}: {file_name} "
-                 f"| 缩放: {self.zoom_factor:.1f}x"
-        )
+        self.update_status()
 
         # 更新裁剪计数显示
         self.crop_count_label.config(text=f"当前图片已裁剪: {self.crop_count}次")
+        if self.filmstrip:
+            self.filmstrip.on_image_changed()
 
         # 如果是第一张，禁用“上一张”按钮
         self.prev_btn.config(state=tk.NORMAL if self.current_index > 0 else tk.DISABLED)
         # 如果是最后一张，禁用“下一张”按钮
         self.next_btn.config(state=tk.NORMAL if self.current_index < len(self.image_files) - 1 else tk.DISABLED)
         
-    def resize_image(self, image):
-        """调整图片大小，允许放大到全屏"""
-        # 获取窗口可用空间
+    def update_status(self):
+        file_name = os.path.basename(self.image_files[self.current_index])
+        self.status_label.config(
+            text=f"图片 {self.current_index + 1}/{len(self.image_files)}: {file_name} "
+                 f"| 缩放: {self.zoom_factor:.1f}x"
+        )
+
+    def get_view_size(self):
+        """窗口中可用于显示图片的空间"""
         window_width = self.root.winfo_width() - 40  # 减去边距
         window_height = self.root.winfo_height() - 150  # 减去顶部和底部组件高度
 
@@ -289,62 +398,60 @@ class ImageCutter:
         if window_width <= 0 or window_height <= 0:
             window_width = 800
             window_height = 600
+        return window_width, window_height
 
-        # 计算基础缩放比例（适应窗口）
-        base_width_ratio = window_width / image.width
-        base_height_ratio = window_height / image.height
-        base_ratio = min(base_width_ratio, base_height_ratio)
-
-        # 结合手动缩放因子（允许放大）
-        self.scale_ratio = base_ratio * self.zoom_factor
-
-        new_width = int(image.width * self.scale_ratio)
-        new_height = int(image.height * self.scale_ratio)
-
-        # 调整大小并转换为Tkinter可用格式
-        resized_image = image.resize((new_width, new_height), Image.LANCZOS)
-        return ImageTk.PhotoImage(resized_image)
+    def update_scale(self, fast=False):
+        """计算显示比例（适应窗口 × 手动缩放，允许放大到全屏），只重绘视口内的瓦片"""
+        image = self.original_image
+        self.scale_ratio, _, _ = fit_size(image.width, image.height, *self.get_view_size(),
+                                          zoom=self.zoom_factor)
+        self.renderer.set_scale(self.scale_ratio)
+        self.renderer.render(fast=fast)
 
     def draw_cropped_marks(self):
         """绘制已裁剪区域标注：半透明绿色矩形 + 白色序号文字"""
-        if not self.cropped_regions:
-            return
+        for region in self.cropped_regions:
+            self.draw_crop_mark(*region)
 
-        for (x1, y1, x2, y2, crop_idx) in self.cropped_regions:
-            # 将原图坐标转换成当前显示图像坐标（考虑缩放：窗口缩放 × 用户缩放）
-            scale = self.scale_ratio * self.zoom_factor
+    def draw_crop_mark(self, x1, y1, x2, y2, crop_idx):
+        """在图片上方添加一个裁剪标注（画布元素，不重绘图片）"""
+        # 将原图坐标转换成当前显示图像坐标（scale_ratio 已包含窗口缩放 × 用户缩放）
+        scale = self.scale_ratio
 
-            draw_x1 = x1 * scale
-            draw_y1 = y1 * scale
-            draw_x2 = x2 * scale
-            draw_y2 = y2 * scale
+        draw_x1 = x1 * scale
+        draw_y1 = y1 * scale
+        draw_x2 = x2 * scale
+        draw_y2 = y2 * scale
 
-            # 绘制半透明绿色矩形（用 stipple 模拟半透明）
-            self.canvas.create_rectangle(
-                draw_x1, draw_y1, draw_x2, draw_y2,
-                fill="#00ff00",
-                stipple="gray50",
-                outline="#009900",
-                width=2,
-                tags="crop_mark"
-            )
+        # 绘制半透明绿色矩形（用 stipple 模拟半透明）
+        self.canvas.create_rectangle(
+            draw_x1, draw_y1, draw_x2, draw_y2,
+            fill="#00ff00",
+            stipple="gray50",
+            outline="#009900",
+            width=2,
+            tags="crop_mark"
+        )
 
-            # 绘制序号（居中显示）
-            center_x = (draw_x1 + draw_x2) / 2
-            center_y = (draw_y1 + draw_y2) / 2
+        # 绘制序号（居中显示）
+        center_x = (draw_x1 + draw_x2) / 2
+        center_y = (draw_y1 + draw_y2) / 2
 
-            self.canvas.create_text(
-                center_x, center_y,
-                text=str(crop_idx),
-                fill="white",
-                font=("Arial", 14, "bold"),
-                tags="crop_mark"
-            )
+        self.canvas.create_text(
+            center_x, center_y,
+            text=str(crop_idx),
+            fill="white",
+            font=("Arial", 14, "bold"),
+            tags="crop_mark"
+        )
 
     def clear_crop_marks(self):
         """清除当前图片上所有裁剪标注（不删除已裁剪文件）"""
         self.canvas.delete("crop_mark")
         self.cropped_regions = []  # 清空记录
+        if self.journal and self.image_files:
+            # 记入日志，之后回到这张图也不再显示；序号继续递增，不会覆盖已有文件
+            self.journal.record_clear(os.path.basename(self.image_files[self.current_index]))
         messagebox.showinfo("提示", "所有裁剪标注已清除")
 
     # def on_mouse_down(self, event):
@@ -415,34 +522,25 @@ class ImageCutter:
         )
 
         # 同步转换回原图坐标，供裁剪使用
-        self.selected_region = (
-            int((cx - self.fixed_crop_w / 2)),
-            int((cy - self.fixed_crop_h / 2)),
-            int((cx + self.fixed_crop_w / 2)),
-            int((cy + self.fixed_crop_h / 2))
+        self.selected_region = box_from_center(cx / self.scale_ratio, cy / self.scale_ratio,
+                                               self.fixed_crop_w, self.fixed_crop_h)
+
+    def show_current_image_with_rect(self):
+        """把红色选框移动到 selected_region 的位置（只改画布元素，不重绘图片）"""
+        self.canvas.delete("selection_rect")
+        if not self.selected_region:
+            return
+        x1, y1, x2, y2 = [v * self.scale_ratio for v in self.selected_region]
+        self.canvas.create_rectangle(
+            x1, y1, x2, y2,
+            outline="red", dash=(5, 2), width=3, tags="selection_rect"
         )
 
     def on_mouse_up(self, event):
         if not self.selected_region: return
 
-        x1, y1, x2, y2 = self.selected_region
         # 越界修正逻辑
-        img_w, img_h = self.original_image.size
-
-        shift_x = 0
-        if x1 < 0:
-            shift_x = -x1
-        elif x2 > img_w:
-            shift_x = img_w - x2
-
-        shift_y = 0
-        if y1 < 0:
-            shift_y = -y1
-        elif y2 > img_h:
-            shift_y = img_h - y2
-
-        # 应用修正
-        self.selected_region = (x1 + shift_x, y1 + shift_y, x2 + shift_x, y2 + shift_y)
+        self.selected_region = clamp_box(self.selected_region, *self.original_image.size)
         self.show_current_image_with_rect()  # 重新刷新一下位置
         self.show_preview()
 
@@ -467,45 +565,223 @@ class ImageCutter:
         if not self.selected_region:
             messagebox.showwarning("警告", "请先选择裁剪区域")
             return
+        if not self.writer_has_room():
+            return
 
-        # 增加裁剪计数
-        self.crop_count += 1
-        crop_idx = self.crop_count
+        self.save_crop(self.selected_region)
 
-        # 记录已裁剪区域（原始坐标+序号）
-        x1, y1, x2, y2 = self.selected_region
+        # 清除当前选择区域，准备下一次裁剪
+        self.selected_region = None
+        self.canvas.delete("selection_rect")
+        self.preview_label.config(image="")
+
+    def save_crop(self, region):
+        """保存一个裁剪框：放入写入队列、记入裁剪日志并添加标注"""
+        # 增加裁剪计数（取日志中用过的最大序号 + 1）
+        original_path = self.image_files[self.current_index]
+        crop_idx = self.journal.next_index(os.path.basename(original_path))
+        self.crop_count = crop_idx
+
+        # 记录已裁剪区域（原始坐标+序号），同时追加到裁剪日志
+        x1, y1, x2, y2 = region
         self.cropped_regions.append((x1, y1, x2, y2, crop_idx))
+        self.journal.record_crop(os.path.basename(original_path), crop_idx, region)
 
         # 裁剪图片
-        self.cropped_image = self.original_image.crop(self.selected_region)
+        self.cropped_image = self.original_image.crop(region)
 
         # 生成保存路径（包含裁剪次数）
-        original_path = self.image_files[self.current_index]
-        file_name, file_ext = os.path.splitext(os.path.basename(original_path))
-        new_file_name = f"{file_name}_cut_{crop_idx}{file_ext}"
-        save_path = os.path.join(self.cutoff_folder, new_file_name)
-
-        # 保存图片
-        self.cropped_image.save(save_path)
+        save_path = os.path.join(self.cutoff_folder, crop_filename(original_path, crop_idx))
 
-        # 清除当前选择区域，准备下一次裁剪
-        self.selected_region = None
-        self.canvas.delete("selection_rect")
-        self.preview_label.config(image="")
+        # 放入后台写入队列（编码和写盘不占用界面线程）
+        self.writer.submit(self.cropped_image, save_path)
+        if self.crop_labels_var.get():
+            self.submit_tile_annotations(save_path, region)
 
         # 更新裁剪计数显示
         self.crop_count_label.config(text=f"当前图片已裁剪: {self.crop_count}次")
 
-        # 重新绘制图片和标注（让新标注生效）
-        self.show_current_image()
+        # 只添加新标注，不重新加载和缩放图片
+        self.draw_crop_mark(x1, y1, x2, y2, crop_idx)
+
+    def submit_tile_annotations(self, save_path, region):
+        """把分块 masks / 标签的切片和写盘交给后台写入队列"""
+        path = self.image_files[self.current_index]
+        if self.annotation_sources[0] != path:
+            try:
+                sources = load_sources(path, *self.original_image.size)
+            except Exception as e:
+                sources = {}
+                self.status_label.config(text=f"标注读取失败: {e}")
+            self.annotation_sources = (path, sources)
+
+        sources = self.annotation_sources[1]
+        if not sources:
+            return
+        tile_name = os.path.splitext(os.path.basename(save_path))[0]
+        self.writer.submit_call(save_path, partial(write_tile_annotations, self.cutoff_folder, tile_name,
+                                                   region, **sources))
+
+    def propose_tile_grid(self):
+        """按 STRIDE 滑窗铺满当前图片，过滤背景块后显示为蓝色虚线框等待确认"""
+        if not self.original_image:
+            return
+        try:
+            masks = load_image_masks(self.image_files[self.current_index])
+            kept, boxes, _ = propose_tiles(self.original_image, masks, self.fixed_crop_w, self.fixed_crop_h, STRIDE)
+        except ValueError as e:
+            messagebox.showerror("错误", str(e))
+            return
+        except Exception as e:  # _seg.npy 损坏或无法读取
+            messagebox.showerror("错误", f"masks 读取失败: {e}")
+            return
+
+        self.tile_proposals = [[tuple(box), True] for box in kept.tolist()]
+        self.draw_tile_proposals()
+        state = tk.NORMAL if self.tile_proposals else tk.DISABLED
+        self.approve_tiles_btn.config(state=state)
+        self.cancel_tiles_btn.config(state=state)
+        self.status_label.config(text=f"建议 {len(kept)}/{len(boxes)} 块（Shift+单击取消/恢复某块）")
+
+    def draw_tile_proposals(self):
+        """绘制分块建议：保留的为蓝色虚线，取消的为灰色"""
+        self.canvas.delete("tile_proposal")
+        s = self.scale_ratio
+        for (x1, y1, x2, y2), active in self.tile_proposals:
+            self.canvas.create_rectangle(
+                x1 * s, y1 * s, x2 * s, y2 * s,
+                outline="#0066ff" if active else "#999999", dash=(4, 4) if active else (2, 6),
+                width=2, tags="tile_proposal"
+            )
+
+    def on_toggle_tile(self, event):
+        """Shift+单击：切换鼠标下最上面（最后一个）建议块的保留状态"""
+        x = self.canvas.canvasx(event.x) / self.scale_ratio
+        y = self.canvas.canvasy(event.y) / self.scale_ratio
+        for item in reversed(self.tile_proposals):
+            x1, y1, x2, y2 = item[0]
+            if x1 <= x < x2 and y1 <= y < y2:
+                item[1] = not item[1]
+                self.draw_tile_proposals()
+                break
+
+    def approve_tiles(self):
+        """保存所有保留的建议块（与手动裁剪相同的命名和日志）
+
+        写入队列放不下时分批保存：等队列腾出空位再继续，界面不等待；保存完之前不能切换图片。
+        """
+        if self.tile_queue:  # 上一批还没保存完
+            return
+        self.tile_queue = [box for box, active in self.tile_proposals if active]
+        self.tile_total = len(self.tile_queue)
+        self.cancel_tiles()
+        self.save_tile_batch()
+
+    def save_tile_batch(self, schedule=True):
+        self.tile_after_id = None
+        while self.tile_queue and self.writer.has_room(SAVE_JOBS_PER_CROP):
+            self.save_crop(self.tile_queue.pop(0))
+        if not self.tile_queue:
+            self.status_label.config(text=f"已保存 {self.tile_total} 块")
+        elif schedule:
+            done = self.tile_total - len(self.tile_queue)
+            self.status_label.config(text=f"正在保存分块 {done}/{self.tile_total}（等待写入队列）...")
+            self.tile_after_id = self.root.after(WRITE_STATUS_POLL_MS, self.save_tile_batch)
+
+    def writer_has_room(self):
+        """写入队列放不下一次裁剪时提示并返回 False：不阻塞界面，稍后再按一次即可"""
+        if self.tile_queue:
+            self.status_label.config(text="正在分批保存分块，请稍候")
+            return False
+        if self.writer.has_room(SAVE_JOBS_PER_CROP):
+            return True
+        self.status_label.config(text="写入队列已满，本次未保存，请稍候再裁剪")
+        return False
+
+    def saving_tiles(self):
+        """分块还在分批保存时不能切换图片或文件夹（save_crop 按当前图片裁剪）"""
+        if self.tile_queue:
+            self.status_label.config(text="正在分批保存分块，保存完后再切换图片")
+            return True
+        return False
+
+    def finish_tiles(self):
+        """退出前把还没放入写入队列的分块保存完（此时可以等待）"""
+        if self.tile_after_id is not None:
+            self.root.after_cancel(self.tile_after_id)
+        while self.tile_queue:
+            self.writer.flush()
+            self.save_tile_batch(schedule=False)
+
+    def cancel_tiles(self):
+        self.tile_proposals = []
+        self.canvas.delete("tile_proposal")
+        self.approve_tiles_btn.config(state=tk.DISABLED)
+        self.cancel_tiles_btn.config(state=tk.DISABLED)
+
+    def poll_write_status(self):
+        """定时刷新写入队列状态，有失败时标红"""
+        pending, failed = self.writer.status()
+        color = "red" if failed else ("#cc6600" if pending else "gray")
+        self.write_status_label.config(text=self.writer.status_text(), fg=color)
+        for path, msg in self.writer.pop_errors():
+            self.status_label.config(text=f"保存失败: {os.path.basename(path)} ({msg})")
+        self.root.after(WRITE_STATUS_POLL_MS, self.poll_write_status)
+
+    def on_close(self):
+        """退出前把分批保存中的分块和队列里的裁剪图写完"""
+        self.resize_debouncer.cancel()
+        self.refine_debouncer.cancel()
+        self.finish_tiles()
+        pending, _ = self.writer.status()
+        if pending:
+            self.write_status_label.config(text=f"正在保存剩余 {pending} 张...", fg="#cc6600")
+            self.root.update_idletasks()
+        self.writer.close()
+        self.report_stats()
+        if self.journal:
+            self.journal.close()
+        if self.filmstrip:
+            self.filmstrip.on_close()
+        self.root.destroy()
+
+    def report_stats(self):
+        """退出时打印解码/缩放/绘制/保存耗时汇总，并写入当前文件夹的 cutoff 目录"""
+        if not self.stats.samples:
+            return
+        print(self.stats.format_summary())
+        if STATS_REPORT_NAME and self.journal:
+            name = STATS_REPORT_NAME.format(time=time.strftime("%Y%m%d_%H%M%S"))
+            path = os.path.join(os.path.dirname(self.journal.path), name)
+            try:
+                self.stats.write_report(path)
+            except OSError as e:
+                print(f"计时报告写入失败: {e}")
+
+    def open_filmstrip(self):
+        """打开缩略图总览窗口（已打开时提到最前）"""
+        if not self.image_files:
+            return
+        if self.filmstrip is None:
+            self.filmstrip = FilmstripWindow(self, self.root)
+        else:
+            self.filmstrip.window.lift()
+
+    def jump_to(self, index):
+        """从缩略图总览跳转到第 index 张"""
+        if self.saving_tiles():
+            return
+        if 0 <= index < len(self.image_files) and index != self.current_index:
+            self.current_index = index
+            self.show_current_image()
 
     def prev_image(self):
         """切换到上一张图片"""
+        if self.saving_tiles():
+            return
         if self.current_index > 0:
             self.current_index -= 1
-            # 切换图片时重置当前图片的临时状态
-            self.crop_count = 0
-            self.cropped_regions = []
+            # 已裁剪区域和计数由 show_current_image 从裁剪日志恢复
             # 注意：这里不一定要重置 zoom_factor，保持缩放可以方便连续操作
             self.show_current_image()
         else:
@@ -513,10 +789,10 @@ class ImageCutter:
 
     def next_image(self):
         """切换到下一张图片"""
+        if self.saving_tiles():
+            return
         if self.current_index < len(self.image_files) - 1:
             self.current_index += 1
-            self.crop_count = 0
-            self.cropped_regions = []
             self.show_current_image()
         else:
             messagebox.showinfo("完成", "已经是最后一张图片了")
@@ -1,9 +1,30 @@
 import os
 import tkinter as tk
 from tkinter import filedialog, messagebox
-from PIL import Image, ImageTk
+from PIL import ImageTk
 import glob
-import shutil
+import time
+from functools import partial
+
+from image_cache import ImagePrefetcher, PREFETCH_AHEAD, fit_size
+from viewport import TiledRenderer, Debouncer
+from crop_writer import CropWriter
+from crop_engine import CROP_W, CROP_H, REF_CROP_W, REF_CROP_H, box_from_center, clamp_box, crop_filename, crop_image
+from crop_journal import CropJournal, JOURNAL_NAME, skipped_message
+from crop_tiling import propose_tiles, STRIDE
+from crop_labels import load_image_masks, load_sources, write_tile_annotations
+from filmstrip import FilmstripWindow
+from registration import PairRegistry, REGISTRATION_NAME, map_point, transform_scale
+from run_stats import RunStats
+
+RESIZE_DEBOUNCE_MS = 80  # 窗口尺寸停止变化多久后重绘
+REFINE_DELAY_MS = 250  # 快速重绘之后多久补一次高质量重采样
+WRITE_STATUS_POLL_MS = 200  # 刷新写入队列状态的间隔
+SAVE_JOBS_PER_CROP = 3  # 一次裁剪最多放入写入队列的任务数（主图、分块标注、参考图）
+REGISTRATION_POLL_MS = 300  # 刷新参考图配准状态的间隔
+REF_VIEW_SIZE = (600, 600)  # 参考图窗口的显示尺寸
+REF_LOAD_POLL_MS = 40  # 参考图还在后台解码时，多久查看一次是否完成
+STATS_REPORT_NAME = "crop_stats_{time}.json"  # 退出时写入 cutoff 目录的计时报告（按时间命名不覆盖），None 表示只打印
 
 
 class ReferenceWindow:
@@ -20,11 +41,16 @@ class ReferenceWindow:
         self.image_files = []
         self.current_index = 0
         self.original_image = None
+        self.loaded_path = None  # original_image 对应的图片，后台解码完成前与当前图片不同
+        self.load_id = None  # 等待后台解码的 after 回调
+        self.loading = False  # 画布上显示的是“加载中”
         self.tk_image = None
         self.zoom_factor = 1.0
+        self.registry = None  # 图片对配准缓存（主图文件夹 cutoff/registration.json）
 
         # UI组件
         self.create_widgets()
+        self.poll_id = self.window.after(REGISTRATION_POLL_MS, self.poll_registration)
 
         # 绑定窗口关闭事件
         self.window.protocol("WM_DELETE_WINDOW", self.on_close)
@@ -41,10 +67,18 @@ class ReferenceWindow:
         self.btn_match = tk.Button(top_frame, text="2. 匹配文件名 (关联)", bg="#ffcccc", command=self.match_filename)
         self.btn_match.pack(side=tk.LEFT, padx=20)
 
+        # 配准：估计主图 → 参考图的平移/缩放，联动裁剪按变换后的中心裁剪
+        self.register_var = tk.BooleanVar(value=True)
+        tk.Checkbutton(top_frame, text="自动配准", variable=self.register_var,
+                       command=self.request_registration).pack(side=tk.LEFT, padx=5)
+
         # 状态
         self.status_label = tk.Label(top_frame, text="未加载")
         self.status_label.pack(side=tk.RIGHT)
 
+        self.registration_label = tk.Label(self.window, text="配准: -", fg="gray", anchor="w")
+        self.registration_label.pack(fill=tk.X, padx=5)
+
         # 图片显示区域
         self.canvas = tk.Canvas(self.window, bg="gray")
         self.canvas.pack(fill=tk.BOTH, expand=True)
@@ -62,7 +96,7 @@ class ReferenceWindow:
         self.folder_path = path
 
         # 获取图片
-        exts = ['*.jpg', '*.jpeg', '*.png', '*.gif', '*.bmp']
+        exts = ['*.jpg', '*.jpeg', '*.png', '*.gif', '*.bmp', '*.tif', '*.tiff']
         self.image_files = []
         for ext in exts:
             self.image_files.extend(glob.glob(os.path.join(path, ext)))
@@ -75,17 +109,40 @@ class ReferenceWindow:
             self.status_label.config(text="无图片")
 
     def show_image(self):
+        """从主窗口的预取缓存取图（解码和缩放都在后台线程），还没解码完时先显示“加载中”，不阻塞界面"""
         if not self.image_files: return
 
         path = self.image_files[self.current_index]
-        self.original_image = Image.open(path)
-
-        # 简单缩放适应窗口显示（不做复杂交互，只做展示）
-        w, h = self.original_image.size
-        ratio = min(600 / w, 600 / h)
-        new_w, new_h = int(w * ratio), int(h * ratio)
+        self.window.title(f"参考图: {os.path.basename(path)}")
+        self.request_registration()
+        self.prefetch_neighbors()
+        if self.load_id is not None:
+            self.window.after_cancel(self.load_id)
+            self.load_id = None
+        self.display_when_ready(path)
+
+    def display_when_ready(self, path):
+        self.load_id = None
+        if not self.image_files or path != self.image_files[self.current_index]:
+            return  # 已经翻到别的图片
+        try:
+            loaded = self.main_app.prefetcher.peek(path, REF_VIEW_SIZE, owner="ref")
+        except Exception as e:
+            self.canvas.delete("all")
+            self.loading = False
+            self.status_label.config(text=f"无法打开: {e}")
+            return
+        if loaded is None:
+            if not self.loading:
+                self.canvas.delete("all")
+                self.canvas.create_text(REF_VIEW_SIZE[0] // 2, REF_VIEW_SIZE[1] // 2, text="加载中...", fill="white")
+                self.loading = True
+            self.load_id = self.window.after(REF_LOAD_POLL_MS, self.display_when_ready, path)
+            return
 
-        img_resized = self.original_image.resize((new_w, new_h), Image.LANCZOS)
+        self.original_image, img_resized = loaded
+        self.loaded_path = path
+        self.loading = False
         self.tk_image = ImageTk.PhotoImage(img_resized)
 
         self.canvas.delete("all")
@@ -94,9 +151,17 @@ class ReferenceWindow:
         ch = self.canvas.winfo_height() or 600
         self.canvas.create_image(cw // 2, ch // 2, image=self.tk_image)
 
-        self.window.title(f"参考图: {os.path.basename(path)}")
+    def prefetch_neighbors(self):
+        """后台解码前后各 PREFETCH_AHEAD 张参考图，联动翻页时直接取缓存"""
+        paths = []
+        for step in range(1, PREFETCH_AHEAD + 1):
+            for idx in (self.current_index + step, self.current_index - step):
+                if 0 <= idx < len(self.image_files):
+                    paths.append(self.image_files[idx])
+        self.main_app.prefetcher.prefetch(paths, REF_VIEW_SIZE, owner="ref")
 
     def prev_image(self):
+        if self.saving_tiles(): return
         if self.current_index > 0:
             self.current_index -= 1
             self.show_image()
@@ -136,37 +201,110 @@ class ReferenceWindow:
         except Exception as e:
             messagebox.showerror("错误", f"重命名失败: {e}")
 
+    # === 配准 ===
+    def current_pair(self):
+        """(主图路径, 参考图路径)，任一侧没有图片时返回 None"""
+        if not self.image_files or not self.main_app.image_files:
+            return None
+        return self.main_app.image_files[self.main_app.current_index], self.image_files[self.current_index]
+
+    def get_registry(self):
+        """配准缓存放在主图文件夹的 cutoff 目录，主窗口换了文件夹时重新打开"""
+        path = os.path.join(self.main_app.cutoff_folder, REGISTRATION_NAME)
+        if self.registry is None or self.registry.path != path:
+            if self.registry is not None:
+                self.registry.shutdown()
+            self.registry = PairRegistry(path)
+        return self.registry
+
+    def request_registration(self):
+        """主图或参考图切换、重新关联后调用：后台计算当前图片对的变换（已缓存时不重复计算）"""
+        pair = self.current_pair()
+        if pair is not None and self.register_var.get():
+            self.get_registry().request(*pair)
+        self.update_registration_status()
+
+    def registration_for_current(self):
+        """当前图片对可用的配准结果；未开启、未完成或失败时返回 None（按相同坐标裁剪）"""
+        pair = self.current_pair()
+        if pair is None or not self.register_var.get() or self.registry is None:
+            return None
+        record = self.registry.get(*pair)
+        return record if record and record["matrix"] else None
+
+    def update_registration_status(self):
+        pair = self.current_pair()
+        if not self.register_var.get():
+            text, color = "配准: 关闭（按相同坐标裁剪）", "gray"
+        elif pair is None or self.registry is None:
+            text, color = "配准: -", "gray"
+        elif self.registry.is_pending(*pair):
+            text, color = "配准: 计算中...（暂按相同坐标裁剪）", "#cc6600"
+        else:
+            record = self.registry.get(*pair)
+            if record and record["matrix"]:
+                (_, _, dx), (_, _, dy) = record["matrix"]
+                text = (f"配准: {record['method']} 偏移 ({dx:+.1f}, {dy:+.1f}) "
+                        f"比例 {transform_scale(record['matrix']):.3f} 得分 {record['score']}")
+                color = "#008800"
+            elif record:
+                text, color = f"配准失败，按相同坐标裁剪 {record.get('error', '')}", "red"
+            else:
+                text, color = "配准: -", "gray"
+        save_error = self.registry.last_save_error() if self.registry is not None else None
+        if save_error:
+            text, color = f"{text}（配准缓存写入失败: {save_error}）", "red"
+        self.registration_label.config(text=text, fg=color)
+
+    def poll_registration(self):
+        self.update_registration_status()
+        self.poll_id = self.window.after(REGISTRATION_POLL_MS, self.poll_registration)
+
     def sync_crop_and_save(self, center_x, center_y, crop_index):
-        """接收主窗口的中心点，进行700x700裁剪并保存"""
-        if not self.original_image: return
+        """接收主窗口的中心点，按配准变换映射后进行700x700裁剪并保存，返回 (参考图路径, 裁剪框, 输出尺寸) 供裁剪日志记录
+
+        配准结果带缩放时，裁剪框同比缩放，覆盖的视野与主图裁剪一致，保存前再缩放回 700x700；
+        没有可用的配准结果时与以前一样按相同坐标裁剪。
+        """
+        if not self.image_files: return None
+        ref_path = self.image_files[self.current_index]
+        if self.loaded_path != ref_path:
+            # 参考图还在后台解码（刚翻页就按了回车）：等它解码完再裁剪，不能用上一张图
+            self.original_image, _ = self.main_app.prefetcher.get(ref_path, REF_VIEW_SIZE, owner="ref")
+            self.loaded_path = ref_path
 
         # 1. 设置保存路径: cutoff/对比参考
         save_dir = os.path.join(self.main_app.cutoff_folder, "对比参考")
         os.makedirs(save_dir, exist_ok=True)
 
-        # 2. 计算裁剪区域 (700x700，基于传入的中心点)
-        crop_w, crop_h = 700, 700
-        x1 = int(center_x - crop_w / 2)
-        y1 = int(center_y - crop_h / 2)
-        x2 = int(center_x + crop_w / 2)
-        y2 = int(center_y + crop_h / 2)
+        # 2. 计算裁剪区域 (700x700，中心按配准变换映射到参考图坐标)
+        crop_w, crop_h = REF_CROP_W, REF_CROP_H
+        record = self.registration_for_current()
+        if record:
+            center_x, center_y = map_point(record["matrix"], center_x, center_y)
+            scale = transform_scale(record["matrix"])
+            crop_w, crop_h = int(round(REF_CROP_W * scale)), int(round(REF_CROP_H * scale))
+        x1, y1, x2, y2 = box_from_center(center_x, center_y, crop_w, crop_h)
 
         # 3. 裁剪 (PIL允许坐标越界，会自动处理或需要我们手动补全？PIL crop越界会切掉，所以最好不做padding除非有需求，这里按直接裁处理)
         # 为了防止越界导致图片变小，通常建议先扩充边缘，或者接受变小。这里简单处理：直接Crop
-        cropped = self.original_image.crop((x1, y1, x2, y2))
+        cropped = crop_image(self.original_image, (x1, y1, x2, y2), (REF_CROP_W, REF_CROP_H))
 
         # 4. 生成文件名
-        ref_path = self.image_files[self.current_index]
-        file_name, file_ext = os.path.splitext(os.path.basename(ref_path))
-        # 保持与主窗口类似的命名逻辑
-        new_file_name = f"{file_name}_cut_{crop_index}{file_ext}"
-        save_path = os.path.join(save_dir, new_file_name)
+        # 保持与主窗口相同的命名逻辑
+        save_path = os.path.join(save_dir, crop_filename(ref_path, crop_index))
 
-        cropped.save(save_path)
-        print(f"参考图已裁剪并保存至: {save_path}")
+        self.main_app.writer.submit(cropped, save_path)  # 与主图共用后台写入队列
+        print(f"参考图已裁剪，后台保存至: {save_path}")
+        return ref_path, (x1, y1, x2, y2), (REF_CROP_W, REF_CROP_H)
 
     def on_close(self):
         # 只是隐藏而不是销毁，或者销毁后主程序处理
+        self.window.after_cancel(self.poll_id)
+        if self.load_id is not None:
+            self.window.after_cancel(self.load_id)
+        if self.registry is not None:
+            self.registry.shutdown()
         self.window.destroy()
         self.main_app.ref_window = None
 
@@ -182,11 +320,16 @@ class ImageCutter:
         self.current_index = 0
         self.selected_region = None  # (x1, y1, x2, y2) 原图坐标
         self.original_image = None
-        self.tk_image = None
         self.scale_ratio = 1.0
         self.zoom_factor = 1.0
         self.crop_count = 0
         self.cropped_regions = []
+        self.tile_proposals = []  # 自动分块建议：[[x1, y1, x2, y2], 是否保留]
+        self.tile_queue = []  # 已确认、等待写入队列腾出空位的分块
+        self.tile_total = 0
+        self.tile_after_id = None
+        self.annotation_sources = (None, {})  # (图片路径, 整图标注来源)，按图片缓存
+        self.journal = None  # 当前文件夹的裁剪日志，切换图片时从中恢复标注和序号
 
         # 拖拽相关
         self.center_x = 0
@@ -197,10 +340,18 @@ class ImageCutter:
 
         # 参考窗口实例
         self.ref_window = None
+        self.filmstrip = None  # 缩略图总览窗口
+
+        # 解码/缩放/绘制/保存的耗时，退出时输出 p50/p95/max
+        self.stats = RunStats("crop_gui", item_count="images")
+        # 后台预取前后几张图片，切换时直接取缓存
+        self.prefetcher = ImagePrefetcher(stats=self.stats)
+        # 裁剪图在后台线程编码写盘，按回车不再卡界面
+        self.writer = CropWriter(stats=self.stats)
 
         # 固定裁剪尺寸（主窗口）
-        self.fixed_crop_w = 640
-        self.fixed_crop_h = 640
+        self.fixed_crop_w = CROP_W
+        self.fixed_crop_h = CROP_H
 
         self.create_widgets()
         self.select_folder()
@@ -211,6 +362,8 @@ class ImageCutter:
         self.canvas.bind("<ButtonPress-1>", self.on_mouse_down)
         self.canvas.bind("<B1-Motion>", self.on_mouse_drag)
         self.canvas.bind("<ButtonRelease-1>", self.on_mouse_up)
+        self.canvas.bind("<Shift-Button-1>", self.on_toggle_tile)
+        self.root.bind("<Escape>", lambda event: self.cancel_tiles())
         # 右键平移
         self.canvas.bind("<ButtonPress-3>", self.on_pan_start)
         self.canvas.bind("<B3-Motion>", self.on_pan_move)
@@ -218,10 +371,21 @@ class ImageCutter:
         # 启动时尝试打开参考窗口
         self.open_ref_window()
 
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+
     def open_ref_window(self):
         if self.ref_window is None:
             self.ref_window = ReferenceWindow(self, self.root)
 
+    def open_filmstrip(self):
+        """打开缩略图总览窗口（已打开时提到最前）"""
+        if not self.image_files:
+            return
+        if self.filmstrip is None:
+            self.filmstrip = FilmstripWindow(self, self.root)
+        else:
+            self.filmstrip.window.lift()
+
     def create_widgets(self):
         # 顶部
         top_frame = tk.Frame(self.root)
@@ -229,6 +393,15 @@ class ImageCutter:
 
         tk.Button(top_frame, text="选择文件夹", command=self.select_folder).pack(side=tk.LEFT, padx=5)
         tk.Button(top_frame, text="重开参考窗口", command=self.open_ref_window).pack(side=tk.LEFT, padx=5)
+        # 缩略图总览：网格浏览整个文件夹，单击跳转，可只看未裁剪的图片
+        tk.Button(top_frame, text="缩略图总览", command=self.open_filmstrip).pack(side=tk.LEFT, padx=5)
+        # 自动分块：先在画布上显示建议的块，Shift+单击取消/恢复某一块，确认后批量保存
+        tk.Button(top_frame, text="自动分块", command=self.propose_tile_grid).pack(side=tk.LEFT, padx=5)
+        self.approve_tiles_btn = tk.Button(top_frame, text="确认分块", command=self.approve_tiles, state=tk.DISABLED)
+        self.approve_tiles_btn.pack(side=tk.LEFT, padx=5)
+        # 同时裁剪同名 _seg.npy / YOLO 标签，输出到 cutoff/masks、cutoff/labels
+        self.crop_labels_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(top_frame, text="同时裁剪标注", variable=self.crop_labels_var).pack(side=tk.LEFT, padx=5)
         self.status_label = tk.Label(top_frame, text="请选择文件夹")
         self.status_label.pack(side=tk.LEFT, padx=20)
 
@@ -238,6 +411,10 @@ class ImageCutter:
 
         self.canvas = tk.Canvas(self.image_frame, cursor="cross", bg="#e0e0e0")
         self.canvas.pack(fill=tk.BOTH, expand=True)
+        # 只绘制视口内的瓦片，缩放/平移不再整图重采样
+        self.renderer = TiledRenderer(self.canvas, stats=self.stats)
+        self.resize_debouncer = Debouncer(self.root, RESIZE_DEBOUNCE_MS, self.rerender_after_resize)
+        self.refine_debouncer = Debouncer(self.root, REFINE_DELAY_MS, self.renderer.refine)
 
         # 底部
         bottom_frame = tk.Frame(self.root)
@@ -261,11 +438,16 @@ class ImageCutter:
         self.crop_count_label = tk.Label(bottom_frame, text="裁剪: 0")
         self.crop_count_label.pack(side=tk.LEFT, padx=20)
 
+        self.write_status_label = tk.Label(bottom_frame, text="已全部保存", fg="gray")
+        self.write_status_label.pack(side=tk.LEFT, padx=10)
+        self.root.after(WRITE_STATUS_POLL_MS, self.poll_write_status)
+
     def select_folder(self):
+        if self.saving_tiles(): return
         self.folder_path = filedialog.askdirectory(title="选择主图片文件夹")
         if not self.folder_path: return
 
-        exts = ['*.jpg', '*.jpeg', '*.png', '*.gif', '*.bmp']
+        exts = ['*.jpg', '*.jpeg', '*.png', '*.gif', '*.bmp', '*.tif', '*.tiff']
         self.image_files = []
         for ext in exts:
             self.image_files.extend(glob.glob(os.path.join(self.folder_path, ext)))
@@ -277,6 +459,13 @@ class ImageCutter:
         # 创建cutoff文件夹
         self.cutoff_folder = os.path.join(self.folder_path, "cutoff")
         os.makedirs(self.cutoff_folder, exist_ok=True)
+        if self.journal:
+            self.journal.close()
+        self.journal = CropJournal(os.path.join(self.cutoff_folder, JOURNAL_NAME))
+        if self.journal.skipped:  # 这些行记录的裁剪框不会显示，序号仍按其余记录递增
+            messagebox.showwarning("裁剪日志", skipped_message(self.journal.path, self.journal.skipped))
+        if self.filmstrip:  # 换了文件夹，总览窗口随之关闭
+            self.filmstrip.on_close()
 
         self.current_index = 0
         self.show_current_image()
@@ -285,28 +474,42 @@ class ImageCutter:
         self.prev_btn.config(state=tk.NORMAL)
         self.next_btn.config(state=tk.NORMAL)
 
-    def resize_image(self, image):
+    def get_view_size(self):
         # 简单的自适应逻辑
         w = self.root.winfo_width() - 40
         h = self.root.winfo_height() - 150
         if w <= 0: w, h = 800, 600
+        return w, h
 
-        base_ratio = min(w / image.width, h / image.height)
-        self.scale_ratio = base_ratio * self.zoom_factor
-
-        new_w = int(image.width * self.scale_ratio)
-        new_h = int(image.height * self.scale_ratio)
-        return ImageTk.PhotoImage(image.resize((new_w, new_h), Image.LANCZOS))
+    def update_scale(self, render=True, fast=False):
+        """按窗口大小和缩放因子计算显示比例，只重绘视口内的瓦片"""
+        img = self.original_image
+        self.scale_ratio, _, _ = fit_size(img.width, img.height, *self.get_view_size(), zoom=self.zoom_factor)
+        self.renderer.set_scale(self.scale_ratio)
+        if render:
+            self.renderer.render(fast=fast)
 
     def show_current_image(self):
         if not self.image_files: return
 
         path = self.image_files[self.current_index]
-        self.original_image = Image.open(path)
-        self.tk_image = self.resize_image(self.original_image)
+        view_size = self.get_view_size()
+        # 预取线程生成的适应窗口显示图作为金字塔的一层，缩放为 1 时直接取用
+        with self.stats.time("wait"):  # 预取命中时接近 0
+            self.original_image, display = self.prefetcher.get(path, view_size)
+        self.stats.count("images")
+        self.prefetch_neighbors(view_size)
+
+        # 从裁剪日志恢复这张图片的历史裁剪框和已用序号
+        name = os.path.basename(path)
+        self.cropped_regions = self.journal.regions(name)
+        self.crop_count = self.journal.last_index(name)
+        self.crop_count_label.config(text=f"裁剪: {self.crop_count}")
 
+        self.cancel_tiles()  # 分块建议只对当前图片有效
         self.canvas.delete("all")
-        self.canvas.create_image(0, 0, image=self.tk_image, anchor=tk.NW)
+        self.renderer.set_image(self.original_image, [display])
+        self.update_scale()
 
         # 绘制历史裁剪框
         self.draw_history_marks()
@@ -314,15 +517,32 @@ class ImageCutter:
         self.selected_region = None
         self.preview_label.config(image="")
         self.status_label.config(text=f"{os.path.basename(path)} ({self.current_index + 1}/{len(self.image_files)})")
-        self.canvas.config(scrollregion=self.canvas.bbox(tk.ALL))
+        if self.filmstrip:
+            self.filmstrip.on_image_changed()
+        if self.ref_window:
+            self.ref_window.request_registration()  # 主图换了，图片对随之改变
 
     def draw_history_marks(self):
         """绘制已裁剪区域的绿色半透明框"""
-        for (x1, y1, x2, y2, idx) in self.cropped_regions:
-            s = self.scale_ratio
-            self.canvas.create_rectangle(x1 * s, y1 * s, x2 * s, y2 * s, outline="#00ff00", width=2)
-            self.canvas.create_text((x1 + x2) / 2 * s, (y1 + y2) / 2 * s, text=str(idx), fill="#00ff00",
-                                    font=("Arial", 14, "bold"))
+        for region in self.cropped_regions:
+            self.draw_crop_mark(*region)
+
+    def draw_crop_mark(self, x1, y1, x2, y2, idx):
+        """在图片上方添加一个裁剪标注（画布元素，不重绘图片）"""
+        s = self.scale_ratio
+        self.canvas.create_rectangle(x1 * s, y1 * s, x2 * s, y2 * s, outline="#00ff00", width=2,
+                                     tags="crop_mark")
+        self.canvas.create_text((x1 + x2) / 2 * s, (y1 + y2) / 2 * s, text=str(idx), fill="#00ff00",
+                                font=("Arial", 14, "bold"), tags="crop_mark")
+
+    def redraw_overlays(self):
+        """比例变化后按新比例重画裁剪标注和当前红框（不重绘图片）"""
+        self.canvas.delete("crop_mark")
+        self.draw_history_marks()
+        self.draw_tile_proposals()
+        if self.selected_region:
+            x1, y1, x2, y2 = self.selected_region
+            self.draw_red_box((x1 + x2) / 2 * self.scale_ratio, (y1 + y2) / 2 * self.scale_ratio)
 
     # === 鼠标操作核心 (拖动框) ===
     def on_mouse_down(self, event):
@@ -363,21 +583,14 @@ class ImageCutter:
     def on_mouse_up(self, event):
         # 边界检查防止移出图片
         if not self.selected_region: return
-        x1, y1, x2, y2 = self.selected_region
-        w, h = self.original_image.size
-
         # 简单的平移回正逻辑
-        dx, dy = 0, 0
-        if x1 < 0: dx = -x1
-        if x2 > w: dx = w - x2
-        if y1 < 0: dy = -y1
-        if y2 > h: dy = h - y2
-
-        if dx != 0 or dy != 0:
-            self.selected_region = (x1 + dx, y1 + dy, x2 + dx, y2 + dy)
+        clamped = clamp_box(self.selected_region, *self.original_image.size)
+        if clamped != self.selected_region:
+            self.selected_region = clamped
+            x1, y1, x2, y2 = clamped
             # 重新绘制红框
-            cx = (x1 + dx + x2 + dx) / 2 * self.scale_ratio
-            cy = (y1 + dy + y2 + dy) / 2 * self.scale_ratio
+            cx = (x1 + x2) / 2 * self.scale_ratio
+            cy = (y1 + y2) / 2 * self.scale_ratio
             self.draw_red_box(cx, cy)
 
         self.show_preview()
@@ -390,15 +603,8 @@ class ImageCutter:
         self.draw_red_box(cx_canvas, cy_canvas)
 
         # 转换回原图坐标
-        raw_cx = cx_canvas / self.scale_ratio
-        raw_cy = cy_canvas / self.scale_ratio
-
-        self.selected_region = (
-            int(raw_cx - self.fixed_crop_w / 2),
-            int(raw_cy - self.fixed_crop_h / 2),
-            int(raw_cx + self.fixed_crop_w / 2),
-            int(raw_cy + self.fixed_crop_h / 2)
-        )
+        self.selected_region = box_from_center(cx_canvas / self.scale_ratio, cy_canvas / self.scale_ratio,
+                                               self.fixed_crop_w, self.fixed_crop_h)
 
     def draw_red_box(self, cx, cy):
         half_w = (self.fixed_crop_w * self.scale_ratio) / 2
@@ -419,34 +625,168 @@ class ImageCutter:
     # === 裁剪与保存 ===
     def confirm_crop(self):
         if not self.selected_region: return
+        if not self.writer_has_room(): return
+
+        self.save_crop(self.selected_region)
+
+        # 界面反馈
+        self.canvas.delete("selection_rect")
+        self.selected_region = None
+        self.preview_label.config(image="")
 
-        self.crop_count += 1
+    def save_crop(self, region):
+        """保存一个裁剪框（主图 + 参考图联动），记入日志并添加绿色标注"""
+        # 序号取日志中用过的最大序号 + 1，回到旧图片继续裁剪也不会覆盖已有文件
+        name = os.path.basename(self.image_files[self.current_index])
+        self.crop_count = self.journal.next_index(name)
 
-        # 1. 保存主图裁剪
+        # 1. 保存主图裁剪（crop 在主线程完成，编码写盘交给后台队列）
         save_path = os.path.join(self.cutoff_folder, self.get_crop_filename(self.crop_count))
-        self.original_image.crop(self.selected_region).save(save_path)
+        self.writer.submit(self.original_image.crop(region), save_path)
+        if self.crop_labels_var.get():
+            self.submit_tile_annotations(save_path, region)
 
         # 记录历史
-        self.cropped_regions.append((*self.selected_region, self.crop_count))
+        self.cropped_regions.append((*region, self.crop_count))
 
         # 2. **关键：触发参考窗口的联动裁剪**
+        ref = None
         if self.ref_window:
             # 计算中心点传给参考窗口
-            x1, y1, x2, y2 = self.selected_region
+            x1, y1, x2, y2 = region
             center_x = (x1 + x2) / 2
             center_y = (y1 + y2) / 2
-            self.ref_window.sync_crop_and_save(center_x, center_y, self.crop_count)
+            ref = self.ref_window.sync_crop_and_save(center_x, center_y, self.crop_count)
+
+        # 3. 追加到裁剪日志（含参考图配对）
+        ref_image, ref_box, ref_out_size = ref if ref else (None, None, None)
+        self.journal.record_crop(name, self.crop_count, region, ref_image, ref_box, ref_out_size)
 
-        # 界面反馈
-        self.canvas.delete("selection_rect")
-        self.selected_region = None
-        self.preview_label.config(image="")
         self.crop_count_label.config(text=f"裁剪: {self.crop_count}")
-        self.show_current_image()  # 刷新显示绿色框
+        self.draw_crop_mark(*self.cropped_regions[-1])  # 只添加新的绿色框，不重新加载图片
+
+    def submit_tile_annotations(self, save_path, region):
+        """把分块 masks / 标签的切片和写盘交给后台写入队列"""
+        path = self.image_files[self.current_index]
+        if self.annotation_sources[0] != path:
+            try:
+                sources = load_sources(path, *self.original_image.size)
+            except Exception as e:
+                sources = {}
+                self.status_label.config(text=f"标注读取失败: {e}")
+            self.annotation_sources = (path, sources)
+
+        sources = self.annotation_sources[1]
+        if not sources:
+            return
+        tile_name = os.path.splitext(os.path.basename(save_path))[0]
+        self.writer.submit_call(save_path, partial(write_tile_annotations, self.cutoff_folder, tile_name,
+                                                   region, **sources))
+
+    # === 自动分块 ===
+    def propose_tile_grid(self):
+        """按 STRIDE 滑窗铺满当前图片，过滤背景块后显示为蓝色虚线框等待确认"""
+        if not self.original_image: return
+        try:
+            masks = load_image_masks(self.image_files[self.current_index])
+            kept, boxes, _ = propose_tiles(self.original_image, masks, self.fixed_crop_w, self.fixed_crop_h, STRIDE)
+        except ValueError as e:
+            messagebox.showerror("错误", str(e))
+            return
+        except Exception as e:  # _seg.npy 损坏或无法读取
+            messagebox.showerror("错误", f"masks 读取失败: {e}")
+            return
+
+        self.tile_proposals = [[tuple(box), True] for box in kept.tolist()]
+        self.draw_tile_proposals()
+        self.approve_tiles_btn.config(state=tk.NORMAL if self.tile_proposals else tk.DISABLED)
+        self.status_label.config(text=f"建议 {len(kept)}/{len(boxes)} 块（Shift+单击取消某块，Esc 放弃）")
+
+    def draw_tile_proposals(self):
+        self.canvas.delete("tile_proposal")
+        s = self.scale_ratio
+        for (x1, y1, x2, y2), active in self.tile_proposals:
+            self.canvas.create_rectangle(
+                x1 * s, y1 * s, x2 * s, y2 * s,
+                outline="#0066ff" if active else "#999999", dash=(4, 4) if active else (2, 6),
+                width=2, tags="tile_proposal"
+            )
+
+    def on_toggle_tile(self, event):
+        """Shift+单击：切换鼠标下最上面（最后一个）建议块的保留状态"""
+        x = self.canvas.canvasx(event.x) / self.scale_ratio
+        y = self.canvas.canvasy(event.y) / self.scale_ratio
+        for item in reversed(self.tile_proposals):
+            x1, y1, x2, y2 = item[0]
+            if x1 <= x < x2 and y1 <= y < y2:
+                item[1] = not item[1]
+                self.draw_tile_proposals()
+                break
+
+    def approve_tiles(self):
+        """保存所有保留的建议块（与手动裁剪相同的命名、日志和参考图联动）
+
+        写入队列放不下时分批保存：等队列腾出空位再继续，界面不等待；保存完之前不能切换图片。
+        """
+        if self.tile_queue:  # 上一批还没保存完
+            return
+        self.tile_queue = [box for box, active in self.tile_proposals if active]
+        self.tile_total = len(self.tile_queue)
+        self.cancel_tiles()
+        self.save_tile_batch()
+
+    def save_tile_batch(self, schedule=True):
+        self.tile_after_id = None
+        while self.tile_queue and self.writer.has_room(SAVE_JOBS_PER_CROP):
+            self.save_crop(self.tile_queue.pop(0))
+        if not self.tile_queue:
+            self.status_label.config(text=f"已保存 {self.tile_total} 块")
+        elif schedule:
+            done = self.tile_total - len(self.tile_queue)
+            self.status_label.config(text=f"正在保存分块 {done}/{self.tile_total}（等待写入队列）...")
+            self.tile_after_id = self.root.after(WRITE_STATUS_POLL_MS, self.save_tile_batch)
+
+    def writer_has_room(self):
+        """写入队列放不下一次裁剪时提示并返回 False：不阻塞界面，稍后再按一次即可"""
+        if self.tile_queue:
+            self.status_label.config(text="正在分批保存分块，请稍候")
+            return False
+        if self.writer.has_room(SAVE_JOBS_PER_CROP):
+            return True
+        self.status_label.config(text="写入队列已满，本次未保存，请稍候再裁剪")
+        return False
+
+    def saving_tiles(self):
+        """分块还在分批保存时不能切换图片或文件夹（save_crop 按当前图片裁剪）"""
+        if self.tile_queue:
+            self.status_label.config(text="正在分批保存分块，保存完后再切换图片")
+            return True
+        return False
+
+    def finish_tiles(self):
+        """退出前把还没放入写入队列的分块保存完（此时可以等待）"""
+        if self.tile_after_id is not None:
+            self.root.after_cancel(self.tile_after_id)
+        while self.tile_queue:
+            self.writer.flush()
+            self.save_tile_batch(schedule=False)
+
+    def cancel_tiles(self):
+        self.tile_proposals = []
+        self.canvas.delete("tile_proposal")
+        self.approve_tiles_btn.config(state=tk.DISABLED)
+
+    def poll_write_status(self):
+        """定时刷新写入队列状态，有失败时标红"""
+        pending, failed = self.writer.status()
+        color = "red" if failed else ("#cc6600" if pending else "gray")
+        self.write_status_label.config(text=self.writer.status_text(), fg=color)
+        for path, msg in self.writer.pop_errors():
+            self.status_label.config(text=f"保存失败: {os.path.basename(path)} ({msg})")
+        self.root.after(WRITE_STATUS_POLL_MS, self.poll_write_status)
 
     def get_crop_filename(self, idx):
-        base, ext = os.path.splitext(os.path.basename(self.image_files[self.current_index]))
-        return f"{base}_cut_{idx}{ext}"
+        return crop_filename(self.image_files[self.current_index], idx)
 
     # === 导航 ===
     def prev_image(self):
@@ -456,34 +796,119 @@ class ImageCutter:
             self.show_current_image()
 
     def next_image(self):
+        if self.saving_tiles(): return
         if self.current_index < len(self.image_files) - 1:
             self.current_index += 1
             self.reset_per_image_state()
             self.show_current_image()
 
+    def jump_to(self, index):
+        """从缩略图总览跳转到第 index 张"""
+        if self.saving_tiles(): return
+        if 0 <= index < len(self.image_files) and index != self.current_index:
+            self.current_index = index
+            self.reset_per_image_state()
+            self.show_current_image()
+
+    def prefetch_neighbors(self, view_size):
+        """后台解码当前图片前后各 PREFETCH_AHEAD 张（先近后远）"""
+        paths = []
+        for step in range(1, PREFETCH_AHEAD + 1):
+            for idx in (self.current_index + step, self.current_index - step):
+                if 0 <= idx < len(self.image_files):
+                    paths.append(self.image_files[idx])
+        self.prefetcher.prefetch(paths, view_size)
+
     def reset_per_image_state(self):
-        self.crop_count = 0
-        self.cropped_regions = []
+        # 已裁剪区域和序号由 show_current_image 从裁剪日志恢复
         self.zoom_factor = 1.0  # 也可以选择不重置
 
     # === 辅助 ===
     def on_window_resize(self, event):
         if event.widget == self.root and self.original_image:
-            self.show_current_image()
+            # 拖动窗口时 <Configure> 每秒触发几十次，合并为停止变化后的一次重绘
+            self.resize_debouncer.trigger()
+
+    def rerender_after_resize(self):
+        """先用快速滤波重绘视口，稍后再补一次高质量重采样"""
+        old_scale = self.scale_ratio
+        self.update_scale(render=False)
+        if abs(self.scale_ratio - old_scale) < 1e-9:
+            self.renderer.render()  # 仅位置/视口变化：补画新露出的瓦片
+            return
+
+        self.renderer.render(fast=True)
+        self.redraw_overlays()
+        self.refine_debouncer.trigger()
 
     def on_mouse_wheel(self, event):
+        if not self.original_image: return
         if event.delta > 0:
-            self.zoom_factor += 0.1
+            new_zoom = self.zoom_factor + 0.1
         else:
-            self.zoom_factor = max(0.1, self.zoom_factor - 0.1)
-        self.show_current_image()
+            new_zoom = max(0.1, self.zoom_factor - 0.1)
+        self.zoom_at(new_zoom, event.x, event.y)
+
+    def zoom_at(self, new_zoom, ex, ey):
+        """以鼠标位置为中心缩放：只重采样视口内的瓦片，标注按新比例重画"""
+        # 鼠标下方对应的原图坐标
+        old_scale = self.scale_ratio
+        ox = self.canvas.canvasx(ex) / old_scale
+        oy = self.canvas.canvasy(ey) / old_scale
+
+        self.zoom_factor = new_zoom
+        self.update_scale(render=False)
+
+        # 滚动画布，使该原图坐标仍位于鼠标下方
+        w, h = self.renderer.display_size
+        self.canvas.xview_moveto(max(ox * self.scale_ratio - ex, 0) / max(w, 1))
+        self.canvas.yview_moveto(max(oy * self.scale_ratio - ey, 0) / max(h, 1))
+
+        self.renderer.render()
+        self.redraw_overlays()
 
     def on_pan_start(self, event):
         self.pan_start_x = event.x
         self.pan_start_y = event.y
+        self.canvas.scan_mark(event.x, event.y)
+
+    def on_pan_move(self, event):
+        """右键拖动平移：画布整体移动，只补画新露出的瓦片"""
+        self.canvas.scan_dragto(event.x, event.y, gain=1)
+        self.renderer.render()
 
-    def on_pan_move(self, event):  # 未实现完全平移，仅预留
-        pass
+    def on_close(self):
+        self.resize_debouncer.cancel()
+        self.refine_debouncer.cancel()
+        self.finish_tiles()
+        # 退出前把队列里的裁剪图写完
+        pending, _ = self.writer.status()
+        if pending:
+            self.write_status_label.config(text=f"正在保存剩余 {pending} 张...", fg="#cc6600")
+            self.root.update_idletasks()
+        self.writer.close()
+        self.report_stats()
+        if self.journal:
+            self.journal.close()
+        self.prefetcher.shutdown()
+        if self.filmstrip:
+            self.filmstrip.on_close()
+        if self.ref_window:
+            self.ref_window.on_close()
+        self.root.destroy()
+
+    def report_stats(self):
+        """退出时打印解码/缩放/绘制/保存耗时汇总，并写入当前文件夹的 cutoff 目录"""
+        if not self.stats.samples:
+            return
+        print(self.stats.format_summary())
+        if STATS_REPORT_NAME and self.journal:
+            name = STATS_REPORT_NAME.format(time=time.strftime("%Y%m%d_%H%M%S"))
+            path = os.path.join(os.path.dirname(self.journal.path), name)
+            try:
+                self.stats.write_report(path)
+            except OSError as e:
+                print(f"计时报告写入失败: {e}")
 
 
 if __name__ == "__main__":